@@ -8,8 +8,6 @@ import sys
 
 from optparse import OptionParser
 
-from ingest.exporter.ingestexportservice import IngestExporter
-
 if __name__ == '__main__':
     format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     logging.basicConfig(format=format, stream=sys.stdout, level=logging.INFO)
@@ -28,6 +26,17 @@ if __name__ == '__main__':
     parser.add_option("-s", "--staging", help="the URL to the staging API")
     parser.add_option("-d", "--dss", help="the URL to the datastore service")
     parser.add_option("-l", "--log", help="the logging level", default='INFO')
+    parser.add_option("-L", "--ledger", help="directory of the export ledgers, to resume or repeat an export "
+                                             "without putting the files that are already in the datastore again")
+    parser.add_option("-c", "--compact-json", dest="compact_json", action="store_true", default=False,
+                      help="stage metadata as compact JSON using the fastest JSON encoder installed")
+    parser.add_option("-z", "--gzip", action="store_true", default=False,
+                      help="gzip the metadata sent to the staging area")
+    parser.add_option("-w", "--workers", type="int",
+                      help="the number of workers of each export stage: staging, putting in and verifying in DSS")
+    parser.add_option("-r", "--report", help="directory to write a JSON report of the timings of each exported bundle")
+    parser.add_option("-P", "--profile", choices=["cprofile", "pyinstrument"],
+                      help="profile the export with cprofile or pyinstrument, next to the report")
 
     (options, args) = parser.parse_args()
 
@@ -44,5 +53,8 @@ if __name__ == '__main__':
         print ("You must the url of Ingest API.")
         exit(2)
 
+    # imported once the options are valid, so that usage errors are reported without loading the exporter
+    from ingest.exporter.ingestexportservice import IngestExporter
+
     exporter = IngestExporter(options)
     exporter.export_bundle(options.submissionEnvelopeUuid, options.processUuid)
@@ -0,0 +1,42 @@
+"""
+Process-wide registry of API clients. Clients are created on first use and shared by base URL, so that a
+long-lived worker discovers the ingest root, creates the DSS client and opens its connection pools once.
+Shared clients are used from many threads; don't set per-caller state on them. A shared IngestApi refuses
+set_token: use IngestApi.with_token to get a client of your own that still shares the session and caches.
+"""
+import threading
+
+import ingest.api.dssapi as dssapi
+import ingest.api.ingestapi as ingestapi
+import ingest.api.stagingapi as stagingapi
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def _get_client(client_class, url):
+    key = (client_class, url)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            # created under the lock so that concurrent callers don't each do the setup
+            client = _clients[key] = client_class(url)
+            client.shared = True
+        return client
+
+
+def get_ingest_api(url=None):
+    return _get_client(ingestapi.IngestApi, url)
+
+
+def get_staging_api(url=None):
+    return _get_client(stagingapi.StagingApi, url)
+
+
+def get_dss_api(url=None):
+    return _get_client(dssapi.DssApi, url)
+
+
+def clear():
+    with _lock:
+        _clients.clear()
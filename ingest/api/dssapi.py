@@ -3,20 +3,68 @@
 Description goes here
 """
 import datetime
-import hca
 import json
 import logging
 import os
-import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
+import requests
+
+from ingest.api import flowcontrol
+from ingest.api.flowcontrol import DSS_BACKEND
+from ingest.api.httpsession import new_session
+from ingest.api.retrypolicy import RetryPolicy, status_code_of
+from ingest.utils.metrics import Metrics
 
 __author__ = "jupp"
 __license__ = "Apache 2.0"
 __date__ = "12/09/2017"
 
+DEFAULT_RETRY_POLICY = RetryPolicy(max_attempts=20, base_delay=1.0, max_delay=60.0, deadline=30 * 60)
+DEFAULT_MAX_WORKERS = 8
+REPLICA = 'aws'
+VERSION_FORMAT = "%Y-%m-%dT%H%M%S.%fZ"
+
+# the scope of the service account tokens that DSS accepts on its write endpoints, as used by hca.dss.DSSClient
+DSS_AUTH_SCOPES = ['https://www.googleapis.com/auth/userinfo.email']
+
+
+def new_version():
+    return datetime.datetime.utcnow().strftime(VERSION_FORMAT)
+
+
+class ServiceAccountAuth(requests.auth.AuthBase):
+
+    """
+    Adds the bearer token of a Google service account to a request, refreshing it when it has expired.
+    The credentials are read from credentials_file, a service account key, unless they are given.
+    """
+
+    def __init__(self, credentials_file=None, credentials=None):
+        if credentials is None:
+            # google-auth is only imported when DSS writes are authenticated
+            from google.oauth2 import service_account
+            credentials = service_account.Credentials.from_service_account_file(credentials_file,
+                                                                                scopes=DSS_AUTH_SCOPES)
+        self.credentials = credentials
+        self._lock = threading.Lock()
+
+    def token(self):
+        with self._lock:
+            if not self.credentials.valid:
+                from google.auth.transport.requests import Request
+                self.credentials.refresh(Request())
+            return self.credentials.token
+
+    def __call__(self, request):
+        request.headers['Authorization'] = f'Bearer {self.token()}'
+        return request
+
 
 class DssApi:
-    def __init__(self, url=None):
+    def __init__(self, url=None, retry_policy=DEFAULT_RETRY_POLICY, flow_control=None, session=None, metrics=None,
+                 auth=None):
         format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
         logging.basicConfig(format=format)
         logging.getLogger("requests").setLevel(logging.WARNING)
@@ -31,21 +79,26 @@ class DssApi:
 
         self.headers = {'Content-type': 'application/json'}
 
-        self.hca_client = hca.dss.DSSClient()
-        self.hca_client.host = self.url + "/v1"
+        self.session = session if session else new_session()
+        self.api_url = self.url + "/v1"
         self.creator_uid = 8008
-
-    def put_file(self, bundle_uuid, file):
+        self.retry_policy = retry_policy
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.flow_control = flow_control if flow_control else \
+            flowcontrol.for_backend(DSS_BACKEND, self.url, self.metrics)
+
+        self.auth = auth
+        if self.auth is None and os.environ.get('GOOGLE_APPLICATION_CREDENTIALS'):
+            self.auth = ServiceAccountAuth(os.environ['GOOGLE_APPLICATION_CREDENTIALS'])
+        if self.auth is None:
+            self.logger.warning('No GOOGLE_APPLICATION_CREDENTIALS, DSS writes will not be authenticated.')
+
+    def put_file(self, bundle_uuid, file, version=None):
         url = file["url"]
         uuid = file["dss_uuid"]
 
-        now = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H%M%S.%fZ")
-        version = file["update_date"] if "update_date" in file and file["update_date"] else now
-
-        # retrying file creation 20 times
-        max_retries = 20
-        tries = 0
-        file_create_complete = False
+        if not version:
+            version = file["update_date"] if "update_date" in file and file["update_date"] else new_version()
 
         params = {
             'uuid': uuid,
@@ -55,94 +108,108 @@ class DssApi:
             'source_url': url
         }
 
-        while not file_create_complete and tries < max_retries:
-            try:
-                tries += 1
-                self.logger.info(f'Creating file {file["name"]} in DSS {uuid}:{version} with params: {json.dumps(params)}')
-                bundle_file = self.hca_client.put_file(
-                    uuid=uuid,
-                    version=version,
-                    bundle_uuid=bundle_uuid,
-                    creator_uid=self.creator_uid,
-                    source_url=url
-                )
-                self.logger.info('Created!')
-                file_create_complete = True
-                return bundle_file
-            except Exception as e:
-                self.logger.error(
-                    'Attempt {0} out of {1}: Error in hca_client.put_file method call with params:{2} due to {3}'.format(
-                        str(tries),
-                        str(max_retries),
-                        json.dumps(params),
-                        str(e))
-                )
-
-                if not tries < max_retries:
-                    raise Error(e)
-                else:
-                    time.sleep(60)
-
-    def put_bundle(self, bundle_uuid, bundle_files):
-        bundle = None
+        self.logger.info(f'Creating file {file["name"]} in DSS {uuid}:{version} with params: {json.dumps(params)}')
+        try:
+            bundle_file = self.retry_policy.call(self._send, 'put_file', self._put_file, uuid, version, {
+                'bundle_uuid': bundle_uuid,
+                'creator_uid': self.creator_uid,
+                'source_url': url
+            })
+        except Exception as e:
+            self.logger.error(f'Error in PUT file with params:{json.dumps(params)} due to {str(e)}')
+            raise Error(e)
+
+        self.logger.info('Created!')
+        return bundle_file
+
+    def _put_file(self, uuid, version, file_request):
+        r = self.session.put(f'{self.api_url}/files/{uuid}', params={'version': version}, json=file_request,
+                             headers=self.headers, auth=self.auth)
+        r.raise_for_status()
+        return r.json()
 
+    def put_bundle(self, bundle_uuid, bundle_files, version=None):
         # Generate version client-side for idempotent PUT /bundle
-        version = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H%M%S.%fZ")
+        version = version if version else new_version()
+
+        self.logger.info(f'Creating bundle in DSS {bundle_uuid}:{version}')
+        try:
+            bundle = self.retry_policy.call(self._send, 'put_bundle', self._put_bundle, bundle_uuid, version, {
+                'files': bundle_files,
+                'creator_uid': self.creator_uid
+            })
+        except Exception as e:
+            params = {
+                'uuid': bundle_uuid,
+                'version': version,
+                'replica': REPLICA,
+                'files': bundle_files,
+                'creator_uid': self.creator_uid
+            }
+            self.logger.error(f'Error in PUT bundle with params:{json.dumps(params)} due to {str(e)}')
+            raise Error(e)
 
-        # retrying file creation 20 times
-        max_retries = 20
-        tries = 0
-        bundle_create_complete = False
+        self.logger.info('Created!')
+        return bundle
 
-        # finally create the bundle
-        while not bundle_create_complete and tries < max_retries:
-            try:
-                tries += 1
-                self.logger.info(f'Creating bundle in DSS {bundle_uuid}:{version}')
-                bundle = self.hca_client.put_bundle(
-                    uuid=bundle_uuid,
-                    version=version,
-                    replica="aws",
-                    files=bundle_files,
-                    creator_uid=self.creator_uid
-                )
-                self.logger.info('Created!')
-                bundle_create_complete = True
-                return bundle
-            except Exception as e:
-                params = {
-                    'uuid': bundle_uuid,
-                    'version': version,
-                    'replica': "aws",
-                    'files': bundle_files,
-                    'creator_uid': self.creator_uid
-                }
-                self.logger.error(
-                    'Attempt {0} out of {1}: Error in hca_client.put_bundle method call with params:{2} due to {3}'.format(
-                        str(tries),
-                        str(max_retries),
-                        json.dumps(params),
-                        str(e))
-                )
-                if not tries < max_retries:
-                    raise Error(e)
-                else:
-                    time.sleep(60)
+    def _put_bundle(self, uuid, version, bundle_request):
+        r = self.session.put(f'{self.api_url}/bundles/{uuid}', params={'version': version, 'replica': REPLICA},
+                             json=bundle_request, headers=self.headers, auth=self.auth)
+        r.raise_for_status()
+        return r.json()
 
     def head_file(self, file_uuid, version=None):
-        # finally create the bundle
+        params = {'replica': REPLICA}
+        if version:
+            params['version'] = version
         try:
-            return self.hca_client.head_file(
-                uuid=file_uuid,
-                version=version,
-                replica="aws"
-            )
+            return self.retry_policy.call(self._send, 'head_file', self._head_file, file_uuid, params)
         except Exception as e:
-            raise Error(e)
+            if status_code_of(e) == requests.codes.not_found:
+                raise DssFileNotFoundError(e) from e
+            raise Error(e) from e
+
+    def _head_file(self, file_uuid, params):
+        r = self.session.head(f'{self.api_url}/files/{file_uuid}', params=params)
+        r.raise_for_status()
+        return r
+
+    def is_transient_error(self, error):
+        """
+        Whether an error raised by this API, once its retries are used up, may still go away later: a
+        retryable status or transport error, or a request refused by an open circuit.
+        """
+        cause = error.__cause__ if isinstance(error, Error) and error.__cause__ is not None else error
+        return isinstance(cause, flowcontrol.CircuitOpenError) or self.retry_policy.is_retryable_error(cause)
+
+    def _send(self, endpoint, func, *args, **kwargs):
+        with self.metrics.time_request(endpoint):
+            return self.flow_control.call(func, *args, endpoint=endpoint, **kwargs)
+
+    def head_files(self, files, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        HEADs many files concurrently. files are (file uuid, version) pairs, version may be None for the
+        latest. Returns the responses in the same order, with None for the files that are not found. Any
+        other error is raised.
+        """
+        def head(file):
+            file_uuid, version = file
+            try:
+                return self.head_file(file_uuid, version=version)
+            except DssFileNotFoundError:
+                self.logger.debug(f'File {file_uuid}/{version} is not in DSS.')
+                return None
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(head, files))
 
 
 # Module Exceptions
 
 
 class Error(Exception):
-    """Base-class for all exceptions raised by this module."""
\ No newline at end of file
+    """Base-class for all exceptions raised by this module."""
+
+
+class DssFileNotFoundError(Error):
+    """The file or the version of the file is not in DSS."""
@@ -0,0 +1,239 @@
+import logging
+import threading
+import time
+import weakref
+
+import requests
+
+from ingest.api.retrypolicy import status_code_of
+from ingest.utils.metrics import Metrics, CONCURRENCY_LIMIT, REQUESTS_IN_FLIGHT, CIRCUIT_OPEN, CIRCUIT_REJECTIONS
+
+INGEST_BACKEND = 'ingest'
+DSS_BACKEND = 'dss'
+STAGING_BACKEND = 'staging'
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# a 500 is not an overload: ingest answers 500 to some requests it rejects, like creating a file that exists
+OVERLOAD_STATUS_CODES = frozenset([
+    requests.codes.too_many_requests,
+    requests.codes.bad_gateway,
+    requests.codes.service_unavailable,
+    requests.codes.gateway_timeout
+])
+
+OVERLOAD_EXCEPTIONS = (requests.ConnectionError, requests.Timeout)
+
+
+class AdaptiveConcurrencyLimiter:
+
+    """
+    Limits the requests in flight to a backend, adapting the limit AIMD style: every successful request
+    raises it by 1 / limit, so roughly by one per round of requests, and an overloaded response or a
+    latency spike multiplies it by decrease_factor. A latency spike is a request taking longer than
+    latency_tolerance times the moving average of the latency of its endpoint, as a slow endpoint would
+    otherwise look like a spike next to the fast ones. Requests that were sent before the last
+    decrease don't decrease the limit again, so a burst of failures from one round halves it only once.
+    """
+
+    def __init__(self, initial_limit=8, min_limit=1, max_limit=64, decrease_factor=0.5, latency_tolerance=3.0,
+                 latency_smoothing=0.1, clock=time.monotonic):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.latency_smoothing = latency_smoothing
+        self.clock = clock
+        self.in_flight = 0
+        self.mean_latencies = {}
+        self._last_decrease_at = None
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+            return self.clock()
+
+    def release(self, started_at, overloaded=False, endpoint=None):
+        with self._condition:
+            self.in_flight -= 1
+            latency = self.clock() - started_at
+            if overloaded or self._is_latency_spike(endpoint, latency):
+                self._decrease(started_at)
+            else:
+                self.limit = min(self.limit + 1 / self.limit, self.max_limit)
+                self._update_mean_latency(endpoint, latency)
+            self._condition.notify_all()
+
+    def _is_latency_spike(self, endpoint, latency):
+        mean_latency = self.mean_latencies.get(endpoint)
+        return mean_latency is not None and latency > self.latency_tolerance * mean_latency
+
+    def _update_mean_latency(self, endpoint, latency):
+        mean_latency = self.mean_latencies.get(endpoint)
+        if mean_latency is None:
+            self.mean_latencies[endpoint] = latency
+        else:
+            self.mean_latencies[endpoint] = mean_latency + self.latency_smoothing * (latency - mean_latency)
+
+    def _decrease(self, started_at):
+        if self._last_decrease_at is not None and started_at < self._last_decrease_at:
+            return
+        self.limit = max(self.limit * self.decrease_factor, self.min_limit)
+        self._last_decrease_at = self.clock()
+
+
+class CircuitBreaker:
+
+    """
+    Stops calls to a backend after failure_threshold consecutive failures. Once open, calls are rejected
+    until reset_timeout seconds have passed; then a single trial call is let through, closing the circuit
+    if it succeeds and opening it again if it fails.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN:
+                if self._trial_running:
+                    return False
+                self._trial_running = True
+            return self.state != OPEN
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self._opened_at = self.clock()
+
+
+class FlowControl:
+
+    """
+    Guards the calls to one backend with an AdaptiveConcurrencyLimiter and a CircuitBreaker. A call is
+    taken to have overloaded the backend when it raises a connection error or a timeout, or when it
+    returns a response or raises an error with one of OVERLOAD_STATUS_CODES. Latency spikes are judged per
+    endpoint, the name a call is given with endpoint, like the endpoint label of the request metrics. The
+    current limit,
+    the requests in flight and the state of the circuit are kept as gauges labelled with the backend, in
+    its own metrics and in those of every client that added its metrics with add_metrics.
+    """
+
+    def __init__(self, backend, limiter=None, circuit_breaker=None, metrics=None):
+        self.backend = backend
+        self.limiter = limiter if limiter else AdaptiveConcurrencyLimiter()
+        self.circuit_breaker = circuit_breaker if circuit_breaker else CircuitBreaker()
+        self.metrics = metrics if metrics is not None else Metrics()
+        self._client_metrics = weakref.WeakSet()
+        self._metrics_lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def add_metrics(self, metrics):
+        """
+        Also reports to the metrics of a client of the backend, for as long as the client keeps them.
+        """
+        if metrics is self.metrics:
+            return
+        with self._metrics_lock:
+            self._client_metrics.add(metrics)
+
+    def _all_metrics(self):
+        with self._metrics_lock:
+            return [self.metrics] + list(self._client_metrics)
+
+    def call(self, func, *args, endpoint=None, **kwargs):
+        if not self.circuit_breaker.allow():
+            for metrics in self._all_metrics():
+                metrics.increment(CIRCUIT_REJECTIONS, backend=self.backend)
+            raise CircuitOpenError(f'The circuit to {self.backend} is open, not sending the request.')
+
+        started_at = self.limiter.acquire()
+        self._update_gauges()
+        overloaded = True
+        try:
+            response = func(*args, **kwargs)
+            overloaded = self.is_overload_response(response)
+            return response
+        except Exception as e:
+            overloaded = self.is_overload_error(e)
+            raise
+        finally:
+            self.limiter.release(started_at, overloaded=overloaded, endpoint=endpoint)
+            if overloaded:
+                self.circuit_breaker.record_failure()
+            else:
+                self.circuit_breaker.record_success()
+            self._update_gauges()
+
+    @staticmethod
+    def is_overload_response(response):
+        status_code = getattr(response, 'status_code', None)
+        return isinstance(status_code, int) and status_code in OVERLOAD_STATUS_CODES
+
+    @staticmethod
+    def is_overload_error(error):
+        return isinstance(error, OVERLOAD_EXCEPTIONS) or status_code_of(error) in OVERLOAD_STATUS_CODES
+
+    def _update_gauges(self):
+        limit = int(self.limiter.limit)
+        in_flight = self.limiter.in_flight
+        circuit_open = int(self.circuit_breaker.state != CLOSED)
+        for metrics in self._all_metrics():
+            metrics.set_gauge(CONCURRENCY_LIMIT, limit, backend=self.backend)
+            metrics.set_gauge(REQUESTS_IN_FLIGHT, in_flight, backend=self.backend)
+            metrics.set_gauge(CIRCUIT_OPEN, circuit_open, backend=self.backend)
+
+
+_flow_controls = {}
+_flow_controls_lock = threading.Lock()
+
+
+def for_backend(backend, base_url, metrics=None):
+    """
+    Returns the FlowControl shared by all the clients of the backend at base_url in this process, so that
+    their requests count against one limit, as ingest.api.clients shares the clients by URL. It keeps its
+    own metrics and also reports to the given metrics.
+    """
+    key = (backend, base_url)
+    with _flow_controls_lock:
+        flow_control = _flow_controls.get(key)
+        if flow_control is None:
+            flow_control = _flow_controls[key] = FlowControl(backend)
+    if metrics is not None:
+        flow_control.add_metrics(metrics)
+    return flow_control
+
+
+# Module Exceptions
+
+
+class Error(Exception):
+    """Base-class for all exceptions raised by this module."""
+
+
+class CircuitOpenError(Error):
+    """The circuit to the backend is open."""
@@ -0,0 +1,17 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+# enough connections per host for the worker pools of the importer and exporter
+DEFAULT_POOL_SIZE = 32
+
+
+def new_session(pool_size=DEFAULT_POOL_SIZE):
+    """
+    Returns a session that keeps up to pool_size connections per host alive for reuse. The session can
+    be shared by threads.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
@@ -2,20 +2,35 @@
 """
 desc goes here
 """
+import copy
 import json
 import logging
 import os
 import requests
-import time
 import uuid
 
 
-from requests import HTTPError
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin, quote
 
+from ingest.api import flowcontrol
+from ingest.api.flowcontrol import INGEST_BACKEND
+from ingest.api.httpsession import new_session
+from ingest.api.retrypolicy import RetryPolicy
+from ingest.utils import serialization
+from ingest.utils.metrics import Metrics, HTTP_RETRIES
+
+# bulk creation POSTs a JSON array of documents to the entity collection of a submission with this suffix
+BULK_CREATE_PATH = '/bulk'
+BULK_CREATE_UNSUPPORTED_STATUS_CODES = [requests.codes.not_found, requests.codes.method_not_allowed,
+                                        requests.codes.not_implemented]
+DEFAULT_BULK_CHUNK_SIZE = 100
+DEFAULT_MAX_WORKERS = 8
+
 
 class IngestApi:
-    def __init__(self, url=None, ingest_api_root=None):
+    def __init__(self, url=None, ingest_api_root=None, metrics=None, retry_policy=None, flow_control=None,
+                 session=None):
         format = '[%(filename)s:%(lineno)s - %(funcName)20s() ] %(asctime)s - %(name)s - %(levelname)s - %(message)s'
         logging.basicConfig(format=format)
         logging.getLogger("requests").setLevel(logging.WARNING)
@@ -29,23 +44,47 @@ class IngestApi:
         self.url = url if url else "http://localhost:8080"
 
         self.headers = {'Content-type': 'application/json'}
+        self.session = session if session else new_session()
         self.submission_links = {}
+        self.links_by_url = {}
+        self.bulk_create_supported = {}
         self.token = None
+        # set on the clients of ingest.api.clients, which every caller in the process shares
+        self.shared = False
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.flow_control = flow_control if flow_control else \
+            flowcontrol.for_backend(INGEST_BACKEND, self.url, self.metrics)
         self.ingest_api_root = ingest_api_root if ingest_api_root is not None else self.get_root_url()
 
     def set_token(self, token):
+        if self.shared:
+            raise Error('A shared IngestApi can\'t hold a token, use with_token to get a client of its own.')
         self.token = token
 
+    def with_token(self, token):
+        """
+        Returns a client that sends the token, sharing the session, caches and flow control of this one.
+        """
+        client = copy.copy(self)
+        client.shared = False
+        client.token = token
+        return client
+
     def get_root_url(self):
-        reply = requests.get(self.url, headers=self.headers)
+        reply = self.session.get(self.url, headers=self.headers)
         return reply.json()["_links"]
 
     def _get_url_for_link(self, url, link_name):
-        r = requests.get(url, headers=self.headers)
-        if r.status_code == requests.codes.ok:
-            links = json.loads(r.text)["_links"]
-            if link_name in links:
-                return links[link_name]["href"]
+        # the links of search and root resources don't change, so they are fetched once per url
+        links = self.links_by_url.get(url)
+        if links is None:
+            r = self.session.get(url, headers=self.headers)
+            if r.status_code != requests.codes.ok:
+                return None
+            links = self.links_by_url[url] = json.loads(r.text)["_links"]
+        if link_name in links:
+            return links[link_name]["href"]
 
     def get_schemas(self, latest_only=True, high_level_entity=None, domain_entity=None, concrete_entity=None):
         schema_url = self.get_schemas_url()
@@ -54,7 +93,7 @@ class IngestApi:
 
         if latest_only:
             search_url = self._get_url_for_link(schema_url, "search")
-            r = requests.get(search_url, headers=self.headers)
+            r = self.session.get(search_url, headers=self.headers)
             if r.status_code == requests.codes.ok:
                 response_j = json.loads(r.text)
                 all_schemas = list(self.getRelatedEntities("latestSchemas", response_j, "schemas"))
@@ -79,7 +118,7 @@ class IngestApi:
 
     def getSubmissions(self):
         params = {'sort': 'submissionDate,desc'}
-        r = requests.get(self.ingest_api_root["submissionEnvelopes"]["href"].rsplit("{")[0], params=params,
+        r = self.session.get(self.ingest_api_root["submissionEnvelopes"]["href"].rsplit("{")[0], params=params,
                          headers=self.headers)
         if r.status_code == requests.codes.ok:
             return json.loads(r.text)["_embedded"]["submissionEnvelopes"]
@@ -92,7 +131,7 @@ class IngestApi:
             headers = {'If-Modified-Since': datetimeUTC}
 
         self.logger.info('headers:' + str(headers))
-        r = requests.get(submissionUrl, headers=headers)
+        r = self.session.get(submissionUrl, headers=headers)
 
         if r.status_code == requests.codes.ok:
             submission = json.loads(r.text)
@@ -102,7 +141,7 @@ class IngestApi:
 
     def getProjects(self, id):
         submissionUrl = self.url + '/submissionEnvelopes/' + id + '/projects'
-        r = requests.get(submissionUrl, headers=self.headers)
+        r = self.session.get(submissionUrl, headers=self.headers)
         projects = []
         if r.status_code == requests.codes.ok:
             projects = json.loads(r.text)
@@ -110,7 +149,7 @@ class IngestApi:
 
     def getProjectById(self, id):
         submissionUrl = self.url + '/projects/' + id
-        r = requests.get(submissionUrl, headers=self.headers)
+        r = self.session.get(submissionUrl, headers=self.headers)
         if r.status_code == requests.codes.ok:
             project = json.loads(r.text)
             return project
@@ -127,20 +166,42 @@ class IngestApi:
         if entity_type == 'submissionEnvelopes':
             url = self.url + f'/{entity_type}/search/findByUuidUuid?uuid=' + uuid
 
-        r = requests.get(url, headers=self.headers)
+        r = self._send('getEntityByUuid', self.session.get, url, headers=self.headers)
         r.raise_for_status()
         return r.json()
 
+    def getEntitiesByUuid(self, entity_type, uuids, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        Look up many entities of the same type concurrently. Returns a dict of the entities found by uuid;
+        uuids that could not be retrieved are logged and left out.
+        """
+        unique_uuids = list(dict.fromkeys(uuids))
+        entities_by_uuid = {}
+
+        def get_entity(uuid):
+            try:
+                return uuid, self.getEntityByUuid(entity_type, uuid)
+            except Exception as e:
+                self.logger.warning(f'Could not retrieve {entity_type} with uuid {uuid}: {str(e)}')
+                return uuid, None
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for uuid, entity in executor.map(get_entity, unique_uuids):
+                if entity is not None:
+                    entities_by_uuid[uuid] = entity
+
+        return entities_by_uuid
+
     def getFileBySubmissionUrlAndFileName(self, submissionUrl, fileName):
         searchUrl = self._get_url_for_link(self.url + '/files/search', 'findBySubmissionEnvelopesInAndFileName')
         searchUrl = searchUrl.replace('{?submissionEnvelope,fileName}', '')
-        r = requests.get(searchUrl, params={'submissionEnvelope': submissionUrl, 'fileName': fileName})
+        r = self.session.get(searchUrl, params={'submissionEnvelope': submissionUrl, 'fileName': fileName})
         if r.status_code == requests.codes.ok:
             return r.json()
         return None
 
     def getSubmissionEnvelope(self, submissionUrl):
-        r = requests.get(submissionUrl, headers=self.headers)
+        r = self._send('getSubmissionEnvelope', self.session.get, submissionUrl, headers=self.headers)
         if r.status_code == requests.codes.ok:
             submissionEnvelope = json.loads(r.text)
             return submissionEnvelope
@@ -150,7 +211,7 @@ class IngestApi:
     def getSubmissionByUuid(self, submissionUuid):
         searchByUuidLink = self._get_url_for_link(self.url + '/submissionEnvelopes/search', 'findByUuid')
         searchByUuidLink = searchByUuidLink.replace('{?uuid}', '')  # TODO: use a REST traverser instead of requests?
-        r = requests.get(searchByUuidLink, params={'uuid': submissionUuid})
+        r = self.session.get(searchByUuidLink, params={'uuid': submissionUuid})
 
         if 200 <= r.status_code < 300:
             return r.json()
@@ -159,7 +220,7 @@ class IngestApi:
 
     def getFiles(self, id):
         submissionUrl = self.url + '/submissionEnvelopes/' + id + '/files'
-        r = requests.get(submissionUrl, headers=self.headers)
+        r = self.session.get(submissionUrl, headers=self.headers)
         files = []
         if r.status_code == requests.codes.ok:
             files = json.loads(r.text)
@@ -167,7 +228,7 @@ class IngestApi:
 
     def getBundleManifests(self, id):
         submissionUrl = self.url + '/submissionEnvelopes/' + id + '/bundleManifests'
-        r = requests.get(submissionUrl, headers=self.headers)
+        r = self.session.get(submissionUrl, headers=self.headers)
         bundleManifests = []
 
         if r.status_code == requests.codes.ok:
@@ -181,7 +242,7 @@ class IngestApi:
         }
 
         try:
-            r = requests.post(self.ingest_api_root["submissionEnvelopes"]["href"].rsplit("{")[0], data="{}",
+            r = self.session.post(self.ingest_api_root["submissionEnvelopes"]["href"].rsplit("{")[0], data="{}",
                               headers=auth_headers)
             r.raise_for_status()
             submission = r.json()
@@ -194,7 +255,7 @@ class IngestApi:
 
     def get_submission_links(self, submission_url):
         if not self.submission_links.get(submission_url):
-            r = requests.get(submission_url, headers=self.headers)
+            r = self._send('getSubmissionLinks', self.session.get, submission_url, headers=self.headers)
             r.raise_for_status()
             self.submission_links[submission_url] = r.json()["_links"]
 
@@ -208,7 +269,7 @@ class IngestApi:
         return link
 
     def finishSubmission(self, submissionUrl):
-        r = requests.put(submissionUrl, headers=self.headers)
+        r = self.session.put(submissionUrl, headers=self.headers)
         if r.status_code == requests.codes.update:
             self.logger.info("Submission complete!")
             return r.text
@@ -217,13 +278,13 @@ class IngestApi:
         state_url = self.getSubmissionStateUrl(submissionId, state)
 
         if state_url:
-            r = requests.put(state_url, headers=self.headers)
+            r = self.session.put(state_url, headers=self.headers)
 
         return self.handleResponse(r)
 
     def getSubmissionStateUrl(self, submissionId, state):
         submissionUrl = self.getSubmissionUri(submissionId)
-        response = requests.get(submissionUrl, headers=self.headers)
+        response = self.session.get(submissionUrl, headers=self.headers)
         submission = self.handleResponse(response)
 
         if submission and state in submission['_links']:
@@ -245,7 +306,7 @@ class IngestApi:
         return urljoin(self.url, callback_link)
 
     def get_process(self, process_url):
-        r = requests.get(process_url, headers=self.headers)
+        r = self.session.get(process_url, headers=self.headers)
         r.raise_for_status()
         return r.json()
 
@@ -253,7 +314,7 @@ class IngestApi:
         return self.getEntities(submissionUrl, "analyses")
 
     def getEntities(self, submissionUrl, entityType, pageSize=None):
-        r = requests.get(submissionUrl, headers=self.headers)
+        r = self.session.get(submissionUrl, headers=self.headers)
         if r.status_code == requests.codes.ok:
             if entityType in json.loads(r.text)["_links"]:
                 if not pageSize:
@@ -266,7 +327,7 @@ class IngestApi:
         if pageSize:
             params = {"size": pageSize}
 
-        r = requests.get(url, headers=self.headers, params=params)
+        r = self.session.get(url, headers=self.headers, params=params)
         r.raise_for_status()
         if r.status_code == requests.codes.ok:
             if "_embedded" in json.loads(r.text):
@@ -284,7 +345,7 @@ class IngestApi:
                 yield entity
 
     def _updateStatusToPending(self, submissionUrl):
-        r = requests.patch(submissionUrl, data="{\"submissionStatus\" : \"Pending\"}", headers=self.headers)
+        r = self.session.patch(submissionUrl, data="{\"submissionStatus\" : \"Pending\"}", headers=self.headers)
 
     def createProject(self, submissionUrl, jsonObject):
         return self.createEntity(submissionUrl, jsonObject, "projects", self.token)
@@ -313,12 +374,14 @@ class IngestApi:
 
         fileSubmissionsUrl = fileSubmissionsUrl + "/" + quote(file_name)
 
+        newContent = serialization.to_dict(jsonObject)
         fileToCreateObject = {
             "fileName": file_name,
-            "content": json.loads(jsonObject)  # TODO jsonObject should be a dict()
+            "content": newContent
         }
 
-        r = requests.post(fileSubmissionsUrl, data=json.dumps(fileToCreateObject), headers=self.headers)
+        r = self._send('createFile', self.session.post, fileSubmissionsUrl,
+                       data=serialization.dumps(fileToCreateObject), headers=self.headers)
 
         # TODO Investigate why core is returning internal server error
         if r.status_code == requests.codes.conflict or r.status_code == requests.codes.internal_server_error:
@@ -327,7 +390,6 @@ class IngestApi:
             if searchFiles and searchFiles.get('_embedded') and searchFiles['_embedded'].get('files'):
                 fileInIngest = searchFiles['_embedded'].get('files')[0]
                 content = fileInIngest.get('content')
-                newContent = json.loads(jsonObject)
 
                 if content:
                     content.update(newContent)
@@ -335,7 +397,8 @@ class IngestApi:
                     content = newContent
 
                 fileUrl = fileInIngest['_links']['self']['href']
-                r = requests.patch(fileUrl, data=json.dumps({'content': content}), headers=self.headers)
+                r = self._send('updateFile', self.session.patch, fileUrl,
+                               data=serialization.dumps({'content': content}), headers=self.headers)
                 self.logger.debug(f'Updating existing content of file {fileUrl}.')
 
         r.raise_for_status()
@@ -349,10 +412,56 @@ class IngestApi:
         submissionUrl = self.get_link_in_submisssion(submissionUrl, entityType)
 
         self.logger.debug("posting " + submissionUrl)
-        r = requests.post(submissionUrl, data=jsonObject, headers=auth_headers)
+        r = self._send('createEntity', self.session.post, submissionUrl, data=serialization.to_payload(jsonObject),
+                       headers=auth_headers)
         r.raise_for_status()
         return r.json()
 
+    def createEntities(self, submissionUrl, entityType, documents, chunk_size=DEFAULT_BULK_CHUNK_SIZE,
+                       max_workers=DEFAULT_MAX_WORKERS):
+        """
+        Create many entities of the same type in a submission. Documents are sent in chunks to the bulk
+        endpoint of the entity collection; if ingest does not provide one, each document is POSTed on its
+        own, using up to max_workers requests at a time. Created entities are returned in document order.
+        """
+        entitiesUrl = self.get_link_in_submisssion(submissionUrl, entityType)
+        token = self.token if entityType == 'projects' else None
+        created_entities = []
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for start in range(0, len(documents), chunk_size):
+                chunk = documents[start:start + chunk_size]
+                created_chunk = None
+                if self.bulk_create_supported.get(entitiesUrl, True):
+                    created_chunk = self._post_entities(entitiesUrl, chunk, token)
+
+                if created_chunk is None:
+                    created_chunk = list(executor.map(
+                        lambda document: self.createEntity(submissionUrl, document, entityType, token),
+                        chunk))
+
+                created_entities.extend(created_chunk)
+
+        return created_entities
+
+    def _post_entities(self, entitiesUrl, documents, token=None):
+        auth_headers = {'Content-type': 'application/json',
+                        'Authorization': token
+                        }
+
+        self.logger.debug(f'posting {len(documents)} entities to {entitiesUrl}{BULK_CREATE_PATH}')
+        r = self._send('createEntities', self.session.post, entitiesUrl + BULK_CREATE_PATH,
+                       data=serialization.dumps(documents), headers=auth_headers)
+
+        if r.status_code in BULK_CREATE_UNSUPPORTED_STATUS_CODES:
+            self.logger.info(f'No bulk endpoint for {entitiesUrl}, creating entities one at a time.')
+            self.bulk_create_supported[entitiesUrl] = False
+            return None
+
+        r.raise_for_status()
+        self.bulk_create_supported[entitiesUrl] = True
+        return r.json()
+
     # given a HCA object return the URI for the object from ingest
     def getObjectId(self, entity):
         if "_links" in entity:
@@ -361,7 +470,7 @@ class IngestApi:
         raise ValueError('Can\'t get id for ' + json.dumps(entity) + ' is it a HCA entity?')
 
     def getObjectUuid(self, entityUri):
-        r = requests.get(entityUri,
+        r = self.session.get(entityUri,
                          headers=self.headers)
         if r.status_code == requests.codes.ok:
             return json.loads(r.text)["uuid"]["uuid"]
@@ -393,69 +502,61 @@ class IngestApi:
         fromUri = fromEntity["_links"][relationship]["href"]
         toUri = self.getObjectId(toEntity)
 
-        self._retry_when_http_error(0, self._post_link_entity, fromUri, toUri)
-
-    def _post_link_entity(self, fromUri, toUri):
-        self.logger.debug('fromUri ' + fromUri + ' toUri:' + toUri);
+        r = self._request_with_retries(self._post_link_entity, fromUri, toUri)
+        r.raise_for_status()
 
-        headers = {'Content-type': 'text/uri-list'}
+    def unlinkEntity(self, fromEntity, toEntity, relationship):
+        fromUri = fromEntity["_links"][relationship]["href"].rsplit("{")[0]
+        toId = self.getObjectId(toEntity).rstrip('/').rsplit('/', 1)[-1]
 
-        r = requests.post(fromUri.rsplit("{")[0],
-                          data=toUri.rsplit("{")[0], headers=headers)
+        self.logger.debug('deleting link ' + fromUri + '/' + toId)
+        r = self._send('unlinkEntity', self.session.delete, fromUri + '/' + toId, headers=self.headers)
+        r.raise_for_status()
 
-        return r
+    def patchEntity(self, entity, patch):
+        auth_headers = {'Content-type': 'application/json',
+                        'Authorization': self.token
+                        }
+        entityUrl = self.getObjectId(entity)
 
-    def _retry_when_http_error(self, tries, func, *args):
-        max_retries = 5
+        self.logger.debug("patching " + entityUrl)
+        r = self._send('patchEntity', self.session.patch, entityUrl, data=serialization.to_payload(patch), headers=auth_headers)
+        r.raise_for_status()
+        return r.json()
 
-        if tries < max_retries:
-            if tries > 1:
-                self.logger.info("no of tries: " + str(tries + 1))
+    def _post_link_entity(self, fromUri, toUri):
+        self.logger.debug('fromUri ' + fromUri + ' toUri:' + toUri);
 
-            r = None
-            
-            try:
-                r = func(*args)
-                r.raise_for_status()
+        headers = {'Content-type': 'text/uri-list'}
 
-            except HTTPError:
-                self.logger.error("\nResponse was: " + str(r.status_code) + " (" + r.text + ")")
-                tries += 1
-                time.sleep(1)
-                r = self._retry_when_http_error(tries, func, *args)
+        r = self._send('linkEntity', self.session.post, fromUri.rsplit("{")[0],
+                       data=toUri.rsplit("{")[0], headers=headers)
 
-            except requests.ConnectionError as e:
-                self.logger.exception(str(e))
-                tries += 1
-                time.sleep(1)
-                r = self._retry_when_http_error(tries, func, *args)
+        return r
 
-            except Exception as e:
-                self.logger.exception(str(e))
-                tries += 1
-                time.sleep(1)
-                r = self._retry_when_http_error(tries, func, *args)
+    def _send(self, endpoint, method, url, **kwargs):
+        with self.metrics.time_request(endpoint):
+            return self.flow_control.call(method, url, endpoint=endpoint, **kwargs)
 
-            return r
-        else:
-            error_message = "Maximum no of tries reached: " + str(max_retries)
-            self.logger.error(error_message)
-            return None
+    def _request_with_retries(self, func, *args):
+        return self.retry_policy.call(
+            func, *args,
+            on_retry=lambda attempt, delay, error: self.metrics.increment(HTTP_RETRIES, endpoint=func.__name__))
 
     def _request_post(self, url, data, params, headers):
         if params:
-            return requests.post(url, data=data, params=params, headers=headers)
+            return self.session.post(url, data=data, params=params, headers=headers)
 
-        return requests.post(url, data=data, headers=headers)
+        return self.session.post(url, data=data, headers=headers)
 
     def _request_put(self, url, data, params, headers):
         if params:
-            return requests.put(url, data=data, params=params, headers=headers)
+            return self.session.put(url, data=data, params=params, headers=headers)
 
-        return requests.put(url, data=data, headers=headers)
+        return self.session.put(url, data=data, headers=headers)
 
     def createBundleManifest(self, bundleManifest):
-        r = self._retry_when_http_error(0, self._post_bundle_manifest, bundleManifest, self.ingest_api_root["bundleManifests"]["href"].rsplit("{")[0])
+        r = self._request_with_retries(self._post_bundle_manifest, bundleManifest, self.ingest_api_root["bundleManifests"]["href"].rsplit("{")[0])
 
         if not (200 <= r.status_code < 300):
             error_message = "Failed to create bundle manifest at URL {0} with request payload: {1}".format(self.ingest_api_root["bundleManifests"]["href"].rsplit("{")[0],
@@ -466,7 +567,8 @@ class IngestApi:
             self.logger.info("successfully created bundle manifest")
 
     def _post_bundle_manifest(self, bundleManifest, url):
-        return requests.post(url, data=json.dumps(bundleManifest.__dict__), headers=self.headers)
+        return self._send('createBundleManifest', self.session.post, url, data=json.dumps(bundleManifest.__dict__),
+                          headers=self.headers)
 
     def updateSubmissionWithStagingCredentials(self, subUrl, uuid, submissionCredentials):
         stagingDetails = \
@@ -486,24 +588,29 @@ class IngestApi:
         else:
             self.logger.error("Failed to update envelope with staging details: " + json.dumps(stagingDetails))
 
-    def retrySubmissionUpdateWithStagingDetails(self, subUrl, stagingDetails, tries):
-        if tries < 5:
-            # do a GET request to get latest submission envelope
-            entity_response = requests.get(subUrl)
-            etag = entity_response.headers['ETag']
-            if etag:
-                # set the etag header so we get 412 if someone beats us to set validating
-                self.headers['If-Match'] = etag
-                r = requests.patch(subUrl, data=json.dumps(stagingDetails))
-                try:
-                    r.raise_for_status()
-                    return True
-                except HTTPError:
-                    self.logger.error("PATCHing submission envelope with creds failed, retrying")
-                    tries += 1
-                    self.retrySubmissionUpdateWithStagingDetails(subUrl, stagingDetails, tries)
-        else:
+    def retrySubmissionUpdateWithStagingDetails(self, subUrl, stagingDetails, tries=0):
+        # a 412 means the envelope changed since its ETag was read, so it is read again and the update retried
+        retry_policy = self.retry_policy.copy(
+            max_attempts=max(self.retry_policy.max_attempts - tries, 1),
+            retryable_status_codes=self.retry_policy.retryable_status_codes | {requests.codes.precondition_failed})
+
+        r = retry_policy.call(self._patch_submission_if_match, subUrl, stagingDetails)
+        if r is None or not 200 <= r.status_code < 300:
+            self.logger.error("PATCHing submission envelope with creds failed")
             return False
+        return True
+
+    def _patch_submission_if_match(self, subUrl, stagingDetails):
+        # do a GET request to get latest submission envelope
+        entity_response = self.session.get(subUrl)
+        etag = entity_response.headers.get('ETag')
+        if not etag:
+            return None
+
+        # set the etag header so we get 412 if someone beats us to set validating
+        headers = dict(self.headers)
+        headers['If-Match'] = etag
+        return self.session.patch(subUrl, data=json.dumps(stagingDetails), headers=headers)
 
 
 class BundleManifest:
@@ -515,4 +622,11 @@ class BundleManifest:
         self.fileProcessMap = {}
         self.fileFilesMap = {}
         self.fileProjectMap = {}
-        self.fileProtocolMap = {}
\ No newline at end of file
+        self.fileProtocolMap = {}
+
+
+# Module Exceptions
+
+
+class Error(Exception):
+    """Base-class for all exceptions raised by this module."""
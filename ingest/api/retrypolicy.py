@@ -0,0 +1,167 @@
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+
+RETRYABLE_STATUS_CODES = frozenset([
+    requests.codes.request_timeout,
+    requests.codes.too_many_requests,
+    requests.codes.internal_server_error,
+    requests.codes.bad_gateway,
+    requests.codes.service_unavailable,
+    requests.codes.gateway_timeout
+])
+
+RETRYABLE_EXCEPTIONS = (requests.ConnectionError, requests.Timeout)
+
+
+def status_code_of(error):
+    response = getattr(error, 'response', None)
+    status_code = getattr(response, 'status_code', None)
+    if status_code is None:
+        # e.g. the errors of generated API clients that keep the status as code
+        status_code = getattr(error, 'code', None)
+    return status_code if isinstance(status_code, int) else None
+
+
+async def _async_sleep(delay):
+    # asyncio is only imported by the callers that are already running an event loop
+    import asyncio
+    await asyncio.sleep(delay)
+
+
+class RetryPolicy:
+
+    """
+    Retries a call with exponential backoff and full jitter: the wait before attempt n + 1 is a random
+    time up to base_delay * multiplier ** (n - 1), capped at max_delay. A Retry-After header on the
+    response overrides the backoff.
+
+    A call is retried when it raises one of retryable_exceptions, when it raises an error that carries a
+    response with a retryable status code (e.g. requests.HTTPError) or when it returns a response with a
+    retryable status code. Other errors, such as 4xx responses, fail at once. Retrying stops after
+    max_attempts or when the next wait would pass the deadline, in seconds from the first attempt; the
+    last error is then raised, or the last response returned.
+    """
+
+    def __init__(self, max_attempts=5, base_delay=0.5, max_delay=30.0, multiplier=2.0, jitter=True,
+                 deadline=None, retryable_status_codes=RETRYABLE_STATUS_CODES,
+                 retryable_exceptions=RETRYABLE_EXCEPTIONS, sleep=time.sleep, clock=time.monotonic):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.deadline = deadline
+        self.retryable_status_codes = frozenset(retryable_status_codes)
+        self.retryable_exceptions = retryable_exceptions
+        self.sleep = sleep
+        self.clock = clock
+        self.logger = logging.getLogger(__name__)
+
+    def copy(self, **overrides):
+        settings = dict(vars(self))
+        settings.pop('logger')
+        settings.update(overrides)
+        return RetryPolicy(**settings)
+
+    def backoff(self, attempt):
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** (attempt - 1))
+        return random.uniform(0, delay) if self.jitter else delay
+
+    @staticmethod
+    def retry_after(response):
+        value = response.headers.get('Retry-After') if response is not None else None
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+    def is_retryable_error(self, error):
+        status_code = status_code_of(error)
+        if status_code is not None:
+            return status_code in self.retryable_status_codes
+        return isinstance(error, self.retryable_exceptions)
+
+    def is_retryable_response(self, response):
+        return isinstance(response, requests.Response) and response.status_code in self.retryable_status_codes
+
+    def _next_delay(self, attempt, started_at, error=None, response=None):
+        """
+        Returns the wait before the next attempt, or None if the call should not be retried.
+        """
+        if attempt >= self.max_attempts:
+            return None
+        if error is not None and not self.is_retryable_error(error):
+            return None
+        if error is None and not self.is_retryable_response(response):
+            return None
+
+        retry_after = self.retry_after(response if response is not None else getattr(error, 'response', None))
+        delay = retry_after if retry_after is not None else self.backoff(attempt)
+        if self.deadline is not None and self.clock() + delay - started_at > self.deadline:
+            self.logger.warning(f'Not retrying, the next attempt would be past the {self.deadline}s deadline.')
+            return None
+        return delay
+
+    def _log_retry(self, attempt, delay, error, response, on_retry):
+        reason = str(error) if error is not None else f'status {response.status_code}'
+        self.logger.warning(f'Attempt {attempt} out of {self.max_attempts} failed ({reason}), '
+                            f'retrying in {delay:.2f}s.')
+        if on_retry:
+            on_retry(attempt, delay, error if error is not None else response)
+
+    def call(self, func, *args, on_retry=None, **kwargs):
+        started_at = self.clock()
+        attempt = 0
+        while True:
+            attempt += 1
+            error, response = None, None
+            try:
+                response = func(*args, **kwargs)
+            except Exception as e:
+                error = e
+
+            delay = self._next_delay(attempt, started_at, error=error, response=response)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+
+            self._log_retry(attempt, delay, error, response, on_retry)
+            self.sleep(delay)
+
+    async def call_async(self, func, *args, on_retry=None, **kwargs):
+        """
+        Like call, for a coroutine function; waits with asyncio.sleep so the event loop is not blocked.
+        """
+        started_at = self.clock()
+        attempt = 0
+        while True:
+            attempt += 1
+            error, response = None, None
+            try:
+                response = await func(*args, **kwargs)
+            except Exception as e:
+                error = e
+
+            delay = self._next_delay(attempt, started_at, error=error, response=response)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+
+            self._log_retry(attempt, delay, error, response, on_retry)
+            await _async_sleep(delay)
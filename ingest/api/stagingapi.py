@@ -6,46 +6,75 @@ __author__ = "jupp"
 __license__ = "Apache 2.0"
 __date__ = "12/09/2017"
 
+import gzip
 import json
 import logging
 import os
-from time import sleep, time
+from time import time
 from urllib.parse import urljoin
 
 import requests
-import requests.packages.urllib3.util.retry as retry
+
+from ingest.api import flowcontrol
+from ingest.api.flowcontrol import STAGING_BACKEND
+from ingest.api.httpsession import new_session
+from ingest.api.retrypolicy import RetryPolicy
+from ingest.utils import serialization
+from ingest.utils.metrics import Metrics
 
 
 DEFAULT_STAGING_URL = os.environ.get('STAGING_API', 'https://upload.dev.data.humancellatlas.org')
 DEFAULT_STAGING_VERSION = os.environ.get('STAGING_API_VERSION', 'v1')
 INGEST_API_KEY = os.environ.get('INGEST_API_KEY', 'zero-pupil-until-funny')
 
+# the upload service can be unavailable for a while, keep retrying for ~20mins
+DEFAULT_RETRY_POLICY = RetryPolicy(max_attempts=18, base_delay=0.6, max_delay=120.0, deadline=20 * 60)
+
+
+class StagingEncoding:
+
+    """
+    How stageFile encodes a document. By default it is indented JSON, as the upload service has always
+    received. compact drops the whitespace and, unless another encoder is given, serializes with the fastest
+    JSON backend installed (see ingest.utils.serialization). gzip compresses the body and sends it with
+    Content-Encoding: gzip. encoder is any function from a document to str or bytes.
+    """
+
+    def __init__(self, compact=False, gzip=False, encoder=None, compress_level=6):
+        self.compact = compact
+        self.gzip = gzip
+        self.encoder = encoder if encoder else (serialization.dumps if compact else self._indented_json)
+        self.compress_level = compress_level
 
-class RetryPolicy(retry.Retry):
-    def __init__(self, retry_after_status_codes={301}, **kwargs):
-        super(RetryPolicy, self).__init__(**kwargs)
-        self.RETRY_AFTER_STATUS_CODES = frozenset(retry_after_status_codes | retry.Retry.RETRY_AFTER_STATUS_CODES)
+    @staticmethod
+    def _indented_json(document):
+        return json.dumps(document, indent=4)
+
+    def encode(self, document):
+        """
+        Returns the request body for the document and the headers that describe its encoding.
+        """
+        body = self.encoder(document)
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        if not self.gzip:
+            return body, {}
+        return gzip.compress(body, compresslevel=self.compress_level), {'Content-Encoding': 'gzip'}
+
+
+DEFAULT_ENCODING = StagingEncoding()
 
 
 class StagingApi:
-    def __init__(self, url=None, apikey=None, apiversion=None):
+    def __init__(self, url=None, apikey=None, apiversion=None, retry_policy=DEFAULT_RETRY_POLICY, flow_control=None,
+                 encoding=DEFAULT_ENCODING, metrics=None):
         formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
         logging.basicConfig(formatter=formatter)
 
-        retry_policy = RetryPolicy(
-            total=100,  # seems that this has a default value of 10,
-                        # setting this to a very high number so that it'll respect the status retry count
-            status=17,  # status is the no. of retries if response is in status_forcelist,
-                        # this count will retry for ~20mins with back off timeout within
-            read=10,
-            status_forcelist=[500, 502, 503, 504],
-            backoff_factor=0.6,
-            method_whitelist=frozenset(['HEAD', 'GET', 'POST', 'PUT', 'DELETE', 'OPTIONS', 'TRACE'])
-        )
-
-        self.session = requests.Session()
-        adapter = requests.adapters.HTTPAdapter(max_retries=retry_policy)
-        self.session.mount('https://', adapter)
+        self.retry_policy = retry_policy
+        self.encoding = encoding
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.session = new_session()
 
         self.logger = logging.getLogger(__name__)
 
@@ -59,6 +88,8 @@ class StagingApi:
             self.url = os.path.expandvars(url)
             self.logger.info(f'Using {url} for staging API')
         self.url = url if url else 'https://upload.dev.data.humancellatlas.org'
+        self.flow_control = flow_control if flow_control else \
+            flowcontrol.for_backend(STAGING_BACKEND, self.url, self.metrics)
 
         if not apikey and INGEST_API_KEY:
             apikey = INGEST_API_KEY
@@ -71,7 +102,7 @@ class StagingApi:
         self.logger.info('Creating staging area!')
         base = urljoin(self.url, self.apiversion + '/area/' + submissionId)
 
-        r = self.session.post(base, headers=self.header)
+        r = self.retry_policy.call(self._send, 'createStagingArea', self.session.post, base, headers=self.header)
         r.raise_for_status()
         self.logger.info(f'Staging area created!: {base}')
         self.logger.info("Execution Time: %s seconds" % (time() - start_time))
@@ -80,20 +111,22 @@ class StagingApi:
     def deleteStagingArea(self, submissionId):
         self.logger.info('Deleting staging area!')
         base = urljoin(self.url, self.apiversion + '/area/' + submissionId)
-        r = self.session.delete(base, headers=self.header)
+        r = self.retry_policy.call(self._send, 'deleteStagingArea', self.session.delete, base, headers=self.header)
         r.raise_for_status()
         self.logger.info('Staging area deleted!')
         return base
 
-    def stageFile(self, submissionId, filename, body, type):
+    def stageFile(self, submissionId, filename, body, type, encoding=None):
         fileUrl = urljoin(self.url, self.apiversion + '/area/' + submissionId + "/" + filename)
 
         self.logger.info(f'Staging file: {fileUrl}')
 
+        data, encoding_headers = (encoding if encoding else self.encoding).encode(body)
         header = dict(self.header)
         header['Content-type'] = 'application/json; dcp-type=' + type
+        header.update(encoding_headers)
 
-        r = self.session.put(fileUrl, data=json.dumps(body, indent=4), headers=header)
+        r = self.retry_policy.call(self._send, 'stageFile', self.session.put, fileUrl, data=data, headers=header)
 
         r.raise_for_status()
         res = r.json()
@@ -102,7 +135,7 @@ class StagingApi:
     def getFile(self, submissionId, filename):
         fileUrl = urljoin(self.url, self.apiversion + '/area/' + submissionId + "/" + filename)
         self.logger.info(f'GET file: {fileUrl}')
-        r = self.session.get(fileUrl, headers=self.header)
+        r = self.retry_policy.call(self._send, 'getFile', self.session.get, fileUrl, headers=self.header)
 
         if r.status_code == requests.codes.not_found:
             return None
@@ -114,9 +147,13 @@ class StagingApi:
 
     def hasStagingArea(self, submissionId):
         base = urljoin(self.url, self.apiversion + '/area/' + submissionId)
-        r = self.session.head(base, headers=self.header)
+        r = self.retry_policy.call(self._send, 'hasStagingArea', self.session.head, base, headers=self.header)
         return r.status_code == requests.codes.ok
 
+    def _send(self, endpoint, method, url, **kwargs):
+        with self.metrics.time_request(endpoint):
+            return self.flow_control.call(method, url, endpoint=endpoint, **kwargs)
+
 
 class FileDescription:
     def __init__(self, checksums, contentType, name, size, url):
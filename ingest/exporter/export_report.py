@@ -0,0 +1,167 @@
+import datetime
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from ingest.utils.metrics import HTTP_REQUEST_SECONDS, HTTP_REQUEST_ERRORS
+
+GRAPH_WALK = 'graph_walk'
+METADATA_PREP = 'metadata_prep'
+DSS_LOOKUP = 'dss_lookup'
+STAGING = 'staging'
+DSS_PUT = 'dss_put'
+VERIFY = 'verify'
+BUNDLE_PUT = 'bundle_put'
+MANIFEST_CREATE = 'manifest_create'
+
+CPROFILE = 'cprofile'
+PYINSTRUMENT = 'pyinstrument'
+PROFILERS = [CPROFILE, PYINSTRUMENT]
+
+
+def http_timings(metrics_list):
+    """
+    Returns the number of requests, errors and the total seconds of the HTTP requests timed by the
+    given Metrics, by endpoint.
+    """
+    timings = {}
+    for metrics in metrics_list:
+        counters, __, histograms = metrics.snapshot()
+        for (name, labels), histogram in histograms.items():
+            if name == HTTP_REQUEST_SECONDS:
+                timing = timings.setdefault(dict(labels).get('endpoint'), [0, 0, 0.0])
+                timing[0] += histogram.count
+                timing[2] += histogram.sum
+        for (name, labels), value in counters.items():
+            if name == HTTP_REQUEST_ERRORS:
+                timings.setdefault(dict(labels).get('endpoint'), [0, 0, 0.0])[1] += value
+    return timings
+
+
+class ExportReport:
+
+    """
+    The timings of the export of one bundle: the wall time of each sequential phase, the time the workers
+    of each pipelined phase spent on their files and the HTTP requests by endpoint. The HTTP timings are
+    the difference between the metrics of the API clients at the start and at the end of the export, so
+    they include the requests of any other export running in the same process at the same time.
+    """
+
+    def __init__(self, submission_uuid, process_uuid, http_metrics=None, clock=time.perf_counter):
+        self.submission_uuid = submission_uuid
+        self.process_uuid = process_uuid
+        self.bundle_uuid = None
+        self.http_metrics = list(http_metrics) if http_metrics else []
+        self.clock = clock
+        self.phases = {}
+        self.http = {}
+        self.profile = None
+        self.error = None
+        self.started_at = datetime.datetime.utcnow().isoformat() + 'Z'
+        self.total_seconds = None
+        self._start = clock()
+        self._http_at_start = http_timings(self.http_metrics)
+
+    @contextmanager
+    def phase(self, name):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.add_phase(name, self.clock() - start)
+
+    def add_phase(self, name, seconds, count=None, max_seconds=None, errors=None):
+        phase = self.phases.setdefault(name, {'seconds': 0.0})
+        phase['seconds'] += seconds
+        if count is not None:
+            phase['count'] = phase.get('count', 0) + count
+            phase['max_seconds'] = max(phase.get('max_seconds', 0.0), max_seconds)
+            phase['errors'] = phase.get('errors', 0) + errors
+
+    def add_stage_metrics(self, name, stage_metrics):
+        self.add_phase(name, stage_metrics.total_time, count=stage_metrics.count,
+                       max_seconds=stage_metrics.max_time, errors=stage_metrics.errors)
+
+    def finish(self, bundle_uuid=None, error=None):
+        self.bundle_uuid = bundle_uuid
+        self.error = str(error) if error is not None else None
+        self.total_seconds = self.clock() - self._start
+
+        self.http = {}
+        for endpoint, (count, errors, seconds) in http_timings(self.http_metrics).items():
+            start_count, start_errors, start_seconds = self._http_at_start.get(endpoint, (0, 0, 0.0))
+            if count == start_count and errors == start_errors:
+                continue
+            requests = count - start_count
+            seconds -= start_seconds
+            self.http[endpoint] = {
+                'count': requests,
+                'errors': errors - start_errors,
+                'seconds': seconds,
+                'mean_seconds': seconds / requests if requests else 0.0
+            }
+
+    def to_dict(self):
+        return {
+            'submission_uuid': self.submission_uuid,
+            'process_uuid': self.process_uuid,
+            'bundle_uuid': self.bundle_uuid,
+            'started_at': self.started_at,
+            'total_seconds': self.total_seconds,
+            'error': self.error,
+            'phases': self.phases,
+            'http': self.http,
+            'profile': self.profile
+        }
+
+    def write(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{self.submission_uuid}_{self.process_uuid}.json')
+        with open(path, 'w', encoding='utf-8') as report_file:
+            json.dump(self.to_dict(), report_file, indent=4)
+        return path
+
+
+@contextmanager
+def profiled(profiler, path):
+    """
+    Profiles the calling thread with cProfile, writing its stats to path for pstats, or with pyinstrument,
+    writing its text report to path. Does nothing if profiler is None.
+    """
+    if not profiler:
+        yield
+        return
+
+    logger = logging.getLogger(__name__)
+    if profiler == CPROFILE:
+        import cProfile
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(path)
+            logger.info(f'cProfile stats written to {path}')
+    elif profiler == PYINSTRUMENT:
+        from pyinstrument import Profiler
+        profile = Profiler()
+        profile.start()
+        try:
+            yield
+        finally:
+            profile.stop()
+            with open(path, 'w', encoding='utf-8') as profile_file:
+                profile_file.write(profile.output_text())
+            logger.info(f'pyinstrument report written to {path}')
+    else:
+        raise Error(f'Unknown profiler {profiler}, expected one of {PROFILERS}')
+
+
+# Module Exceptions
+
+
+class Error(Exception):
+    """Base-class for all exceptions raised by this module."""
@@ -13,13 +13,20 @@ import logging
 import os
 import uuid
 import time
-import polling
 
 from urllib.parse import urljoin
 
+import ingest.api.clients as clients
 import ingest.api.dssapi as dssapi
 import ingest.api.ingestapi as ingestapi
-import ingest.api.stagingapi as stagingapi
+from ingest.api.stagingapi import StagingEncoding
+from ingest.exporter.export_report import ExportReport, profiled, CPROFILE, GRAPH_WALK, METADATA_PREP, \
+    DSS_LOOKUP, STAGING, DSS_PUT, VERIFY, BUNDLE_PUT, MANIFEST_CREATE
+from ingest.exporter.ledger import ExportLedger, BUNDLE_STEP, MANIFEST_STEP
+from ingest.exporter.pipeline import Pipeline, Stage
+from ingest.exporter.staged_content_cache import StagedContentCache
+from ingest.importer.checkpoint import content_hash
+from ingest.utils.metrics import Metrics
 from requests.exceptions import HTTPError
 
 DEFAULT_INGEST_URL = os.environ.get('INGEST_API', 'http://api.ingest.dev.data.humancellatlas.org')
@@ -28,11 +35,26 @@ DEFAULT_DSS_URL = os.environ.get('DSS_API', 'http://dss.dev.data.humancellatlas.
 
 BUNDLE_SCHEMA_BASE_URL = os.environ.get('BUNDLE_SCHEMA_BASE_URL', 'https://schema.humancellatlas.org')
 
+DEFAULT_LEDGER_DIR = os.environ.get('EXPORT_LEDGER_DIR')
+DEFAULT_REPORT_DIR = os.environ.get('EXPORT_REPORT_DIR')
+
+DEFAULT_EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS', '4'))
+DEFAULT_EXPORT_QUEUE_SIZE = 16
+
+# the order of the metadata files in a bundle
+METADATA_FILE_TYPES = ['biomaterial', 'file', 'project', 'protocol', 'process', 'links']
+
+VERIFY_POLL_STEP = 30
+VERIFY_TIMEOUT = 1200  # 20 minutes
+
+# shared by the exporters of a process, so that metadata common to many bundles is staged once
+STAGED_CONTENT_CACHE = StagedContentCache()
+
 
 # TODO shouldn't source from environment variables, must pass config or params instead, throw an error if not in config
 
 class IngestExporter:
-    def __init__(self, options=None):
+    def __init__(self, options=None, staged_content_cache=STAGED_CONTENT_CACHE, staging_encoding=None):
         format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
         logging.basicConfig(format=format)
         self.logger = logging.getLogger(__name__)
@@ -44,13 +66,58 @@ class IngestExporter:
 
         self.stagingUrl = options.staging if options and options.staging else os.path.expandvars(DEFAULT_STAGING_URL)
         self.dssUrl = options.dss if options and options.dss else os.path.expandvars(DEFAULT_DSS_URL)
-
-        self.staging_api = stagingapi.StagingApi()
-        self.dss_api = dssapi.DssApi()
-        self.ingest_api = ingestapi.IngestApi(self.ingestUrl)
+        self.ledgerDir = getattr(options, 'ledger', None) or DEFAULT_LEDGER_DIR
+        self.staging_encoding = staging_encoding if staging_encoding else self._staging_encoding_from(options)
+        self.workers = getattr(options, 'workers', None) or DEFAULT_EXPORT_WORKERS
+        self.reportDir = getattr(options, 'report', None) or DEFAULT_REPORT_DIR
+        self.profiler = getattr(options, 'profile', None)
+
+        self.staging_api = clients.get_staging_api()
+        self.dss_api = clients.get_dss_api()
+        self.ingest_api = clients.get_ingest_api(self.ingestUrl)
         self.related_entities_cache = {}
+        self.staged_content_cache = staged_content_cache
+
+    @staticmethod
+    def _staging_encoding_from(options):
+        compact = bool(getattr(options, 'compact_json', False))
+        compressed = bool(getattr(options, 'gzip', False))
+        if not compact and not compressed:
+            # the staging API's own encoding is used
+            return None
+        return StagingEncoding(compact=compact, gzip=compressed)
 
     def export_bundle(self, submission_uuid, process_uuid):
+        report = ExportReport(submission_uuid, process_uuid, http_metrics=self._http_metrics())
+        profile_path = None
+        if self.profiler:
+            extension = 'prof' if self.profiler == CPROFILE else 'txt'
+            profile_dir = self.reportDir or '.'
+            os.makedirs(profile_dir, exist_ok=True)
+            profile_path = os.path.join(profile_dir, f'{submission_uuid}_{process_uuid}.{extension}')
+            report.profile = profile_path
+
+        bundle_uuid = None
+        error = None
+        try:
+            with profiled(self.profiler, profile_path):
+                bundle_uuid = self._export_bundle(submission_uuid, process_uuid, report)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            report.finish(bundle_uuid=bundle_uuid, error=error)
+            self.logger.info(f'Export report: {json.dumps(report.to_dict())}')
+            if self.reportDir:
+                self.logger.info(f'Export report written to {report.write(self.reportDir)}')
+
+        return bundle_uuid
+
+    def _http_metrics(self):
+        api_metrics = [getattr(api, 'metrics', None) for api in (self.ingest_api, self.staging_api, self.dss_api)]
+        return [metrics for metrics in api_metrics if isinstance(metrics, Metrics)]
+
+    def _export_bundle(self, submission_uuid, process_uuid, report):
         start_time = time.time()
         self.related_entities_cache = {}
         saved_bundle_uuid = None
@@ -63,30 +130,38 @@ class IngestExporter:
 
         self.logger.info('Retrieving all process information...')
 
-        process = self.ingest_api.getEntityByUuid('processes', process_uuid)
-        process_info = self.get_all_process_info(process)
+        with report.phase(GRAPH_WALK):
+            process = self.ingest_api.getEntityByUuid('processes', process_uuid)
+            process_info = self.get_all_process_info(process)
+
+            submission = self.ingest_api.getEntityByUuid('submissionEnvelopes', submission_uuid)
+            is_indexed = submission['triggersAnalysis']
 
         self.logger.info('Generating bundle files...')
-        submission = self.ingest_api.getEntityByUuid('submissionEnvelopes', submission_uuid)
-        is_indexed = submission['triggersAnalysis']
-
-        metadata_by_type = self.get_metadata_by_type(process_info)
-        files_by_type = self.prepare_metadata_files(metadata_by_type, process_info, is_indexed)
-
-        links = self.bundle_links(process_info.links)
-        links_file_uuid = str(uuid.uuid4())
-        files_by_type['links'] = list()
-        files_by_type['links'].append({
-            'content': links,
-            'content_type': '"metadata/{0}"'.format('links'),
-            'indexed': is_indexed,
-            'dss_filename': 'links.json',
-            'dss_uuid': links_file_uuid,
-            'upload_filename': 'links_' + links_file_uuid + '.json'
-        })
-
-        # restructure bundle manifest
-        bundle_manifest = self.create_bundle_manifest(submission_uuid, files_by_type)
+        with report.phase(METADATA_PREP):
+            metadata_by_type = self.get_metadata_by_type(process_info)
+            files_by_type = self.prepare_metadata_files(metadata_by_type, process_info, is_indexed)
+
+            # an export that is run again reuses the bundle uuid, versions and links file of the first run
+            ledger = self._get_ledger(submission_uuid, process_uuid)
+            bundle_record = ledger.get_bundle() if ledger else None
+
+            links = self.bundle_links(process_info.links)
+            links_file_uuid = bundle_record['links_file_uuid'] if bundle_record else str(uuid.uuid4())
+            files_by_type['links'] = list()
+            files_by_type['links'].append({
+                'content': links,
+                'content_type': '"metadata/{0}"'.format('links'),
+                'indexed': is_indexed,
+                'dss_filename': 'links.json',
+                'dss_uuid': links_file_uuid,
+                'upload_filename': 'links_' + links_file_uuid + '.json'
+            })
+
+            # restructure bundle manifest
+            bundle_manifest = self.create_bundle_manifest(submission_uuid, files_by_type)
+            if bundle_record:
+                bundle_manifest.bundleUuid = bundle_record['bundle_uuid']
 
         self.logger.info('Generating bundle files...')
 
@@ -105,28 +180,39 @@ class IngestExporter:
             self.logger.info('Dry run for bundle ' + bundle_manifest.bundleUuid)
             self.logger.info("Execution Time: %s seconds" % (time.time() - start_time))
         else:
-            self.logger.info('Uploading metadata files...')
-            self.upload_metadata_files(submission_uuid, files_by_type)
-
-            metadata_files = self.get_metadata_files(files_by_type)
-            data_files = self.get_data_files(metadata_by_type['file'])
-            bundle_files = metadata_files + data_files
-
-            bundle_manifest.dataFiles = list()
-            bundle_manifest.dataFiles = [data_file['dss_uuid'] for data_file in data_files]
-            self.logger.info('Saving files in DSS...')
-            bundle_uuid = bundle_manifest.bundleUuid
-            created_files = self.put_files_in_dss(bundle_uuid, bundle_files, process_info)
-
-            # check all created files
-            self.logger.info('Verifying if all files get successfully copied to DSS...')
-            self.verify_files(created_files)
-
-            self.logger.info('Saving bundle in DSS...')
-            self.put_bundle_in_dss(bundle_uuid, created_files)
-
-            self.logger.info('Saving bundle manifest...')
-            self.ingest_api.createBundleManifest(bundle_manifest)
+            with report.phase(METADATA_PREP):
+                data_files = self.get_data_files(metadata_by_type['file'])
+
+                bundle_manifest.dataFiles = list()
+                bundle_manifest.dataFiles = [data_file['dss_uuid'] for data_file in data_files]
+                bundle_uuid = bundle_manifest.bundleUuid
+                bundle_version = bundle_record['version'] if bundle_record else dssapi.new_version()
+                if ledger and not bundle_record:
+                    ledger.record_bundle(bundle_uuid, bundle_version, links_file_uuid)
+
+            self.logger.info('Staging metadata files, saving files in DSS and verifying them...')
+            created_files = self.export_files(submission_uuid, bundle_uuid, files_by_type, data_files, process_info,
+                                              ledger=ledger, report=report)
+            if self.staged_content_cache is not None:
+                self.logger.info(f'Staged content cache: {self.staged_content_cache.stats()}')
+
+            if ledger and ledger.is_done(BUNDLE_STEP):
+                self.logger.info(f'Bundle {bundle_uuid} is already in DSS.')
+            else:
+                self.logger.info('Saving bundle in DSS...')
+                with report.phase(BUNDLE_PUT):
+                    self.put_bundle_in_dss(bundle_uuid, created_files, version=bundle_version)
+                if ledger:
+                    ledger.record_step(BUNDLE_STEP)
+
+            if ledger and ledger.is_done(MANIFEST_STEP):
+                self.logger.info(f'Bundle manifest for {bundle_uuid} is already saved.')
+            else:
+                self.logger.info('Saving bundle manifest...')
+                with report.phase(MANIFEST_CREATE):
+                    self.ingest_api.createBundleManifest(bundle_manifest)
+                if ledger:
+                    ledger.record_step(MANIFEST_STEP)
 
             saved_bundle_uuid = bundle_manifest.bundleUuid
 
@@ -135,6 +221,58 @@ class IngestExporter:
 
         return saved_bundle_uuid
 
+    def _get_ledger(self, submission_uuid, process_uuid):
+        if self.dryrun or not self.ledgerDir:
+            return None
+        return ExportLedger.for_bundle(self.ledgerDir, submission_uuid, process_uuid)
+
+    def export_files(self, submission_uuid, bundle_uuid, files_by_type, data_files, process_info, ledger=None,
+                     report=None):
+        """
+        Stages the metadata files, puts the bundle files in DSS and verifies they are copied, in a pipeline:
+        each file is put as soon as it is staged and verified as soon as it is put. Returns the created files
+        in the order of the metadata files followed by the data files. Files that the ledger recorded and that
+        are already in DSS are neither staged nor put again.
+        """
+        metadata_docs = [metadata_doc for entity_type in METADATA_FILE_TYPES
+                         for metadata_doc in files_by_type[entity_type]]
+        bundle_files = [self._metadata_file(metadata_doc) for metadata_doc in metadata_docs] + data_files
+
+        start = time.perf_counter()
+        registered_versions = self.get_registered_versions(bundle_files, ledger)
+        stored_versions = self.get_stored_versions(bundle_files, process_info)
+        if report:
+            report.add_phase(DSS_LOOKUP, time.perf_counter() - start)
+
+        def stage(item):
+            metadata_doc, bundle_file = item
+            if metadata_doc and not metadata_doc.get('is_from_input_bundle') \
+                    and bundle_file['dss_uuid'] not in registered_versions:
+                bundle_file['url'] = self.stage_metadata_file(submission_uuid, metadata_doc).url
+            return bundle_file
+
+        def put(bundle_file):
+            return self.put_file_in_dss(bundle_uuid, bundle_file, stored_versions, registered_versions, ledger)
+
+        def verify(created_file):
+            if created_file['uuid'] not in registered_versions:
+                self.verify_file(created_file)
+            return created_file
+
+        pipeline = Pipeline([
+            Stage(STAGING, stage, workers=self.workers),
+            Stage(DSS_PUT, put, workers=self.workers),
+            Stage(VERIFY, verify, workers=self.workers)
+        ], queue_size=DEFAULT_EXPORT_QUEUE_SIZE)
+        items = list(zip(metadata_docs, bundle_files)) + [(None, data_file) for data_file in data_files]
+        try:
+            return pipeline.run(items)
+        finally:
+            if report:
+                # the pipelined phases overlap, their seconds are the time their workers spent on the files
+                for name, stage_metrics in pipeline.metrics.items():
+                    report.add_stage_metrics(name, stage_metrics)
+
     def get_metadata_by_type(self, process_info: 'ProcessInfo') -> dict:
         #  given a ProcessInfo, pull out all the metadata and return as a map of UUID->metadata documents
         simplified = dict()
@@ -372,110 +510,146 @@ class IngestExporter:
             'links': links
         }
 
-    def upload_metadata_files(self, submission_uuid, metadata_files_info):
+    def stage_metadata_file(self, submission_uuid, metadata_doc):
         try:
-            for metadata_type in ['project', 'biomaterial', 'process', 'protocol', 'file', 'links']:
-                for metadata_doc in metadata_files_info[metadata_type]:
-                    bundle_file = metadata_doc
-                    filename = bundle_file['upload_filename']
-                    content = bundle_file['content']
-                    content_type = bundle_file['content_type']
-
-                    if not bundle_file.get('is_from_input_bundle'):
-                        uploaded_file = self.upload_file(submission_uuid, filename, content, content_type)
-                        bundle_file['upload_file_url'] = uploaded_file.url
+            uploaded_file = self.upload_file(submission_uuid, metadata_doc['upload_filename'],
+                                             metadata_doc['content'], metadata_doc['content_type'])
         except Exception as e:
             message = "An error occurred on uploading bundle files: " + str(e)
             raise BundleFileUploadError(message)
 
-    def put_bundle_in_dss(self, bundle_uuid, created_files):
+        metadata_doc['upload_file_url'] = uploaded_file.url
+        return uploaded_file
+
+    def put_bundle_in_dss(self, bundle_uuid, created_files, version=None):
         try:
-            created_bundle = self.dss_api.put_bundle(bundle_uuid, created_files)
+            created_bundle = self.dss_api.put_bundle(bundle_uuid, created_files, version=version)
         except Exception as e:
             message = 'An error occurred while putting bundle in DSS: ' + str(e)
             raise BundleDSSError(message)
 
         return created_bundle
 
-    def put_files_in_dss(self, bundle_uuid, files_to_put, process_info):
-        created_files = []
+    def get_registered_versions(self, bundle_files, ledger):
+        """
+        Returns the versions of the files that the ledger recorded with the same checksum and that are in
+        DSS, by file uuid. These files don't need to be put again.
+        """
+        if not ledger:
+            return {}
+
+        recorded_files = []
+        for bundle_file in bundle_files:
+            version = ledger.get_file_version(bundle_file["dss_uuid"], bundle_file["checksum"])
+            if version:
+                recorded_files.append((bundle_file["dss_uuid"], version))
+
+        responses = self.dss_api.head_files(recorded_files) if recorded_files else []
+        registered_versions = {file_uuid: version for (file_uuid, version), response in zip(recorded_files, responses)
+                               if self._is_file_copied(response)}
+        self.logger.info(f'{len(registered_versions)} of {len(bundle_files)} files are already in DSS.')
+        return registered_versions
+
+    def get_stored_versions(self, bundle_files, process_info):
+        """
+        Returns the latest versions in DSS of the files that are part of the input bundle, by file uuid,
+        with None for those that could not be found. These files are not put in DSS again.
+        """
+        input_data_files = [input_file['dataFileUuid'] for input_file in list(process_info.input_files.values())]
+
+        # TODO if file is an input file, this file may already be in the data store, need to get the stored version
+        # This assumes that the latest version is the file version in the input bundle, should be a safe assumption for now
+        # Ideally, bundle manifest must store the file uuid and version and version must be retrieved from there
+
+        # if metadata file , check is_from_input_bundle flag, if true, do not put file to DSS again
+        stored_files = [bundle_file for bundle_file in bundle_files
+                        if bundle_file.get('is_from_input_bundle') or bundle_file["dss_uuid"] in input_data_files]
+        stored_file_responses = self.dss_api.head_files([(bundle_file["dss_uuid"], None)
+                                                         for bundle_file in stored_files]) if stored_files else []
+        return {bundle_file["dss_uuid"]: response.headers['X-DSS-VERSION'] if response is not None else None
+                for bundle_file, response in zip(stored_files, stored_file_responses)}
+
+    def put_file_in_dss(self, bundle_uuid, bundle_file, stored_versions, registered_versions, ledger=None):
+        file_uuid = bundle_file["dss_uuid"]
 
-        for bundle_file in files_to_put:
-            version = ''
-            file_uuid = bundle_file["dss_uuid"]
-            created_file = None
-            input_data_files = [input_file['dataFileUuid'] for input_file in list(process_info.input_files.values())]
+        try:
+            if file_uuid in stored_versions:
+                if stored_versions[file_uuid] is None:
+                    raise FileDSSError(f'File {file_uuid} could not be found in DSS')
+                created_file = {
+                    'version': stored_versions[file_uuid]
+                }
+            elif file_uuid in registered_versions:
+                created_file = {
+                    'version': registered_versions[file_uuid]
+                }
+            else:
+                created_file = self._put_file_in_dss(bundle_uuid, bundle_file, ledger)
 
+            version = created_file['version']
+        except Exception as e:
+            raise FileDSSError('An error occurred while putting file in DSS' + str(e))
+
+        return {
+            "indexed": bundle_file["indexed"],
+            "name": bundle_file["submittedName"],
+            "uuid": file_uuid,
+            "content-type": bundle_file["content-type"],
+            "version": version
+        }
+
+    def _put_file_in_dss(self, bundle_uuid, bundle_file, ledger):
+        if not ledger:
+            return self.dss_api.put_file(bundle_uuid, bundle_file)
+
+        # the version is recorded before the PUT, so that a retry of an interrupted PUT is idempotent
+        version = ledger.get_file_version(bundle_file["dss_uuid"], bundle_file["checksum"])
+        if not version:
+            version = bundle_file.get("update_date") or dssapi.new_version()
+            ledger.record_file(bundle_file["dss_uuid"], version, bundle_file["checksum"])
+        return self.dss_api.put_file(bundle_uuid, bundle_file, version=version)
+
+    def verify_file(self, created_file):
+        def file_copied():
             try:
-                # TODO if file is an input file, this file may already be in the data store, need to get the stored version
-                # This assumes that the latest version is the file version in the input bundle, should be a safe assumption for now
-                # Ideally, bundle manifest must store the file uuid and version and version must be retrieved from there
-
-                # if metadata file , check is_from_input_bundle flag, if true, do not put file to DSS again
-                if bundle_file.get('is_from_input_bundle') or file_uuid in input_data_files:
-                    file_response = self.dss_api.head_file(bundle_file["dss_uuid"])
-                    created_file = {
-                        'version': file_response.headers['X-DSS-VERSION']
-                    }
-                else:
-                    created_file = self.dss_api.put_file(bundle_uuid, bundle_file)
-
-                version = created_file['version']
-            except Exception as e:
-                raise FileDSSError('An error occurred while putting file in DSS' + str(e))
-
-            file_param = {
-                "indexed": bundle_file["indexed"],
-                "name": bundle_file["submittedName"],
-                "uuid": file_uuid,
-                "content-type": bundle_file["content-type"],
-                "version": version
-            }
-
-            created_files.append(file_param)
-
-        return created_files
-
-    def verify_files(self, created_files):
-        for created_file in created_files:
-            try:
-                polling.poll(
-                    lambda: self._is_file_copied(created_file),
-                    step=30,
-                    timeout=1200  # 20 minutes
-                )
-            except polling.TimeoutException as te:
-                self.logger.error(f'File {created_file["uuid"]}/{created_file["version"]} with name {created_file["name"]} takes too long to be copied.')
-                raise
-            self.logger.info(f'File {created_file["uuid"]}/{created_file["version"]} with name {created_file["name"]} is successfully copied!')
-
-    def _is_file_copied(self, created_file):
+                head_response = self.dss_api.head_file(created_file["uuid"], version=created_file["version"])
+            except dssapi.DssFileNotFoundError:
+                return False
+            except dssapi.Error as e:
+                if not self.dss_api.is_transient_error(e):
+                    raise
+                self.logger.warning(f'Could not check file {created_file["uuid"]}/{created_file["version"]} yet: {e}')
+                return False
+            return self._is_file_copied(head_response)
+
+        import polling
         try:
-            r = self.dss_api.head_file(created_file["uuid"], version=created_file["version"])
-            return (r.status_code == requests.codes.ok) or (r.status_code == requests.codes.created)
-        except Exception as e:
-            return False
-
-    def get_metadata_files(self, metadata_files_info):
-        metadata_files = []
-
-        for entity_type in ['biomaterial', 'file', 'project', 'protocol', 'process', 'links']:
-            for metadata_file in metadata_files_info[entity_type]:
-                metadata_files.append({
-                    'name': metadata_file['upload_filename'],
-                    'submittedName': metadata_file['dss_filename'],
-                    'url': metadata_file.get('upload_file_url'),
-                    'dss_uuid': metadata_file['dss_uuid'],
-                    'indexed': metadata_file['indexed'],
-                    'content-type': metadata_file['content_type'],
-                    'update_date': metadata_file.get('update_date'),
-                    'is_from_input_bundle': metadata_file.get('is_from_input_bundle')
-                })
-        return metadata_files
+            polling.poll(file_copied, step=VERIFY_POLL_STEP, timeout=VERIFY_TIMEOUT)
+        except polling.TimeoutException:
+            self.logger.error(f'File {created_file["uuid"]}/{created_file["version"]} with name {created_file["name"]} takes too long to be copied.')
+            raise
+        self.logger.info(f'File {created_file["uuid"]}/{created_file["version"]} with name {created_file["name"]} is successfully copied!')
+
+    @staticmethod
+    def _is_file_copied(head_response):
+        return head_response is not None and head_response.status_code in [requests.codes.ok, requests.codes.created]
+
+    @staticmethod
+    def _metadata_file(metadata_file):
+        return {
+            'name': metadata_file['upload_filename'],
+            'submittedName': metadata_file['dss_filename'],
+            'url': metadata_file.get('upload_file_url'),
+            'dss_uuid': metadata_file['dss_uuid'],
+            'indexed': metadata_file['indexed'],
+            'content-type': metadata_file['content_type'],
+            'update_date': metadata_file.get('update_date'),
+            'is_from_input_bundle': metadata_file.get('is_from_input_bundle'),
+            'checksum': content_hash(metadata_file['content'])
+        }
 
     def get_data_files(self, uuid_file_dict):
         data_files = []
-        #  TODO: need to keep track of UUIDs used so that retries work when the DSS returns a 500
         for file_uuid, data_file in uuid_file_dict.items():
             filename = data_file['fileName']
             cloud_url = data_file['cloudUrl']
@@ -487,7 +661,9 @@ class IngestExporter:
                 'url': cloud_url,
                 'dss_uuid': data_file_uuid,
                 'indexed': False,
-                'content-type': 'data'
+                'content-type': 'data',
+                # the content of a data file is identified by its source and the checksums ingest has for it
+                'checksum': content_hash({'url': cloud_url, 'checksums': data_file.get('checksums')})
             })
 
         return data_files
@@ -522,6 +698,20 @@ class IngestExporter:
         return schema_uri["content"]["describedBy"].rsplit('/', 1)[-1]
 
     def upload_file(self, submission_uuid, filename, content, content_type):
+        cache_key = None
+        if self.staged_content_cache is not None:
+            cache_key = self.staged_content_cache.key(submission_uuid, content, content_type)
+            file_description = self.staged_content_cache.get(cache_key)
+            if file_description:
+                self.logger.info(f'The content of {filename} is already staged at {file_description.url}.')
+                return file_description
+
+        file_description = self._stage_file(submission_uuid, filename, content, content_type)
+        if cache_key is not None:
+            self.staged_content_cache.put(cache_key, file_description)
+        return file_description
+
+    def _stage_file(self, submission_uuid, filename, content, content_type):
         file_description = self.staging_api.getFile(submission_uuid, filename)
 
         if file_description:
@@ -529,7 +719,8 @@ class IngestExporter:
         else:
             self.logger.info("Writing to staging area..." + filename)
             try:
-                file_description = self.staging_api.stageFile(submission_uuid, filename, content, content_type)
+                file_description = self.staging_api.stageFile(submission_uuid, filename, content, content_type,
+                                                              encoding=self.staging_encoding)
             except HTTPError as e:
                 if str(e.response.status_code) == "409":
                     file_description = self.staging_api.getFile(submission_uuid, filename)
@@ -0,0 +1,106 @@
+import json
+import logging
+import os
+import threading
+
+BUNDLE_STEP = 'bundle'
+MANIFEST_STEP = 'manifest'
+
+BUNDLE_RECORD = 'bundle'
+FILE_RECORD = 'file'
+STEP_RECORD = 'step'
+
+
+class ExportLedger:
+
+    """
+    An append-only record of the export of one bundle: the bundle uuid and version, the uuid, version
+    and checksum of each file put in DSS and each completed export step. Identifiers and versions are
+    recorded before they are sent to DSS, so an export that is run again reuses them and every PUT it
+    repeats is idempotent; files whose recorded version is already in DSS with the same checksum are
+    not put again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._bundle = None
+        self._files = {}
+        self._steps = set()
+        self._load()
+
+    @staticmethod
+    def for_bundle(directory, submission_uuid, process_uuid):
+        os.makedirs(directory, exist_ok=True)
+        return ExportLedger(os.path.join(directory, f'{submission_uuid}_{process_uuid}.jsonl'))
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, encoding='utf-8') as ledger_file:
+            for line in ledger_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # a record that was only partially written before a crash
+                    self.logger.warning(f'Ignoring incomplete record in export ledger {self.path}.')
+                    continue
+                self._apply(record)
+
+        self.logger.info(f'Resuming from export ledger {self.path}: {len(self._files)} files recorded.')
+
+    def _apply(self, record):
+        record_type = record.get('record')
+        if record_type == BUNDLE_RECORD:
+            self._bundle = record
+        elif record_type == FILE_RECORD:
+            self._files[record['uuid']] = record
+        elif record_type == STEP_RECORD:
+            self._steps.add(record['step'])
+
+    def _append(self, record):
+        line = json.dumps(record) + '\n'
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as ledger_file:
+                ledger_file.write(line)
+                ledger_file.flush()
+            self._apply(record)
+
+    def get_bundle(self):
+        return self._bundle
+
+    def record_bundle(self, bundle_uuid, version, links_file_uuid):
+        self._append({
+            'record': BUNDLE_RECORD,
+            'bundle_uuid': bundle_uuid,
+            'version': version,
+            'links_file_uuid': links_file_uuid
+        })
+
+    def get_file_version(self, file_uuid, checksum):
+        """
+        Returns the version recorded for the file if it was recorded with the same checksum, None otherwise.
+        """
+        file_record = self._files.get(file_uuid)
+        if file_record is None or file_record['checksum'] != checksum:
+            return None
+        return file_record['version']
+
+    def record_file(self, file_uuid, version, checksum):
+        self._append({
+            'record': FILE_RECORD,
+            'uuid': file_uuid,
+            'version': version,
+            'checksum': checksum
+        })
+
+    def is_done(self, step):
+        return step in self._steps
+
+    def record_step(self, step):
+        self._append({
+            'record': STEP_RECORD,
+            'step': step
+        })
@@ -0,0 +1,121 @@
+import logging
+import queue
+import threading
+import time
+
+from ingest.utils.metrics import StageMetrics
+
+DEFAULT_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 16
+
+# passed down the queues once all items of a stage have been handled
+_END = object()
+
+
+class Stage:
+
+    def __init__(self, name, func, workers=DEFAULT_WORKERS):
+        self.name = name
+        self.func = func
+        self.workers = workers
+
+
+class Pipeline:
+
+    """
+    Passes items through a sequence of stages. Each stage has its own workers and takes its items from a
+    bounded queue that the previous stage fills, so an item moves on as soon as a stage is done with it and
+    the stages overlap; a bounded queue stops a fast stage from running ahead of a slow one. run returns the
+    results of the last stage in the order of the items. The first error stops the feeding of new items, the
+    items already in the queues are dropped and the error is raised once all workers have stopped.
+    """
+
+    def __init__(self, stages, queue_size=DEFAULT_QUEUE_SIZE):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.metrics = {stage.name: StageMetrics() for stage in stages}
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._error = None
+
+    def run(self, items):
+        self._stopped.clear()
+        self._error = None
+
+        queues = [queue.Queue(maxsize=self.queue_size) for __ in self.stages]
+        # the results are taken by the calling thread, which never blocks a worker
+        queues.append(queue.Queue())
+
+        threads = [threading.Thread(target=self._feed, args=(items, queues[0], self.stages[0].workers), daemon=True)]
+        for index, stage in enumerate(self.stages):
+            next_workers = self.stages[index + 1].workers if index + 1 < len(self.stages) else 1
+            remaining = [stage.workers]
+            for __ in range(stage.workers):
+                threads.append(threading.Thread(target=self._work, daemon=True,
+                                                args=(stage, queues[index], queues[index + 1], remaining,
+                                                      next_workers)))
+        for thread in threads:
+            thread.start()
+
+        results = {}
+        while True:
+            result = queues[-1].get()
+            if result is _END:
+                break
+            item_index, value = result
+            results[item_index] = value
+
+        for thread in threads:
+            thread.join()
+
+        self.logger.info(f'Export pipeline finished: {self.metrics}')
+
+        if self._error is not None:
+            raise self._error
+        return [results[item_index] for item_index in sorted(results)]
+
+    def _feed(self, items, first_queue, workers):
+        for item_index, item in enumerate(items):
+            if self._stopped.is_set():
+                break
+            first_queue.put((item_index, item))
+        for __ in range(workers):
+            first_queue.put(_END)
+
+    def _work(self, stage, input_queue, output_queue, remaining, next_workers):
+        while True:
+            entry = input_queue.get()
+            if entry is _END:
+                break
+            if self._stopped.is_set():
+                continue
+
+            item_index, item = entry
+            start = time.perf_counter()
+            try:
+                result = stage.func(item)
+            except Exception as error:
+                self._record(stage, time.perf_counter() - start, input_queue, error=True)
+                self._stop(error)
+                continue
+            self._record(stage, time.perf_counter() - start, input_queue)
+            output_queue.put((item_index, result))
+
+        with self._lock:
+            remaining[0] -= 1
+            last_worker = remaining[0] == 0
+        if last_worker:
+            for __ in range(next_workers):
+                output_queue.put(_END)
+
+    def _record(self, stage, duration, input_queue, error=False):
+        with self._lock:
+            self.metrics[stage.name].record(duration, error=error)
+            self.metrics[stage.name].record_queued(input_queue.qsize())
+
+    def _stop(self, error):
+        with self._lock:
+            if self._error is None:
+                self._error = error
+        self._stopped.set()
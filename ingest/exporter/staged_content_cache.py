@@ -0,0 +1,60 @@
+import threading
+from collections import OrderedDict
+
+from ingest.importer.checkpoint import content_hash
+
+DEFAULT_MAX_SIZE = 10000
+
+
+class StagedContentCache:
+
+    """
+    A thread safe LRU cache of the files staged in upload areas, keyed by the upload area, the content
+    type and the sha256 of the canonical JSON of the content. Metadata documents that are part of many
+    bundles of a submission, like the project, protocols and donors, are then staged once per upload
+    area. Hits, misses and the bytes of the staged files that were not sent again are counted.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self.max_size = max_size
+        self._file_descriptions = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    @staticmethod
+    def key(upload_area, content, content_type):
+        return upload_area, content_type, content_hash(content)
+
+    def get(self, key):
+        with self._lock:
+            file_description = self._file_descriptions.get(key)
+            if file_description is None:
+                self.misses = self.misses + 1
+            else:
+                self.hits = self.hits + 1
+                self.bytes_saved = self.bytes_saved + (file_description.size or 0)
+                self._file_descriptions.move_to_end(key)
+            return file_description
+
+    def put(self, key, file_description):
+        with self._lock:
+            self._file_descriptions[key] = file_description
+            self._file_descriptions.move_to_end(key)
+            while len(self._file_descriptions) > self.max_size:
+                self._file_descriptions.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'bytes_saved': self.bytes_saved}
+
+    def clear(self):
+        with self._lock:
+            self._file_descriptions.clear()
+            self.hits = 0
+            self.misses = 0
+            self.bytes_saved = 0
+
+    def __len__(self):
+        return len(self._file_descriptions)
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+MANIFEST_STEP = 'manifest'
+
+ENTITY_RECORD = 'entity'
+LINK_RECORD = 'link'
+UNLINK_RECORD = 'unlink'
+STEP_RECORD = 'step'
+
+
+def content_hash(content):
+    canonical_json = json.dumps(content, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical_json.encode('utf-8')).hexdigest()
+
+
+def link_key(from_entity, to_entity, relationship):
+    return from_entity.type, from_entity.id, relationship, to_entity.type, to_entity.id
+
+
+class CheckpointJournal:
+
+    """
+    An append-only journal of the work done for a submission: the ingest response of each created
+    entity, each completed link and each completed submission step. Every record is a JSON line
+    written as soon as the work is done, so a submission that fails halfway can be run again and
+    only the remaining work is sent to ingest.
+
+    Entity records also hold a hash of the content that was submitted, which tells which entities
+    have changed when a spreadsheet is imported again to the same submission.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._entities = {}
+        self._hashes = {}
+        self._links = set()
+        self._steps = set()
+        self._load()
+
+    @staticmethod
+    def for_submission(directory, submission_url):
+        os.makedirs(directory, exist_ok=True)
+        file_name = hashlib.sha1(submission_url.encode('utf-8')).hexdigest() + '.jsonl'
+        return CheckpointJournal(os.path.join(directory, file_name))
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, encoding='utf-8') as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # a record that was only partially written before a crash
+                    self.logger.warning(f'Ignoring incomplete record in checkpoint journal {self.path}.')
+                    continue
+                self._apply(record)
+
+        self.logger.info(f'Resuming from checkpoint journal {self.path}: {len(self._entities)} entities, '
+                         f'{len(self._links)} links already submitted.')
+
+    def _apply(self, record):
+        record_type = record.get('record')
+        if record_type == ENTITY_RECORD:
+            self._entities[(record['type'], record['id'])] = record['ingest_json']
+            self._hashes[(record['type'], record['id'])] = record.get('hash')
+        elif record_type == LINK_RECORD:
+            self._links.add(tuple(record['link']))
+        elif record_type == UNLINK_RECORD:
+            self._links.discard(tuple(record['link']))
+        elif record_type == STEP_RECORD:
+            self._steps.add(record['step'])
+
+    def _append(self, record):
+        line = json.dumps(record) + '\n'
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as journal_file:
+                journal_file.write(line)
+                journal_file.flush()
+            self._apply(record)
+
+    def restore_entity(self, entity):
+        ingest_json = self._entities.get((entity.type, entity.id))
+        if ingest_json is None:
+            return False
+        entity.ingest_json = ingest_json
+        return True
+
+    def record_entity(self, entity):
+        self._append({
+            'record': ENTITY_RECORD,
+            'type': entity.type,
+            'id': entity.id,
+            'ingest_json': entity.ingest_json,
+            'hash': content_hash(entity.content)
+        })
+
+    def is_changed(self, entity):
+        # entities journaled before content hashes were recorded are taken to be unchanged
+        submitted_hash = self._hashes.get((entity.type, entity.id))
+        return submitted_hash is not None and submitted_hash != content_hash(entity.content)
+
+    def is_linked(self, from_entity, to_entity, relationship):
+        return link_key(from_entity, to_entity, relationship) in self._links
+
+    def get_link_keys(self):
+        return set(self._links)
+
+    def record_link(self, from_entity, to_entity, relationship):
+        self._append({
+            'record': LINK_RECORD,
+            'link': list(link_key(from_entity, to_entity, relationship))
+        })
+
+    def record_unlink(self, from_entity, to_entity, relationship):
+        self._append({
+            'record': UNLINK_RECORD,
+            'link': list(link_key(from_entity, to_entity, relationship))
+        })
+
+    def is_done(self, step):
+        return step in self._steps
+
+    def record_step(self, step):
+        self._append({
+            'record': STEP_RECORD,
+            'step': step
+        })
+
+    def count_entities(self):
+        return len(self._entities)
+
+    def count_links(self):
+        return len(self._links)
+
+    def clear(self):
+        with self._lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self._entities = {}
+            self._hashes = {}
+            self._links = set()
+            self._steps = set()
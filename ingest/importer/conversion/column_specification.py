@@ -1,6 +1,6 @@
 from enum import Enum
 
-from ingest.importer.conversion import utils, data_converter
+from ingest.importer.conversion import data_converter, field_path
 from ingest.importer.conversion.data_converter import DataType, CONVERTER_MAP, ListConverter
 
 
@@ -49,7 +49,7 @@ class ColumnSpecification:
         return conversion_type
 
     def _represents_an_object_field(self):
-        entity_type = utils.extract_root_field(self.field_name)
+        entity_type = field_path.parse(self.field_name).root
         return entity_type == self.object_type and self.order_of_occurence == 1
 
     def _determine_conversion_type_for_object_field(self):
@@ -1,12 +1,10 @@
-import re
 from abc import abstractmethod
 
-from ingest.importer.conversion import data_converter
+from ingest.importer.conversion import data_converter, field_path
 from ingest.importer.conversion.column_specification import ColumnSpecification, ConversionType
 from ingest.importer.conversion.data_converter import Converter, ListConverter
 from ingest.importer.conversion.exceptions import UnknownMainCategory
 from ingest.importer.conversion.metadata_entity import MetadataEntity
-from ingest.importer.conversion.utils import split_field_chain
 from ingest.importer.data_node import DataNode
 
 _LIST_CONVERTER = ListConverter()
@@ -16,15 +14,9 @@ class CellConversion(object):
 
     def __init__(self, field, converter: Converter):
         self.field = field
-        self.applied_field = self._process_applied_field(field)
+        self.applied_field = field_path.parse(field).applied
         self.converter = converter
 
-    @staticmethod
-    def _process_applied_field(field):
-        pattern = '(\w*\.){0,1}(?P<insert_field>.*)'
-        match = re.match(pattern, field)
-        return match.group('insert_field')
-
     @abstractmethod
     def apply(self, metadata: MetadataEntity, cell_data): ...
 
@@ -42,10 +34,11 @@ class ListElementCellConversion(CellConversion):
     def __init__(self, field: str, converter: Converter):
         list_converter = ListConverter(base_converter=converter)
         super(ListElementCellConversion, self).__init__(field, list_converter)
+        self.applied_path = field_path.parse(self.applied_field)
 
     def apply(self, metadata: MetadataEntity, cell_data):
         if cell_data is not None:
-            parent_path, target_field = split_field_chain(self.applied_field)
+            parent_path, target_field = self.applied_path.parent, self.applied_path.target
             data_list = self.converter.convert(cell_data)
             parent = self._prepare_array(metadata, parent_path, len(data_list))
             for index, data in enumerate(data_list):
@@ -68,9 +61,13 @@ class ListElementCellConversion(CellConversion):
 
 class FieldOfSingleElementListCellConversion(CellConversion):
 
+    def __init__(self, field, converter: Converter):
+        super(FieldOfSingleElementListCellConversion, self).__init__(field, converter)
+        self.applied_path = field_path.parse(self.applied_field)
+
     def apply(self, metadata: MetadataEntity, cell_data):
         if cell_data is not None:
-            parent_path, target_field = split_field_chain(self.applied_field)
+            parent_path, target_field = self.applied_path.parent, self.applied_path.target
             target_object = self._determine_target_object(metadata, parent_path)
             data = self.converter.convert(cell_data)
             target_object[target_field] = data
@@ -0,0 +1,45 @@
+import re
+import sys
+from functools import lru_cache
+
+FIELD_SEPARATOR = '.'
+
+SPLIT_FIELD_PATTERN = re.compile(r'(?P<parent>\w*(\.\w*)*)\.(?P<target>\w*)')
+APPLIED_FIELD_PATTERN = re.compile(r'(\w*\.){0,1}(?P<insert_field>.*)')
+
+
+class FieldPath:
+
+    """
+    The parsed form of a dotted field chain like user.address.city, where parent is user.address,
+    target is city, root is user and applied is the chain without the root, address.city.
+    Instances are cached per field chain, so they are shared and must not be modified.
+    """
+
+    __slots__ = ('field', 'parent', 'target', 'root', 'applied')
+
+    def __init__(self, field, parent, target, root, applied):
+        self.field = field
+        self.parent = parent
+        self.target = target
+        self.root = root
+        self.applied = applied
+
+    def __repr__(self):
+        return f'FieldPath({self.field!r})'
+
+
+@lru_cache(maxsize=4096)
+def parse(field) -> FieldPath:
+    field = sys.intern(field)
+
+    parent = ''
+    target = field
+    match = SPLIT_FIELD_PATTERN.search(field)
+    if match:
+        parent = sys.intern(match.group('parent'))
+        target = sys.intern(match.group('target'))
+
+    root = sys.intern(field.split(FIELD_SEPARATOR)[0])
+    applied = sys.intern(APPLIED_FIELD_PATTERN.match(field).group('insert_field'))
+    return FieldPath(field, parent, target, root, applied)
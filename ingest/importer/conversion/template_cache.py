@@ -0,0 +1,57 @@
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_SIZE = 256
+
+
+class RowTemplateCache:
+
+    """
+    A thread safe LRU cache of compiled row templates. Keys are expected to identify the schemas,
+    the tab and the header row the template was compiled from, so that the same instance can be
+    shared by every import in a long running process.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self.max_size = max_size
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            row_template = self._templates.get(key)
+            if row_template is None:
+                self.misses = self.misses + 1
+            else:
+                self.hits = self.hits + 1
+                self._templates.move_to_end(key)
+            return row_template
+
+    def put(self, key, row_template):
+        with self._lock:
+            self._templates[key] = row_template
+            self._templates.move_to_end(key)
+            while len(self._templates) > self.max_size:
+                self._templates.popitem(last=False)
+
+    def get_or_compile(self, key, compile_template):
+        row_template = self.get(key)
+        if row_template is None:
+            # compiling happens outside the lock; concurrent misses on the same key compile the same template
+            row_template = compile_template()
+            self.put(key, row_template)
+        return row_template
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._templates)
+
+    def __contains__(self, key):
+        return key in self._templates
@@ -1,27 +1,35 @@
 import copy
 import logging
-
-from openpyxl.worksheet import Worksheet
+from typing import TYPE_CHECKING
 
 import ingest.template.schema_template as schema_template
 from ingest.api.ingestapi import IngestApi
-from ingest.importer.conversion import utils, conversion_strategy
+from ingest.importer.conversion import field_path, conversion_strategy
 from ingest.importer.conversion.column_specification import ColumnSpecification
 from ingest.importer.conversion.conversion_strategy import CellConversion, \
     ListElementCellConversion, FieldOfSingleElementListCellConversion
 from ingest.importer.conversion.metadata_entity import MetadataEntity
+from ingest.importer.conversion.template_cache import RowTemplateCache
 from ingest.importer.data_node import DataNode
 from ingest.template.schema_template import SchemaTemplate
 
+if TYPE_CHECKING:
+    from openpyxl.worksheet import Worksheet
+
 
 class TemplateManager:
 
-    def __init__(self, template:SchemaTemplate, ingest_api:IngestApi):
+    ROW_TEMPLATE = 'row_template'
+    SIMPLE_ROW_TEMPLATE = 'simple_row_template'
+
+    def __init__(self, template:SchemaTemplate, ingest_api:IngestApi, row_template_cache:RowTemplateCache=None):
         self.template = template
         self.ingest_api = ingest_api
+        self.row_template_cache = row_template_cache
+        self._schema_signature = None
         self.logger = logging.getLogger(__name__)
 
-    def create_template_node(self, worksheet: Worksheet):
+    def create_template_node(self, worksheet: 'Worksheet'):
         concrete_entity = self.get_concrete_entity_of_tab(worksheet.title)
         schema = self._get_schema(concrete_entity)
         data_node = DataNode()
@@ -29,16 +37,34 @@ class TemplateManager:
         data_node['schema_type'] = schema['domain_entity']
         return data_node
 
-    def create_row_template(self, worksheet: Worksheet):
+    def create_row_template(self, worksheet: 'Worksheet'):
+        return self._get_or_compile_row_template(self.ROW_TEMPLATE, worksheet, self._compile_row_template)
+
+    def create_simple_row_template(self, worksheet: 'Worksheet'):
+        return self._get_or_compile_row_template(self.SIMPLE_ROW_TEMPLATE, worksheet,
+                                                 self._compile_simple_row_template)
+
+    def _get_or_compile_row_template(self, template_type, worksheet, compile_template):
         tab_name = worksheet.title
+        headers = tuple(cell.value for cell in self.get_header_row(worksheet))
+
+        if self.row_template_cache is None:
+            return compile_template(tab_name, headers)
+
+        key = (self.get_schema_signature(), template_type, tab_name, headers)
+        return self.row_template_cache.get_or_compile(key, lambda: compile_template(tab_name, headers))
+
+    def get_schema_signature(self):
+        if self._schema_signature is None:
+            self._schema_signature = tuple(sorted(self.template.get_schema_urls()))
+        return self._schema_signature
+
+    def _compile_row_template(self, tab_name, headers):
         object_type = self.get_concrete_entity_of_tab(tab_name)
-        header_row = self.get_header_row(worksheet)
         cell_conversions = []
 
         header_counter = {}
-        for cell in header_row:
-            header = cell.value
-
+        for header in headers:
             if not header_counter.get(header):
                 header_counter[header] = 0
             header_counter[header] = header_counter[header] + 1
@@ -51,14 +77,11 @@ class TemplateManager:
         default_values = self._define_default_values(object_type)
         return RowTemplate(cell_conversions, default_values=default_values)
 
-    def create_simple_row_template(self, worksheet: Worksheet):
-        tab_name = worksheet.title
+    def _compile_simple_row_template(self, tab_name, headers):
         object_type = self.get_concrete_entity_of_tab(tab_name)
-        header_row = self.get_header_row(worksheet)
 
         cell_conversions = []
-        for cell in header_row:
-            header = cell.value
+        for header in headers:
             column_spec = self._define_column_spec(header, object_type)
             strategy = FieldOfSingleElementListCellConversion(column_spec.field_name,
                                                  column_spec.determine_converter())
@@ -84,10 +107,10 @@ class TemplateManager:
 
     def _define_column_spec(self, header, object_type, order_of_occurence=1):
         if header is not None:
-            parent_path, __ = utils.split_field_chain(header)
+            header_path = field_path.parse(header)
             raw_spec = self.lookup(header)
-            raw_parent_spec = self.lookup(parent_path)
-            concrete_type = utils.extract_root_field(header)
+            raw_parent_spec = self.lookup(header_path.parent)
+            concrete_type = header_path.root
             main_category = self.get_domain_entity(concrete_type)
             column_spec = ColumnSpecification.build_raw(header, object_type, main_category, raw_spec,
                                                         parent=raw_parent_spec,
@@ -161,7 +184,11 @@ class TemplateManager:
         return spec
 
 
-def build(schemas, ingest_api) -> TemplateManager:
+# shared by default across all imports in the process; row templates are keyed by schema urls
+ROW_TEMPLATE_CACHE = RowTemplateCache()
+
+
+def build(schemas, ingest_api, row_template_cache=None) -> TemplateManager:
     template = None
 
     if not schemas:
@@ -169,7 +196,7 @@ def build(schemas, ingest_api) -> TemplateManager:
     else:
         template = SchemaTemplate(ingest_api_url=ingest_api.url, list_of_schema_urls=schemas)
 
-    template_mgr = TemplateManager(template, ingest_api)
+    template_mgr = TemplateManager(template, ingest_api, row_template_cache=row_template_cache)
     return template_mgr
 
 
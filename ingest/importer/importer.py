@@ -1,15 +1,19 @@
 import json
 import logging
-import openpyxl
 
 import ingest.importer.submission
 
+from ingest.importer.checkpoint import CheckpointJournal
 from ingest.importer.conversion import template_manager
 from ingest.importer.conversion.template_manager import TemplateManager
+from ingest.importer.spreadsheet import tabular_workbook
 from ingest.importer.spreadsheet.ingest_workbook import IngestWorkbook
 from ingest.importer.submission import IngestSubmitter, EntityMap, EntityLinker
 
 
+# see WorksheetImporter._get_data_rows
+DEFAULT_MAX_CONSECUTIVE_EMPTY_ROWS = 1000
+
 format = '[%(filename)s:%(lineno)s - %(funcName)20s() ] %(asctime)s - %(name)s - %(levelname)s - %(message)s'
 logging.basicConfig(format=format)
 
@@ -18,8 +22,22 @@ class XlsImporter:
 
     # TODO why does the importer need to refer to an IngestApi instance?
     # Seems like it should be the IngestSubmitter that takes care of this detail
-    def __init__(self, ingest_api):
+    # if a checkpoint_dir is given, submissions are journaled there and importing the same file
+    # to the same submission again resumes from where the last attempt stopped; with incremental set, it also
+    # updates the entities and links that have changed in the spreadsheet since
+    def __init__(self, ingest_api, row_template_cache=template_manager.ROW_TEMPLATE_CACHE, checkpoint_dir=None,
+                 batch_size=None, max_workers=None, incremental=False, metrics=None,
+                 max_consecutive_empty_rows=DEFAULT_MAX_CONSECUTIVE_EMPTY_ROWS):
+        if incremental and not checkpoint_dir:
+            raise ValueError('An incremental import needs a checkpoint_dir.')
         self.ingest_api = ingest_api
+        self.row_template_cache = row_template_cache
+        self.checkpoint_dir = checkpoint_dir
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.incremental = incremental
+        self.metrics = metrics
+        self.max_consecutive_empty_rows = max_consecutive_empty_rows
         self.logger = logging.getLogger(__name__)
 
     def dry_run_import_file(self, file_path, project_uuid=None):
@@ -34,12 +52,13 @@ class XlsImporter:
         template_mgr = None
 
         try:
-            template_mgr = template_manager.build(ingest_workbook.get_schemas(), self.ingest_api)
+            template_mgr = template_manager.build(ingest_workbook.get_schemas(), self.ingest_api,
+                                                 row_template_cache=self.row_template_cache)
         except Exception as e:
             raise SchemaRetrievalError(
                 'An error was encountered while retrieving the schema information to process the spreadsheet.')
 
-        workbook_importer = WorkbookImporter(template_mgr)
+        workbook_importer = WorkbookImporter(template_mgr, max_consecutive_empty_rows=self.max_consecutive_empty_rows)
         spreadsheet_json = workbook_importer.do_import(ingest_workbook, project_uuid)
 
         return spreadsheet_json, template_mgr
@@ -51,7 +70,13 @@ class XlsImporter:
             spreadsheet_json, template_mgr = self._generate_spreadsheet_json(file_path, project_uuid)
             entity_map = self._process_links_from_spreadsheet(template_mgr, spreadsheet_json)
 
-            submitter = IngestSubmitter(self.ingest_api)
+            journal = None
+            if self.checkpoint_dir:
+                journal = CheckpointJournal.for_submission(self.checkpoint_dir, submission_url)
+
+            submitter = IngestSubmitter(self.ingest_api, journal=journal, batch_size=self.batch_size,
+                                         max_workers=self.max_workers, incremental=self.incremental,
+                                         metrics=self.metrics)
 
             # TODO the submission_url should be passed to the IngestSubmitter instead
             submission = submitter.submit(entity_map, submission_url)
@@ -81,9 +106,15 @@ class XlsImporter:
 
         return submission
 
+    # file_path may also be a directory of per tab CSV/TSV files, or a JSON-lines file or stream
     @staticmethod
     def _create_ingest_workbook(file_path):
-        workbook = openpyxl.load_workbook(filename=file_path, read_only=True)
+        if tabular_workbook.is_tabular_source(file_path):
+            workbook = tabular_workbook.load(file_path)
+        else:
+            # openpyxl is only needed for .xlsx files and is slow to import
+            import openpyxl
+            workbook = openpyxl.load_workbook(filename=file_path, read_only=True)
         return IngestWorkbook(workbook)
 
     @staticmethod
@@ -96,9 +127,10 @@ class XlsImporter:
 
 class WorkbookImporter:
 
-    def __init__(self, template_mgr):
-        self.worksheet_importer = IdentifiableWorksheetImporter()
+    def __init__(self, template_mgr, max_consecutive_empty_rows=DEFAULT_MAX_CONSECUTIVE_EMPTY_ROWS):
+        self.worksheet_importer = IdentifiableWorksheetImporter(max_consecutive_empty_rows=max_consecutive_empty_rows)
         self.template_mgr = template_mgr
+        self.max_consecutive_empty_rows = max_consecutive_empty_rows
         self.logger = logging.getLogger(__name__)
 
     def do_import(self, workbook: IngestWorkbook, project_uuid=None):
@@ -128,7 +160,7 @@ class WorkbookImporter:
 
     def import_project(self, workbook):
         project_worksheet = workbook.get_project_worksheet()
-        project_importer = ProjectWorksheetImporter()
+        project_importer = ProjectWorksheetImporter(max_consecutive_empty_rows=self.max_consecutive_empty_rows)
 
         project_dict = project_importer.do_import(project_worksheet, self.template_mgr)
 
@@ -136,7 +168,8 @@ class WorkbookImporter:
 
         for worksheet in workbook.module_worksheets():
             if worksheet:
-                module_importer = ModuleWorksheetImporter('project', workbook.get_module_field(worksheet.title))
+                module_importer = ModuleWorksheetImporter('project', workbook.get_module_field(worksheet.title),
+                                                          max_consecutive_empty_rows=self.max_consecutive_empty_rows)
                 records = module_importer.do_import(worksheet, self.template_mgr)
                 field_name = module_importer.property
                 project_record['content'][field_name] = list(
@@ -160,8 +193,11 @@ class WorksheetImporter:
 
     UNKNOWN_ID_PREFIX = '_unknown_'
 
-    def __init__(self):
+    MAX_CONSECUTIVE_EMPTY_ROWS = DEFAULT_MAX_CONSECUTIVE_EMPTY_ROWS
+
+    def __init__(self, max_consecutive_empty_rows=MAX_CONSECUTIVE_EMPTY_ROWS):
         self.unknown_id_ctr = 0
+        self.max_consecutive_empty_rows = max_consecutive_empty_rows
         self.logger = logging.getLogger(__name__)
         self.concrete_entity = None
 
@@ -191,21 +227,26 @@ class WorksheetImporter:
     def _is_empty_row(row):
         return all(cell.value is None for cell in row)
 
+    # Rows are streamed from the start of the data section and only up to the width of the header row.
+    # Excel writers can leave huge runs of formatted but empty rows at the end of a sheet, so reading
+    # stops at the first run of max_consecutive_empty_rows empty rows instead of sizing the whole sheet.
     def _get_data_rows(self, worksheet, template):
         header_row = template.get_header_row(worksheet)
-        max_row = self._compute_max_row(worksheet) - self.START_ROW_IDX
-        rows = worksheet.iter_rows(row_offset=self.START_ROW_IDX, max_row=max_row)
-        return [row[:len(header_row)] for row in rows if not WorksheetImporter._is_empty_row(row)]
-
-    # NOTE: there are no tests around this because it's too complicated to setup the
-    # scenario where the worksheet returns an erroneous max_row value.
-    @staticmethod
-    def _compute_max_row(worksheet):
-        max_row = worksheet.max_row
-        if max_row is None:
-            worksheet.calculate_dimension(force=True)
-            max_row = worksheet.max_row
-        return max_row
+        column_count = len(header_row)
+        rows = worksheet.iter_rows(min_row=self.START_ROW_IDX + 1, max_col=column_count or None)
+
+        empty_row_ctr = 0
+        for row_idx, row in enumerate(rows, start=self.START_ROW_IDX + 1):
+            row = row[:column_count]
+            if WorksheetImporter._is_empty_row(row):
+                empty_row_ctr = empty_row_ctr + 1
+                if empty_row_ctr >= self.max_consecutive_empty_rows:
+                    self.logger.warning(f'Stopped reading sheet {worksheet.title} at row {row_idx} after '
+                                        f'{empty_row_ctr} consecutive empty rows, any rows below are ignored.')
+                    break
+                continue
+            empty_row_ctr = 0
+            yield row
 
     def _determine_record_id(self, metadata):
         record_id = metadata.object_id
@@ -249,8 +290,8 @@ class ProjectWorksheetImporter(WorksheetImporter):
 
 
 class ModuleWorksheetImporter(WorksheetImporter):
-    def __init__(self, parent_entity, property):
-        super(ModuleWorksheetImporter, self).__init__()
+    def __init__(self, parent_entity, property, max_consecutive_empty_rows=DEFAULT_MAX_CONSECUTIVE_EMPTY_ROWS):
+        super(ModuleWorksheetImporter, self).__init__(max_consecutive_empty_rows=max_consecutive_empty_rows)
         self.parent_entity = parent_entity
         self.property = property
 
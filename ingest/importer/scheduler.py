@@ -0,0 +1,124 @@
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from ingest.utils.metrics import StageMetrics
+
+CREATE_STAGE = 'create'
+LINK_STAGE = 'link'
+
+DEFAULT_MAX_WORKERS = 8
+
+
+class SubmissionScheduler:
+
+    """
+    Runs the creates and links of a submission on one pool of workers. A link is queued as soon as both
+    of its entities exist in ingest, so linking overlaps with creating the rest of the submission instead
+    of waiting for every create to finish. At most max_pending tasks are handed to the pool at a time;
+    the rest wait in the scheduler's queues, links ahead of creates.
+
+    Tasks are submitted and their results processed on the calling thread only, so the dependency
+    bookkeeping needs no locking. A failed create stops the submission of any further creates and is
+    raised once the tasks already running have finished. A failed link is passed to link_error_handler.
+    """
+
+    def __init__(self, create, link, max_workers=DEFAULT_MAX_WORKERS, max_pending=None, link_error_handler=None):
+        self.create = create
+        self.link = link
+        self.max_workers = max_workers
+        self.max_pending = max_pending if max_pending else 2 * max_workers
+        self.link_error_handler = link_error_handler
+        self.metrics = {
+            CREATE_STAGE: StageMetrics(),
+            LINK_STAGE: StageMetrics()
+        }
+        self.logger = logging.getLogger(__name__)
+
+    @staticmethod
+    def _key(entity):
+        return entity.type, entity.id
+
+    def run(self, entity_batches, links):
+        """
+        entity_batches are lists of entities that are created by a single call to create. links are
+        (from_entity, to_entity, relationship) tuples; a link waits for its entities that are part of
+        entity_batches, any other entity is taken to exist in ingest already.
+        """
+        waiting_links_by_key = {}
+        missing_counts = {}
+        pending_keys = {self._key(entity) for batch in entity_batches for entity in batch}
+
+        ready_links = deque()
+        for link_index, link in enumerate(links):
+            from_entity, to_entity, __ = link
+            missing_keys = {self._key(entity) for entity in (from_entity, to_entity)} & pending_keys
+            if not missing_keys:
+                ready_links.append(link)
+                continue
+            missing_counts[link_index] = len(missing_keys)
+            for key in missing_keys:
+                waiting_links_by_key.setdefault(key, []).append(link_index)
+
+        ready_creates = deque(entity_batches)
+        running = {}
+        create_error = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while running or ready_links or (ready_creates and create_error is None):
+                while len(running) < self.max_pending:
+                    if ready_links:
+                        link = ready_links.popleft()
+                        running[executor.submit(self._timed, self.link, *link)] = (LINK_STAGE, link)
+                    elif ready_creates and create_error is None:
+                        batch = ready_creates.popleft()
+                        running[executor.submit(self._timed, self.create, batch)] = (CREATE_STAGE, batch)
+                    else:
+                        break
+
+                self.metrics[CREATE_STAGE].record_queued(len(ready_creates))
+                self.metrics[LINK_STAGE].record_queued(len(ready_links))
+
+                done, __ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, task = running.pop(future)
+                    duration, error = future.result()
+                    self.metrics[stage].record(duration, error=error is not None)
+
+                    if stage == LINK_STAGE:
+                        if error is not None:
+                            self._handle_link_error(task, error)
+                        continue
+
+                    if error is not None:
+                        create_error = create_error or error
+                        continue
+
+                    for entity in task:
+                        for link_index in waiting_links_by_key.pop(self._key(entity), []):
+                            missing_counts[link_index] -= 1
+                            if missing_counts[link_index] == 0:
+                                ready_links.append(links[link_index])
+
+        self.logger.info(f'Submission scheduler finished: {self.metrics}')
+
+        if create_error is not None:
+            raise create_error
+
+    @staticmethod
+    def _timed(task, *args):
+        start = time.perf_counter()
+        try:
+            task(*args)
+        except Exception as error:
+            return time.perf_counter() - start, error
+        return time.perf_counter() - start, None
+
+    def _handle_link_error(self, link, error):
+        if self.link_error_handler:
+            self.link_error_handler(*link, error)
+        else:
+            from_entity, to_entity, relationship = link
+            self.logger.error(f'{from_entity.type} {from_entity.id} could not be linked to {to_entity.type} '
+                              f'{to_entity.id} ({relationship}): {error}')
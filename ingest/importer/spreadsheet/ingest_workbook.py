@@ -1,4 +1,7 @@
-from openpyxl import Workbook
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from openpyxl import Workbook
 
 SCHEMAS_WORKSHEET = 'Schemas'
 PROJECT_WORKSHEET = 'Project'
@@ -28,7 +31,7 @@ MODULE_TABS = {
 
 class IngestWorkbook:
 
-    def __init__(self, workbook: Workbook):
+    def __init__(self, workbook: 'Workbook'):
         self.workbook = workbook
 
     def get_project_worksheet(self):
@@ -0,0 +1,155 @@
+import csv
+import json
+import os
+
+CSV_EXTENSION = '.csv'
+TSV_EXTENSION = '.tsv'
+JSON_LINES_EXTENSIONS = ['.jsonl', '.ndjson']
+
+DELIMITERS = {
+    CSV_EXTENSION: ',',
+    TSV_EXTENSION: '\t'
+}
+
+TAB_FIELD = 'tab'
+ROW_FIELD = 'row'
+
+
+class TabularCell:
+
+    def __init__(self, value):
+        self.value = value
+
+
+class TabularWorksheet:
+
+    """
+    A worksheet backed by plain rows of values, exposing the subset of the openpyxl worksheet
+    interface that the importer uses. Row indices are 1-based, like in openpyxl, so the same
+    header conventions apply to CSV/TSV files and JSON-lines records.
+    """
+
+    def __init__(self, title, rows=None):
+        self.title = title
+        self._rows = []
+        for row in (rows or []):
+            self.append(row)
+
+    def append(self, values):
+        self._rows.append(tuple(TabularCell(_normalise_value(value)) for value in values))
+
+    @property
+    def max_row(self):
+        return len(self._rows)
+
+    @property
+    def max_column(self):
+        return max([len(row) for row in self._rows], default=0)
+
+    def calculate_dimension(self, force=False):
+        return f'{self.max_row}:{self.max_column}'
+
+    def iter_rows(self, min_row=None, max_row=None, min_col=None, max_col=None, row_offset=0):
+        min_row = (min_row or 1) + row_offset
+        max_row = (max_row or self.max_row) + row_offset
+        min_col = min_col or 1
+        for row in self._rows[min_row - 1:max_row]:
+            if max_col is not None:
+                row = row[:max_col] + tuple(TabularCell(None) for __ in range(max_col - len(row)))
+            yield row[min_col - 1:]
+
+
+class TabularWorkbook:
+
+    def __init__(self, worksheets=None):
+        self._worksheets = {}
+        for worksheet in (worksheets or []):
+            self._worksheets[worksheet.title] = worksheet
+
+    @property
+    def sheetnames(self):
+        return list(self._worksheets.keys())
+
+    def get_sheet_names(self):
+        return self.sheetnames
+
+    def get_sheet_by_name(self, name):
+        return self._worksheets.get(name)
+
+    def create_sheet(self, title):
+        worksheet = TabularWorksheet(title)
+        self._worksheets[title] = worksheet
+        return worksheet
+
+    def __getitem__(self, name):
+        return self._worksheets[name]
+
+    def __contains__(self, name):
+        return name in self._worksheets
+
+
+def is_tabular_source(source):
+    if hasattr(source, 'read'):
+        return True
+    if os.path.isdir(source):
+        return True
+    __, extension = os.path.splitext(source)
+    return extension.lower() in JSON_LINES_EXTENSIONS
+
+
+def load(source) -> TabularWorkbook:
+    if hasattr(source, 'read') or not os.path.isdir(source):
+        return load_json_lines(source)
+    return load_csv_directory(source)
+
+
+def load_csv_directory(directory) -> TabularWorkbook:
+    workbook = TabularWorkbook()
+    for file_name in sorted(os.listdir(directory)):
+        title, extension = os.path.splitext(file_name)
+        delimiter = DELIMITERS.get(extension.lower())
+        if delimiter is None:
+            continue
+        worksheet = workbook.create_sheet(title)
+        with open(os.path.join(directory, file_name), newline='', encoding='utf-8-sig') as tab_file:
+            for values in csv.reader(tab_file, delimiter=delimiter):
+                worksheet.append(values)
+    return workbook
+
+
+def load_json_lines(source) -> TabularWorkbook:
+    if hasattr(source, 'read'):
+        return _read_json_lines(source)
+    with open(source, encoding='utf-8') as json_lines_file:
+        return _read_json_lines(json_lines_file)
+
+
+def _read_json_lines(stream) -> TabularWorkbook:
+    workbook = TabularWorkbook()
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        if not isinstance(record, dict) or TAB_FIELD not in record or ROW_FIELD not in record:
+            raise InvalidJsonLinesRecord(line_number)
+        title = record[TAB_FIELD]
+        worksheet = workbook.get_sheet_by_name(title)
+        if worksheet is None:
+            worksheet = workbook.create_sheet(title)
+        worksheet.append(record[ROW_FIELD])
+    return workbook
+
+
+def _normalise_value(value):
+    # empty cells are read as None from xlsx workbooks
+    if value == '':
+        return None
+    return value
+
+
+class InvalidJsonLinesRecord(Exception):
+    def __init__(self, line_number):
+        message = f'Line {line_number} is not a record with "{TAB_FIELD}" and "{ROW_FIELD}" fields.'
+        super(InvalidJsonLinesRecord, self).__init__(message)
+        self.line_number = line_number
@@ -1,68 +1,224 @@
-import json
 import logging
+import sys
+from collections import namedtuple
+
+from ingest.importer import checkpoint, scheduler
+from ingest.utils.metrics import Metrics, ENTITIES_CREATED, ENTITIES_UPDATED, LINKS_CREATED, LINKS_REMOVED
+
+# the parts of an entity's ingest document kept after it has been created or resolved
+INGEST_JSON_KEYS = ['_links', 'uuid']
+
+# (from entity type, to entity type) of the links that can be made in a spreadsheet, except those to processes
+VALID_SPREADSHEET_LINKS = frozenset([
+    ('biomaterial', 'biomaterial'),
+    ('file', 'biomaterial'),
+    ('file', 'file'),
+    ('biomaterial', 'process'),
+    ('biomaterial', 'protocol'),
+    ('file', 'process'),
+    ('file', 'protocol'),
+])
+
+
+
+def generated_process_id(output_entity):
+    """
+    The id of a process that the spreadsheet does not define. It is derived from the process's output rather
+    than from the order of the rows, so that it stays the same in the journal of an incremental import when
+    rows are inserted or reordered, and when the inputs change so that the stale input links can be removed.
+    """
+    return 'process_' + checkpoint.content_hash({'output': [output_entity.type, output_entity.id]})
+
 
 format = '[%(filename)s:%(lineno)s - %(funcName)20s() ] %(asctime)s - %(name)s - %(levelname)s - %(message)s'
 logging.basicConfig(format=format)
 
 class IngestSubmitter(object):
 
-    def __init__(self, ingest_api):
+    # if a batch_size is given, new entities are created batch_size at a time through Submission.add_entities
+    # if max_workers is given, creates and links are run concurrently by a SubmissionScheduler
+    # if incremental is set, entities in the journal whose content has changed since they were submitted are
+    # updated in ingest and journaled links that are no longer in the spreadsheet are removed
+    # progress, counts and request timings are recorded in metrics and reported to its sinks
+    def __init__(self, ingest_api, journal=None, batch_size=None, max_workers=None, incremental=False,
+                 metrics=None):
         # TODO the IngestSubmitter should probably build its own instance of IngestApi
+        if incremental and journal is None:
+            raise ValueError('An incremental submission needs the journal of the previous submission.')
         self.ingest_api = ingest_api
+        self.journal = journal
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.incremental = incremental
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.stage_metrics = None
         self.logger = logging.getLogger(__name__)
 
     def submit(self, entity_map, submission_url):
-        submission = Submission(self.ingest_api, submission_url)
-        submission.define_manifest(entity_map)
+        submission = Submission(self.ingest_api, submission_url, metrics=self.metrics)
+        self._define_manifest(entity_map, submission)
 
         entities = entity_map.get_entities()
 
-        self._add_entities(entities, submission)
+        if self.incremental:
+            self._update_changed_entities(entities, submission)
+            self._remove_stale_links(entities, entity_map, submission)
 
-        self._link_submission_to_project(entity_map, submission, submission_url)
+        pending_entities = self._pending_entities(entities)
+        links = list(self._pending_links(entities, entity_map))
+        submission_link = self._submission_link(entity_map, submission_url)
+        self.metrics.expect(ENTITIES_CREATED, len(pending_entities))
+        self.metrics.expect(LINKS_CREATED, len(links) + (1 if submission_link else 0))
+
+        if self.max_workers:
+            self._schedule(pending_entities, links, submission_link, submission)
+        else:
+            self._add_entities(pending_entities, submission)
+            if submission_link:
+                self._link_entity(submission, *submission_link)
+            self._link_entities(links, submission)
 
-        self._link_entities(entities, entity_map, submission)
+        self.metrics.report_progress(force=True)
+        self.metrics.flush()
 
         return submission
 
-    def _link_submission_to_project(self, entity_map, submission, submission_url):
+    def _schedule(self, pending_entities, links, submission_link, submission):
+        self._resolve_references(submission, links)
+        if submission_link:
+            links.insert(0, submission_link)
+
+        submission_scheduler = scheduler.SubmissionScheduler(
+            lambda batch: self._create_batch(submission, batch),
+            lambda from_entity, to_entity, relationship: self._link_entity(submission, from_entity, to_entity,
+                                                                           relationship),
+            max_workers=self.max_workers,
+            link_error_handler=self._log_link_error
+        )
+        self.stage_metrics = submission_scheduler.metrics
+        submission_scheduler.run(self._batches(pending_entities), links)
+
+    def _define_manifest(self, entity_map, submission):
+        if self.journal is not None and self.journal.is_done(checkpoint.MANIFEST_STEP):
+            return
+        submission.define_manifest(entity_map)
+        if self.journal is not None:
+            self.journal.record_step(checkpoint.MANIFEST_STEP)
+
+    def _submission_link(self, entity_map, submission_url):
         project = entity_map.get_project()
-        submission_envelope = self.ingest_api.getSubmissionEnvelope(submission_url)
         submission_entity = Entity('submission_envelope',
                                    submission_url,
                                    None,
-                                   is_reference=True,
-                                   ingest_json=submission_envelope
+                                   is_reference=True
                                    )
-        submission.link_entity(project, submission_entity, 'submissionEnvelopes')
+        if self.journal is not None and self.journal.is_linked(project, submission_entity, 'submissionEnvelopes'):
+            return None
+        submission_entity.ingest_json = self.ingest_api.getSubmissionEnvelope(submission_url)
+        return project, submission_entity, 'submissionEnvelopes'
 
-    def _link_entities(self, entities, entity_map, submission):
+    @staticmethod
+    def _links(entities, entity_map):
         for entity in entities:
             for link in entity.direct_links:
-                to_entity = entity_map.get_entity(link['entity'], link['id'])
-                try:
-                    submission.link_entity(entity, to_entity, relationship=link['relationship'])
-                except Exception as link_error:
-                    error_message = f'''The {entity.type} with id {entity.id} could not be 
+                yield entity, entity_map.get_entity(link.entity, link.id), link.relationship
+
+    def _pending_links(self, entities, entity_map):
+        for entity, to_entity, relationship in self._links(entities, entity_map):
+            if self.journal is not None and self.journal.is_linked(entity, to_entity, relationship):
+                continue
+            yield entity, to_entity, relationship
+
+    def _update_changed_entities(self, entities, submission):
+        for entity in entities:
+            if entity.is_reference or not self.journal.restore_entity(entity):
+                continue
+            if self.journal.is_changed(entity):
+                submission.update_entity(entity)
+                self.journal.record_entity(entity)
+
+    def _remove_stale_links(self, entities, entity_map, submission):
+        current_link_keys = {checkpoint.link_key(*link) for link in self._links(entities, entity_map)}
+        stale_links = []
+        for from_type, from_id, relationship, to_type, to_id in self.journal.get_link_keys() - current_link_keys:
+            if relationship == 'submissionEnvelopes':
+                continue
+            from_entity = entity_map.get_entity(from_type, from_id)
+            to_entity = entity_map.get_entity(to_type, to_id)
+            if not from_entity or not to_entity:
+                self.logger.warning(f'Not removing the link from {from_type} {from_id} to {to_type} {to_id}, '
+                                    f'one of them is no longer in the spreadsheet.')
+                continue
+            stale_links.append((from_entity, to_entity, relationship))
+
+        self._resolve_references(submission, stale_links)
+        for from_entity, to_entity, relationship in stale_links:
+            submission.unlink_entity(from_entity, to_entity, relationship=relationship)
+            self.journal.record_unlink(from_entity, to_entity, relationship)
+
+    @staticmethod
+    def _resolve_references(submission, links):
+        submission.resolve_references(entity for from_entity, to_entity, __ in links
+                                      for entity in (from_entity, to_entity))
+
+    def _link_entities(self, links, submission):
+        self._resolve_references(submission, links)
+        for entity, to_entity, relationship in links:
+            try:
+                self._link_entity(submission, entity, to_entity, relationship)
+            except Exception as link_error:
+                self._log_link_error(entity, to_entity, relationship, link_error)
+
+    def _log_link_error(self, from_entity, to_entity, relationship, link_error):
+        error_message = f'''The {from_entity.type} with id {from_entity.id} could not be 
                     linked to {to_entity.type} with id {to_entity.id}.'''
-                    self.logger.error(error_message)
-                    self.logger.error(f'{str(link_error)}')
+        self.logger.error(error_message)
+        self.logger.error(f'{str(link_error)}')
 
-    def _add_entities(self, entities, submission):
+    def _link_entity(self, submission, from_entity, to_entity, relationship):
+        submission.link_entity(from_entity, to_entity, relationship=relationship)
+        if self.journal is not None:
+            self.journal.record_link(from_entity, to_entity, relationship)
+
+    def _pending_entities(self, entities):
+        pending_entities = []
         for entity in entities:
             if not entity.is_reference:
-                submission.add_entity(entity)
+                if self.journal is not None and self.journal.restore_entity(entity):
+                    continue
+                pending_entities.append(entity)
+        return pending_entities
+
+    def _batches(self, pending_entities):
+        if not self.batch_size:
+            return [[entity] for entity in pending_entities]
+        return [pending_entities[start:start + self.batch_size]
+                for start in range(0, len(pending_entities), self.batch_size)]
+
+    def _create_batch(self, submission, batch):
+        if self.batch_size:
+            submission.add_entities(batch)
+        else:
+            submission.add_entity(batch[0])
+        if self.journal is not None:
+            for entity in batch:
+                self.journal.record_entity(entity)
+
+    def _add_entities(self, pending_entities, submission):
+        for batch in self._batches(pending_entities):
+            self._create_batch(submission, batch)
 
 
 class EntityLinker(object):
 
     def __init__(self, template_manager):
         self.template_manager = template_manager
-        self.process_id_ctr = 0
 
     def process_links_from_spreadsheet(self, entity_map):
-        for entity in entity_map.get_entities():
-            self._validate_entity_links(entity_map, entity)
+        self._validate_links(entity_map)
+
+        # processes are added to the map while linking, so iterate over the entities loaded so far
+        for entity in list(entity_map.get_entities()):
             self._generate_direct_links(entity_map, entity)
 
         return entity_map
@@ -76,18 +232,10 @@ class EntityLinker(object):
 
         if project and not entity.type == 'project':
             if entity.type != 'protocol' and entity.type != 'file':
-                entity.direct_links.append({
-                    'entity': 'project',
-                    'id': project.id,
-                    'relationship': 'projects'
-                })
+                entity.add_direct_link('project', project.id, 'projects')
 
         if project and entity.concrete_type == 'supplementary_file':
-            project.direct_links.append({
-                'entity': 'file',
-                'id': entity.id,
-                'relationship': 'supplementaryFiles'
-            })
+            project.add_direct_link('file', entity.id, 'supplementaryFiles')
 
         links_by_entity = entity.links_by_entity
 
@@ -100,71 +248,51 @@ class EntityLinker(object):
 
         if linked_biomaterial_ids or linked_file_ids:
 
-            linking_process = self.link_process(entity_map, linked_process_id, linking_details)
-            linking_process.direct_links.append({
-                'entity': 'project',
-                'id': project.id,
-                'relationship': 'projects'
-            })
+            if not linked_process_id:
+                linked_process_id = generated_process_id(entity)
+            linking_process = self.create_or_get_process(entity_map, linked_process_id, linking_details)
+            linking_process.add_direct_link('project', project.id, 'projects')
             entity_map.add_entity(linking_process)
 
             # link output of process
-            entity.direct_links.append({
-                'entity': linking_process.type,
-                'id': linking_process.id,
-                'relationship': 'derivedByProcesses'
-            })
+            entity.add_direct_link(linking_process.type, linking_process.id, 'derivedByProcesses')
 
             # apply all protocols to the linking process
             for linked_protocol_id in linked_protocol_ids:
-                linking_process.direct_links.append({
-                    'entity': 'protocol',
-                    'id': linked_protocol_id,
-                    'relationship': 'protocols'
-                })
+                linking_process.add_direct_link('protocol', linked_protocol_id, 'protocols')
 
             # biomaterial-biomaterial
             # file-biomaterial
             for linked_biomaterial_id in linked_biomaterial_ids:
                 linked_biomaterial_entity = entity_map.get_entity('biomaterial', linked_biomaterial_id)
-                linked_biomaterial_entity.direct_links.append({
-                    'entity': linking_process.type,
-                    'id': linking_process.id,
-                    'relationship': 'inputToProcesses'
-                })
+                linked_biomaterial_entity.add_direct_link(linking_process.type, linking_process.id, 'inputToProcesses')
 
             # file-file
             for linked_file_id in linked_file_ids:
                 linked_file_entity = entity_map.get_entity('file', linked_file_id)
-                linked_file_entity.direct_links.append({
-                    'entity': linking_process.type,
-                    'id': linking_process.id,
-                    'relationship': 'inputToProcesses'
-                })
-
-    def link_process(self, entity_map, linked_process_id, linking_details):
-        if not linked_process_id:
-            linked_process_id = self._generate_empty_process_id()
-
-        linking_process = self.create_or_get_process(entity_map, linked_process_id, linking_details)
-
-        return linking_process
-
-    def _validate_entity_links(self, entity_map, entity):
-        links_by_entity = entity.links_by_entity
+                linked_file_entity.add_direct_link(linking_process.type, linking_process.id, 'inputToProcesses')
 
-        for link_entity_type, link_entity_ids in links_by_entity.items():
-            for link_entity_id in link_entity_ids:
-                if not link_entity_type == 'process':  # it is expected that no processes are defined in any tab, these will be created later
-                    if not self._is_valid_spreadsheet_link(entity.type, link_entity_type):
-                        raise InvalidLinkInSpreadsheet(entity, link_entity_type, link_entity_id)
-                    if not entity_map.get_entity(link_entity_type, link_entity_id):
-                        raise LinkedEntityNotFound(entity, link_entity_type, link_entity_id)
-                    if not entity_map.get_entity(link_entity_type, link_entity_id):
-                        raise LinkedEntityNotFound(entity, link_entity_type, link_entity_id)
+    def _validate_links(self, entity_map):
+        ids_by_type = {entity_type: entities_dict.keys()
+                       for entity_type, entities_dict in entity_map.entities_dict_by_type.items()}
+        errors = []
 
-                if link_entity_type == 'process' and not len(link_entity_ids) == 1:
-                    raise MultipleProcessesFound(entity, link_entity_ids)
+        for entity in entity_map.get_entities():
+            for link_entity_type, link_entity_ids in entity.links_by_entity.items():
+                # it is expected that no processes are defined in any tab, these will be created later
+                if link_entity_type == 'process':
+                    if len(link_entity_ids) > 1:
+                        errors.append(MultipleProcessesFound(entity, link_entity_ids))
+                elif (entity.type, link_entity_type) not in VALID_SPREADSHEET_LINKS:
+                    errors.extend(InvalidLinkInSpreadsheet(entity, link_entity_type, link_entity_id)
+                                  for link_entity_id in link_entity_ids)
+                else:
+                    known_ids = ids_by_type.get(link_entity_type, frozenset())
+                    errors.extend(LinkedEntityNotFound(entity, link_entity_type, link_entity_id)
+                                  for link_entity_id in link_entity_ids if link_entity_id not in known_ids)
+
+        if errors:
+            raise InvalidSpreadsheetLinks(errors)
 
     def create_or_get_process(self, entity_map, process_id, linking_details):
         process = entity_map.get_entity('process', process_id)
@@ -174,21 +302,6 @@ class EntityLinker(object):
 
         return process
 
-    @staticmethod
-    def _is_valid_spreadsheet_link(from_entity_type, to_entity_type):
-        VALID_ENTITY_LINKS_MAP = [
-            'biomaterial-biomaterial',
-            'file-biomaterial',
-            'file-file',
-            'biomaterial-process',
-            'biomaterial-protocol',
-            'file-process',
-            'file-protocol',
-        ]
-        link_key = from_entity_type + '-' + to_entity_type
-
-        return link_key in VALID_ENTITY_LINKS_MAP
-
     def create_process(self, process_id, linking_details):
         schema_type = 'process'
         described_by = self.template_manager.get_schema_url(schema_type)
@@ -216,17 +329,26 @@ class EntityLinker(object):
 
         return process
 
-    def _generate_empty_process_id(self):
-        self.process_id_ctr += 1
 
-        return 'process_id_' + str(self.process_id_ctr)
+class DirectLink(namedtuple('DirectLink', ['entity', 'id', 'relationship'])):
+
+    __slots__ = ()
+
+    @staticmethod
+    def of(link):
+        if isinstance(link, DirectLink):
+            return link
+        return DirectLink(sys.intern(link['entity']), link['id'], sys.intern(link['relationship']))
 
 
 class Entity(object):
 
+    __slots__ = ['type', 'id', 'content', 'links_by_entity', 'direct_links', 'linking_details', 'ingest_json',
+                 'is_reference', 'concrete_type']
+
     def __init__(self, entity_type, entity_id, content, ingest_json=None, links_by_entity=None,
                  direct_links=None, is_reference=False, linking_details=None, concrete_type=None):
-        self.type = entity_type
+        self.type = sys.intern(entity_type)
         self.id = entity_id
         self.content = content
         self._prepare_links_by_entity(links_by_entity)
@@ -244,13 +366,26 @@ class Entity(object):
     def _prepare_direct_links(self, direct_links):
         self.direct_links = []
         if direct_links is not None:
-            self.direct_links.extend(direct_links)
+            self.direct_links.extend(DirectLink.of(link) for link in direct_links)
 
     def _prepare_linking_details(self, linking_details):
         self.linking_details = {}
         if linking_details is not None:
             self.linking_details.update(linking_details)
 
+    def add_direct_link(self, entity_type, entity_id, relationship):
+        self.direct_links.append(DirectLink(sys.intern(entity_type), entity_id, sys.intern(relationship)))
+
+
+def trim_ingest_json(ingest_json):
+    """
+    Keeps only the parts of an ingest document that are needed after it is created: its links, which are
+    used to link it to other entities, and its uuid.
+    """
+    if not ingest_json:
+        return ingest_json
+    return {key: ingest_json[key] for key in INGEST_JSON_KEYS if key in ingest_json}
+
 
 class Submission(object):
 
@@ -262,10 +397,11 @@ class Submission(object):
         'project': 'projects'
     }
 
-    def __init__(self, ingest_api, submission_url):
+    def __init__(self, ingest_api, submission_url, metrics=None):
         self.ingest_api = ingest_api
         self.submission_url = submission_url
         self.metadata_dict = {}
+        self.metrics = metrics if metrics is not None else Metrics()
 
     def get_submission_url(self):
         return self.submission_url
@@ -276,52 +412,111 @@ class Submission(object):
         # TODO: how to get filename?!!!
         if entity.type == 'file':
             file_name = entity.content['file_core']['file_name']
-            response = self.ingest_api.createFile(self.submission_url, file_name, json.dumps(entity.content))
+            response = self.ingest_api.createFile(self.submission_url, file_name, entity.content)
         elif entity.type == 'project':
-            response = self.ingest_api.createProject(self.submission_url, json.dumps(entity.content))
+            response = self.ingest_api.createProject(self.submission_url, entity.content)
         else:
-            response = self.ingest_api.createEntity(self.submission_url, json.dumps(entity.content), link_name)
+            response = self.ingest_api.createEntity(self.submission_url, entity.content, link_name)
 
-        entity.ingest_json = response
+        entity.ingest_json = trim_ingest_json(response)
         self.metadata_dict[entity.type + '.' + entity.id] = entity
+        self.metrics.increment(ENTITIES_CREATED, entity_type=entity.type)
+        self.metrics.report_progress()
 
         return entity
 
+    def add_entities(self, entities):
+        entities_by_type = {}
+        for entity in entities:
+            # files are created through their own file name endpoint and the project needs the token
+            if entity.type == 'file' or entity.type == 'project':
+                self.add_entity(entity)
+            else:
+                entities_by_type.setdefault(entity.type, []).append(entity)
+
+        for entity_type, entities_of_type in entities_by_type.items():
+            responses = self.ingest_api.createEntities(self.submission_url, self.ENTITY_LINK[entity_type],
+                                                       [entity.content for entity in entities_of_type])
+            for entity, response in zip(entities_of_type, responses):
+                entity.ingest_json = trim_ingest_json(response)
+                self.metadata_dict[entity.type + '.' + entity.id] = entity
+            self.metrics.increment(ENTITIES_CREATED, len(entities_of_type), entity_type=entity_type)
+            self.metrics.report_progress()
+
+        return entities
+
     def get_entity(self, entity_type, id):
         key = entity_type + '.' + id
         return self.metadata_dict[key]
 
-    def link_entity(self, from_entity, to_entity, relationship):
-        if from_entity.is_reference and not from_entity.ingest_json:
-            from_entity.ingest_json = self.ingest_api.getEntityByUuid(self.ENTITY_LINK[from_entity.type], from_entity.id)
+    def resolve_references(self, entities):
+        """
+        Retrieves the ingest documents of reference entities that don't have them yet, concurrently and
+        once per uuid, so that linking them does not wait on a lookup per link.
+        """
+        unresolved_by_type = {}
+        for entity in entities:
+            if entity.is_reference and not entity.ingest_json and entity.type in self.ENTITY_LINK:
+                unresolved_by_type.setdefault(entity.type, []).append(entity)
+
+        for entity_type, unresolved_entities in unresolved_by_type.items():
+            ingest_json_by_uuid = self.ingest_api.getEntitiesByUuid(
+                self.ENTITY_LINK[entity_type], [entity.id for entity in unresolved_entities])
+            for entity in unresolved_entities:
+                entity.ingest_json = trim_ingest_json(ingest_json_by_uuid.get(entity.id))
+
+    def update_entity(self, entity):
+        response = self.ingest_api.patchEntity(entity.ingest_json, {'content': entity.content})
+        entity.ingest_json = trim_ingest_json(response)
+        self.metadata_dict[entity.type + '.' + entity.id] = entity
+        self.metrics.increment(ENTITIES_UPDATED, entity_type=entity.type)
+
+        return entity
+
+    def _resolve_reference(self, entity):
+        if entity.is_reference and not entity.ingest_json:
+            entity.ingest_json = trim_ingest_json(
+                self.ingest_api.getEntityByUuid(self.ENTITY_LINK[entity.type], entity.id))
 
-        if to_entity.is_reference and not to_entity.ingest_json:
-            to_entity.ingest_json = self.ingest_api.getEntityByUuid(self.ENTITY_LINK[to_entity.type], to_entity.id)
+    def link_entity(self, from_entity, to_entity, relationship):
+        self._resolve_reference(from_entity)
+        self._resolve_reference(to_entity)
 
         from_entity_ingest = from_entity.ingest_json
         to_entity_ingest = to_entity.ingest_json
         self.ingest_api.linkEntity(from_entity_ingest, to_entity_ingest, relationship)
+        self.metrics.increment(LINKS_CREATED, relationship=relationship)
+        self.metrics.report_progress()
+
+    def unlink_entity(self, from_entity, to_entity, relationship):
+        self._resolve_reference(from_entity)
+        self._resolve_reference(to_entity)
+        self.ingest_api.unlinkEntity(from_entity.ingest_json, to_entity.ingest_json, relationship)
+        self.metrics.increment(LINKS_REMOVED, relationship=relationship)
 
     def define_manifest(self, entity_map):
         total_count = entity_map.count_total()
 
-        # TODO provide a better way to serialize
-        manifest_json = json.dumps({
-            'totalCount': entity_map.count_total(),
+        manifest = {
+            'totalCount': total_count,
             'expectedBiomaterials': entity_map.count_entities_of_type('biomaterial'),
             'expectedProcesses': entity_map.count_entities_of_type('process'),
             'expectedFiles': entity_map.count_entities_of_type('file'),
             'expectedProtocols': entity_map.count_entities_of_type('protocol'),
             'expectedProjects': entity_map.count_entities_of_type('project')
-        })
+        }
 
-        self.ingest_api.createSubmissionManifest(self.submission_url, manifest_json)
+        self.ingest_api.createSubmissionManifest(self.submission_url, manifest)
 
 
 class EntityMap(object):
 
     def __init__(self, *entities):
         self.entities_dict_by_type = {}
+        self._new_count_by_type = {}
+        self._reference_count_by_type = {}
+        self._total_count = 0
+        self._project = None
         if entities is not None:
             for entity in entities:
                 self.add_entity(entity)
@@ -371,23 +566,10 @@ class EntityMap(object):
         return list(self.entities_dict_by_type.keys())
 
     def get_entities_of_type(self, type):
-        entities = []
-
-        entities_dict = self.entities_dict_by_type.get(type, {})
-
-        for entity_id, entity in entities_dict.items():
-            entities.append(entity)
-
-        return entities
+        return EntityView(self, entity_type=type)
 
     def get_new_entities_of_type(self, type):
-        entities = []
-        entities_dict = self.entities_dict_by_type.get(type, {})
-        for entity_id, entity in entities_dict.items():
-            if not entity.is_reference:
-                entities.append(entity)
-
-        return entities
+        return EntityView(self, entity_type=type, new_only=True)
 
     def get_entity(self, type, id):
         if self.entities_dict_by_type.get(type) and self.entities_dict_by_type[type].get(id):
@@ -398,31 +580,81 @@ class EntityMap(object):
         if not entities_of_type:
             self.entities_dict_by_type[entity.type] = {}
             entities_of_type = self.entities_dict_by_type.get(entity.type)
+
+        replaced_entity = entities_of_type.get(entity.id)
+        if replaced_entity is not None:
+            self._update_count(replaced_entity, -1)
+
         entities_of_type[entity.id] = entity
+        self._update_count(entity, 1)
+
+        if entity.type == 'project' and (self._project is None or self._project is replaced_entity):
+            self._project = entity
+
+    def _update_count(self, entity, delta):
+        count_by_type = self._reference_count_by_type if entity.is_reference else self._new_count_by_type
+        count_by_type[entity.type] = count_by_type.get(entity.type, 0) + delta
+        self._total_count = self._total_count + delta
 
     def get_entities(self):
-        all_entities = []
-        for entity_type, entities_dict in self.entities_dict_by_type.items():
-            all_entities.extend(entities_dict.values())
-        return all_entities
+        return EntityView(self)
 
     def get_new_entities(self):
-        all_entities = []
-        for entity_type, entities_dict in self.entities_dict_by_type.items():
-            for entity_id, entity in entities_dict.items():
-                if not entity.is_reference:
-                    all_entities.append(entity)
-        return all_entities
+        return EntityView(self, new_only=True)
 
     def get_project(self):
-        project_id = list(self.entities_dict_by_type.get('project').keys())[0]
-        return self.get_entity('project', project_id)
+        return self._project
 
     def count_total(self):
-        return len(self.get_entities())
+        return self._total_count
 
     def count_entities_of_type(self, type):
-        return len(self.get_new_entities_of_type(type))
+        return self._new_count_by_type.get(type, 0)
+
+    def count_reference_entities_of_type(self, type):
+        return self._reference_count_by_type.get(type, 0)
+
+
+class EntityView(object):
+
+    """
+    A live, re-iterable view over the entities of an EntityMap, optionally restricted to a type
+    and to new (non-reference) entities. Nothing is copied, so the map must not be modified while
+    iterating the view; take a list of it first if entities are to be added along the way.
+    """
+
+    def __init__(self, entity_map, entity_type=None, new_only=False):
+        self.entity_map = entity_map
+        self.entity_type = entity_type
+        self.new_only = new_only
+
+    def __iter__(self):
+        entities_dict_by_type = self.entity_map.entities_dict_by_type
+        if self.entity_type is None:
+            entities_dicts = entities_dict_by_type.values()
+        else:
+            entities_dicts = [entities_dict_by_type.get(self.entity_type, {})]
+
+        for entities_dict in entities_dicts:
+            for entity in entities_dict.values():
+                if not (self.new_only and entity.is_reference):
+                    yield entity
+
+    def __len__(self):
+        entity_map = self.entity_map
+        if self.entity_type is None:
+            if self.new_only:
+                return sum(entity_map._new_count_by_type.values())
+            return entity_map.count_total()
+
+        count = entity_map.count_entities_of_type(self.entity_type)
+        if not self.new_only:
+            count = count + entity_map.count_reference_entities_of_type(self.entity_type)
+        return count
+
+    def __bool__(self):
+        return len(self) > 0
+
 
 class Error(Exception):
     def __init__(self, code, message):
@@ -464,3 +696,11 @@ class MultipleProcessesFound(Error):
         self.process_ids = process_ids
         self.from_entity = from_entity
 
+
+class InvalidSpreadsheetLinks(Error):
+    def __init__(self, errors):
+        message = f'{len(errors)} invalid links were found in the spreadsheet: ' + \
+                  ' '.join(error.message for error in errors)
+        super(InvalidSpreadsheetLinks, self).__init__('InvalidSpreadsheetLinks', message)
+        self.errors = errors
+
@@ -9,16 +9,18 @@ __license__ = "Apache 2.0"
 __date__ = "01/05/2018"
 
 from datetime import datetime
-from yaml import dump as yaml_dump
-from yaml import load as yaml_load
 from ingest.utils import doctict
 from ingest.template.tabs import TabConfig
-from ingest.api.ingestapi import IngestApi
 import json
-import jsonref
 import re
 import urllib.request
 
+# yaml, jsonref and the API clients are imported where they are used, so that importing the template
+# package stays cheap for the importer and the command line tools
+
+HIGH_LEVEL_ENTITY_PATTERN = re.compile(r"http[s]?://[^/]*/([^/]*)/")
+DOMAIN_ENTITY_PATTERN = re.compile(
+    r"http[s]?://[^/]*/[^/]*/(?P<domain_entity>.*)/(((\d+\.)?(\d+\.)?(\*|\d+))|(latest))/.*")
 
 
 class SchemaTemplate:
@@ -55,7 +57,8 @@ class SchemaTemplate:
         return self.schema_urls
 
     def get_latest_submittable_schemas(self, ingest_api_url):
-        ingest_api = IngestApi(url=ingest_api_url)
+        import ingest.api.clients as clients
+        ingest_api = clients.get_ingest_api(ingest_api_url)
         urls = []
         for schema in ingest_api.get_schemas(high_level_entity="type", latest_only=True):
             url = schema["_links"]["json-schema"]["href"]
@@ -76,6 +79,7 @@ class SchemaTemplate:
                     except:
                         print("Failed to read schema from " + uri)
                     self._parser._load_schema(data)
+        self._parser.build_property_index()
         return self
 
     def get_tabs_config(self, ):
@@ -83,8 +87,8 @@ class SchemaTemplate:
 
     def lookup(self, key):
         try:
-            return self.get(self._template["meta_data_properties"], key)
-        except:
+            return self._parser.lookup_property(key)
+        except (KeyError, TypeError):
             raise UnknownKeyException(
                 "Can't map the key to a known JSON schema property: " + str(key))
 
@@ -109,6 +113,7 @@ class SchemaTemplate:
         :return: void
         '''
         self._template["meta_data_properties"][property] = value
+        self._parser.invalidate_property_index()
 
     def set_label_mappings(self, dict):
         '''
@@ -120,7 +125,8 @@ class SchemaTemplate:
         self._template["labels"] = dict
 
     def yaml_dump(self, tabs_only=False):
-        return yaml_dump(yaml_load(self.json_dump(tabs_only)), default_flow_style=False)
+        import yaml
+        return yaml.dump(yaml.load(self.json_dump(tabs_only)), default_flow_style=False)
 
     def json_dump(self, tabs_only=False):
         if tabs_only:
@@ -168,15 +174,40 @@ class SchemaParser:
 
         self._key_lookup = {}
 
+        # flat index of every dotted path in the template, e.g. donor_organism.biomaterial_core.schema.url
+        self._property_index = None
+
     def _load_schema(self, json_schema):
         """load a JSON schema representation"""
         # use jsonrefs to resolve all $refs in json
+        import jsonref
         data = jsonref.loads(json.dumps(json_schema))
         return self.__initialise_template(data)
 
     def key_lookup(self, key):
         return self._key_lookup[key]
 
+    def lookup_property(self, key):
+        if self._property_index is None:
+            self.build_property_index()
+        return self._property_index[key]
+
+    def build_property_index(self):
+        """build a flat index from dotted path to value over all properties in the template"""
+        self._property_index = {}
+        self._index_properties(None, self.schema_template.get_template())
+        return self._property_index
+
+    def invalidate_property_index(self):
+        self._property_index = None
+
+    def _index_properties(self, path, node):
+        for key, value in node.items():
+            key_path = f'{path}.{key}' if path else key
+            self._property_index[key_path] = value
+            if isinstance(value, dict):
+                self._index_properties(key_path, value)
+
     def __initialise_template(self, data):
 
         self._collect_required_properties(data)
@@ -212,6 +243,7 @@ class SchemaParser:
             new_path =  self._get_path(path, property_name)
             property = self._extract_property(property_block, property_name=property_name, key=new_path)
             doctict.put(self.schema_template.get_template(), new_path, property)
+            self.invalidate_property_index()
             self._recursive_fill_properties(new_path, property_block)
 
     def _collect_required_properties(self, data):
@@ -318,13 +350,11 @@ class SchemaParser:
         return None
 
     def get_high_level_entity_from_url(self, url):
-        pattern = re.compile("http[s]?://[^/]*/([^/]*)/")
-        match = pattern.search(url)
+        match = HIGH_LEVEL_ENTITY_PATTERN.search(url)
         return match.group(1)
 
     def get_domain_entity_from_url(self, url):
-        pattern = re.compile("http[s]?://[^/]*/[^/]*/(?P<domain_entity>.*)/(((\d+\.)?(\d+\.)?(\*|\d+))|(latest))/.*")
-        match = pattern.search(url)
+        match = DOMAIN_ENTITY_PATTERN.search(url)
         return match.group(1) if match else None
 
     def get_module_from_url(self, url):
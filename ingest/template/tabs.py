@@ -6,7 +6,6 @@ __author__ = "jupp"
 __license__ = "Apache 2.0"
 __date__ = "04/05/2018"
 
-from yaml import load as yaml_load
 from ingest.utils import doctict
 from ingest.utils.doctict import DotDict
 
@@ -19,6 +18,7 @@ class TabConfig:
             self._index()
 
     def load(self, input):
+        from yaml import load as yaml_load
         stream = open(input, 'r').read()
         yaml = yaml_load(stream)
         self._dic = DotDict(yaml)
@@ -0,0 +1,285 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DEFAULT_PROGRESS_INTERVAL = 10.0
+
+HTTP_REQUEST_SECONDS = 'http_request_seconds'
+HTTP_REQUEST_ERRORS = 'http_request_errors'
+HTTP_REQUESTS_IN_FLIGHT = 'http_requests_in_flight'
+HTTP_RETRIES = 'http_retries'
+
+CONCURRENCY_LIMIT = 'concurrency_limit'
+REQUESTS_IN_FLIGHT = 'requests_in_flight'
+CIRCUIT_OPEN = 'circuit_open'
+CIRCUIT_REJECTIONS = 'circuit_rejections'
+
+ENTITIES_CREATED = 'entities_created'
+ENTITIES_UPDATED = 'entities_updated'
+LINKS_CREATED = 'links_created'
+LINKS_REMOVED = 'links_removed'
+
+PROGRESS_EVENT = 'progress'
+
+
+class Histogram:
+
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                self.bucket_counts[index] += 1
+                break
+
+    def cumulative_counts(self):
+        total = 0
+        for bucket_count in self.bucket_counts:
+            total += bucket_count
+            yield total
+
+
+class StageMetrics:
+
+    """
+    Counts and times the items handled by one stage of a concurrent import or export.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.max_queued = 0
+
+    def record(self, duration, error=False):
+        self.count += 1
+        if error:
+            self.errors += 1
+        self.total_time += duration
+        self.max_time = max(self.max_time, duration)
+
+    def record_queued(self, queued):
+        self.max_queued = max(self.max_queued, queued)
+
+    def mean_time(self):
+        return self.total_time / self.count if self.count else 0.0
+
+    def __repr__(self):
+        return f'StageMetrics(count={self.count}, errors={self.errors}, total_time={self.total_time:.3f}, ' \
+               f'mean_time={self.mean_time():.3f}, max_time={self.max_time:.3f}, max_queued={self.max_queued})'
+
+
+class Metrics:
+
+    """
+    Counters, gauges and latency histograms of a submission, plus the events that are passed on to
+    its sinks. Metric values are keyed by name and a sorted tuple of label pairs. Safe to use from the
+    worker threads of a submission.
+    """
+
+    def __init__(self, sinks=None, progress_interval=DEFAULT_PROGRESS_INTERVAL):
+        self.sinks = list(sinks) if sinks else []
+        self.progress_interval = progress_interval
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.expected_totals = {}
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+        self._last_progress_at = None
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def increment(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def add_to_gauge(self, name, amount, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.gauges[key] = self.gauges.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.gauges[key] = value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counters), dict(self.gauges), dict(self.histograms)
+
+    def count(self, name):
+        with self._lock:
+            return sum(value for (counter_name, __), value in self.counters.items() if counter_name == name)
+
+    @contextmanager
+    def time_request(self, endpoint):
+        self.add_to_gauge(HTTP_REQUESTS_IN_FLIGHT, 1)
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.increment(HTTP_REQUEST_ERRORS, endpoint=endpoint)
+            raise
+        finally:
+            self.observe(HTTP_REQUEST_SECONDS, time.perf_counter() - start, endpoint=endpoint)
+            self.add_to_gauge(HTTP_REQUESTS_IN_FLIGHT, -1)
+
+    def expect(self, name, total):
+        with self._lock:
+            self.expected_totals[name] = total
+
+    def progress(self):
+        elapsed = time.monotonic() - self._started_at
+        progress = {'elapsed_seconds': elapsed}
+        remaining_work = 0
+        done_work = 0
+        for name, total in list(self.expected_totals.items()):
+            done = self.count(name)
+            progress[name] = done
+            progress[f'{name}_expected'] = total
+            progress[f'{name}_per_second'] = done / elapsed if elapsed else 0.0
+            done_work += done
+            remaining_work += max(total - done, 0)
+
+        # estimated from the overall rate of the work done so far
+        progress['eta_seconds'] = remaining_work * elapsed / done_work if done_work else None
+        return progress
+
+    def report_progress(self, force=False):
+        now = time.monotonic()
+        with self._lock:
+            if not force and self._last_progress_at is not None and \
+                    now - self._last_progress_at < self.progress_interval:
+                return
+            self._last_progress_at = now
+        self.emit(PROGRESS_EVENT, **self.progress())
+        for sink in self.sinks:
+            if sink.flush_on_progress:
+                sink.flush(self)
+
+    def emit(self, event, **fields):
+        for sink in self.sinks:
+            sink.handle_event(event, fields)
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush(self)
+
+
+class LoggingSink:
+
+    flush_on_progress = False
+
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger if logger else logging.getLogger(__name__)
+        self.level = level
+
+    def handle_event(self, event, fields):
+        self.logger.log(self.level, f'{event}: {fields}')
+
+    def flush(self, metrics):
+        counters, __, histograms = metrics.snapshot()
+        for (name, labels), value in sorted(counters.items()):
+            self.logger.log(self.level, f'{name}{dict(labels)}: {value}')
+        for (name, labels), histogram in sorted(histograms.items()):
+            mean = histogram.sum / histogram.count if histogram.count else 0.0
+            self.logger.log(self.level, f'{name}{dict(labels)}: count={histogram.count}, mean={mean:.4f}s')
+
+
+class CallbackSink:
+
+    flush_on_progress = False
+
+    def __init__(self, event_callback, flush_callback=None):
+        self.event_callback = event_callback
+        self.flush_callback = flush_callback
+
+    def handle_event(self, event, fields):
+        self.event_callback(event, fields)
+
+    def flush(self, metrics):
+        if self.flush_callback:
+            self.flush_callback(metrics)
+
+
+class PrometheusTextFileSink:
+
+    """
+    Writes the metrics in the Prometheus text format, for the textfile collector of the node exporter.
+    The file is replaced on every flush, including the one after each progress report.
+    """
+
+    flush_on_progress = True
+
+    def __init__(self, path, prefix='ingest_'):
+        self.path = path
+        self.prefix = prefix
+
+    def handle_event(self, event, fields):
+        pass
+
+    def flush(self, metrics):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with tempfile.NamedTemporaryFile('w', dir=directory, delete=False, encoding='utf-8') as text_file:
+            text_file.write(self.format(metrics))
+        os.replace(text_file.name, self.path)
+
+    @staticmethod
+    def _labels(labels, **extra_labels):
+        label_pairs = list(labels) + list(extra_labels.items())
+        if not label_pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{value}"' for name, value in label_pairs) + '}'
+
+    def format(self, metrics):
+        lines = []
+        counters, gauges, histograms = (sorted(values.items()) for values in metrics.snapshot())
+
+        typed_names = set()
+
+        def declare(name, metric_type):
+            if name not in typed_names:
+                typed_names.add(name)
+                lines.append(f'# TYPE {self.prefix}{name} {metric_type}')
+
+        for (name, labels), value in counters:
+            declare(f'{name}_total', 'counter')
+            lines.append(f'{self.prefix}{name}_total{self._labels(labels)} {value}')
+        for (name, labels), value in gauges:
+            declare(name, 'gauge')
+            lines.append(f'{self.prefix}{name}{self._labels(labels)} {value}')
+        for (name, labels), histogram in histograms:
+            declare(name, 'histogram')
+            for upper_bound, count in zip(histogram.buckets, histogram.cumulative_counts()):
+                lines.append(f'{self.prefix}{name}_bucket{self._labels(labels, le=upper_bound)} {count}')
+            lines.append(f'{self.prefix}{name}_bucket{self._labels(labels, le="+Inf")} {histogram.count}')
+            lines.append(f'{self.prefix}{name}_sum{self._labels(labels)} {histogram.sum}')
+            lines.append(f'{self.prefix}{name}_count{self._labels(labels)} {histogram.count}')
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,70 @@
+"""
+JSON serialization of request payloads. Uses orjson or ujson when one of them is installed and falls back
+to the standard library otherwise.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+STDLIB_BACKEND = 'json'
+COMPACT_SEPARATORS = (',', ':')
+ORJSON_BACKEND = 'orjson'
+UJSON_BACKEND = 'ujson'
+
+
+def _available_backend():
+    if orjson is not None:
+        return ORJSON_BACKEND
+    if ujson is not None:
+        return UJSON_BACKEND
+    return STDLIB_BACKEND
+
+
+backend = _available_backend()
+
+
+def set_backend(name):
+    global backend
+    if name not in [STDLIB_BACKEND, ORJSON_BACKEND, UJSON_BACKEND]:
+        raise ValueError(f'Unknown JSON backend {name}.')
+    if name == ORJSON_BACKEND and orjson is None or name == UJSON_BACKEND and ujson is None:
+        raise ValueError(f'JSON backend {name} is not installed.')
+    backend = name
+
+
+def dumps(document):
+    """
+    Serializes the document compactly for a request body. The result is str or, with orjson, UTF-8 encoded bytes.
+    """
+    try:
+        if backend == ORJSON_BACKEND:
+            return orjson.dumps(document)
+        if backend == UJSON_BACKEND:
+            return ujson.dumps(document, escape_forward_slashes=False)
+    except (TypeError, OverflowError):
+        # e.g. integers beyond 64 bits, which only the standard library serializes
+        pass
+    return json.dumps(document, separators=COMPACT_SEPARATORS)
+
+
+def to_payload(document):
+    """
+    Returns the request body for a document given either as a dict or as already serialized JSON.
+    """
+    if isinstance(document, (str, bytes)):
+        return document
+    return dumps(document)
+
+
+def to_dict(document):
+    if isinstance(document, (str, bytes)):
+        return json.loads(document)
+    return document
@@ -9,5 +9,6 @@ setup(
     version = '0.4',
     packages = find_packages(exclude=['tests', 'tests.*']),
     install_requires = install_requires,
+    extras_require = {'fast-json': ['orjson']},
     include_package_data = True
 )
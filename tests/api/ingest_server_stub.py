@@ -0,0 +1,77 @@
+import json
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+
+# http.server.ThreadingHTTPServer is only available from Python 3.7
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class IngestServerStub:
+
+    """
+    A local stand-in for the entity collections of an ingest submission. Every POST is counted;
+    a POST to <collection>/bulk creates all documents in its JSON array body, unless the stub was
+    started with bulk_create=False, in which case it answers 404 like an ingest without bulk support.
+    Connections are kept alive; the client port of each POST is recorded to check connection reuse.
+    """
+
+    def __init__(self, bulk_create=True):
+        self.bulk_create = bulk_create
+        self.post_paths = []
+        self.client_ports = []
+        self.created_documents = []
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                stub.post_paths.append(self.path)
+                stub.client_ports.append(self.client_address[1])
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+
+                if self.path.endswith('/bulk'):
+                    if not stub.bulk_create:
+                        self._reply(404, {})
+                        return
+                    self._reply(201, [stub._create(document) for document in body])
+                else:
+                    self._reply(201, stub._create(body))
+
+            def _reply(self, status, body):
+                content = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _create(self, document):
+        self.created_documents.append(document)
+        return {'content': document}
@@ -0,0 +1,69 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from mock import patch
+
+import ingest.api.clients as clients
+import ingest.api.ingestapi as ingestapi
+
+
+class ClientsTest(TestCase):
+
+    def setUp(self):
+        clients.clear()
+
+    def tearDown(self):
+        clients.clear()
+
+    @patch('ingest.api.ingestapi.IngestApi.get_root_url')
+    def test_get_ingest_api_shared_by_url(self, get_root_url):
+        # given:
+        get_root_url.return_value = {}
+
+        # when:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            ingest_apis = list(executor.map(clients.get_ingest_api, ['http://ingest'] * 8))
+        other_ingest_api = clients.get_ingest_api('http://other-ingest')
+
+        # then:
+        self.assertTrue(all(ingest_api is ingest_apis[0] for ingest_api in ingest_apis))
+        self.assertEqual('http://ingest', ingest_apis[0].url)
+        self.assertIsNot(ingest_apis[0], other_ingest_api)
+        self.assertEqual(2, get_root_url.call_count)
+
+    def test_get_staging_api_shared(self):
+        # expect:
+        self.assertIs(clients.get_staging_api('http://upload'), clients.get_staging_api('http://upload'))
+
+    @patch('ingest.api.ingestapi.IngestApi.get_root_url')
+    def test_clear(self, get_root_url):
+        # given:
+        get_root_url.return_value = {}
+        ingest_api = clients.get_ingest_api('http://ingest')
+
+        # when:
+        clients.clear()
+
+        # then:
+        self.assertIsNot(ingest_api, clients.get_ingest_api('http://ingest'))
+
+    @patch('ingest.api.ingestapi.IngestApi.get_root_url')
+    def test_shared_ingest_api_has_no_token(self, get_root_url):
+        # given:
+        get_root_url.return_value = {}
+        ingest_api = clients.get_ingest_api('http://ingest')
+
+        # when:
+        first_client = ingest_api.with_token('first token')
+        second_client = ingest_api.with_token('second token')
+
+        # then:
+        self.assertEqual('first token', first_client.token)
+        self.assertEqual('second token', second_client.token)
+        self.assertIsNone(ingest_api.token)
+        self.assertIs(ingest_api.session, first_client.session)
+        first_client.set_token('other token')
+
+        # and:
+        with self.assertRaises(ingestapi.Error):
+            ingest_api.set_token('token')
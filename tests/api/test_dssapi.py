@@ -0,0 +1,198 @@
+import json
+from unittest import TestCase
+
+import requests
+from mock import MagicMock, patch
+
+from ingest.api.dssapi import DssApi, ServiceAccountAuth, Error, DssFileNotFoundError
+from ingest.api.flowcontrol import FlowControl, CircuitOpenError
+from ingest.api.retrypolicy import RetryPolicy
+
+mock_dss_url = 'http://mockdss.com'
+
+
+def _response(status_code, body=None, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(body if body is not None else {}).encode('utf-8')
+    response.headers.update(headers if headers else {})
+    return response
+
+
+class DssApiTest(TestCase):
+
+    def setUp(self):
+        self.session = MagicMock()
+        self.dss_api = DssApi(mock_dss_url, retry_policy=RetryPolicy(sleep=MagicMock()),
+                              flow_control=FlowControl('dss'), session=self.session)
+
+    def test_put_file(self):
+        # given:
+        self.session.put.return_value = _response(201, {'version': 'v1'})
+        file = {'name': 'name', 'url': 'source_url', 'dss_uuid': 'file_uuid', 'update_date': 'version'}
+
+        # when:
+        created_file = self.dss_api.put_file('bundle_uuid', file)
+
+        # then:
+        self.assertEqual({'version': 'v1'}, created_file)
+        self.session.put.assert_called_once_with(f'{mock_dss_url}/v1/files/file_uuid', params={'version': 'version'},
+                                                 json={
+                                                     'bundle_uuid': 'bundle_uuid',
+                                                     'creator_uid': 8008,
+                                                     'source_url': 'source_url'
+                                                 }, headers=self.dss_api.headers, auth=self.dss_api.auth)
+
+    def test_put_file_retries_server_error(self):
+        # given:
+        self.session.put.side_effect = [_response(503), _response(201, {'version': 'v1'})]
+        file = {'name': 'name', 'url': 'source_url', 'dss_uuid': 'file_uuid'}
+
+        # when:
+        created_file = self.dss_api.put_file('bundle_uuid', file)
+
+        # then:
+        self.assertEqual({'version': 'v1'}, created_file)
+        self.assertEqual(2, self.session.put.call_count)
+
+    def test_requests_are_timed_by_endpoint(self):
+        # given:
+        self.session.put.side_effect = [_response(503), _response(201, {'version': 'v1'})]
+        file = {'name': 'name', 'url': 'source_url', 'dss_uuid': 'file_uuid'}
+
+        # when:
+        self.dss_api.put_file('bundle_uuid', file)
+
+        # then:
+        counters, __, histograms = self.dss_api.metrics.snapshot()
+        self.assertEqual(2, histograms[('http_request_seconds', (('endpoint', 'put_file'),))].count)
+        self.assertEqual(1, counters[('http_request_errors', (('endpoint', 'put_file'),))])
+
+    def test_put_file_client_error(self):
+        # given:
+        self.session.put.return_value = _response(400)
+        file = {'name': 'name', 'url': 'source_url', 'dss_uuid': 'file_uuid'}
+
+        # expect:
+        with self.assertRaises(Error):
+            self.dss_api.put_file('bundle_uuid', file)
+        self.assertEqual(1, self.session.put.call_count)
+
+    def test_put_bundle(self):
+        # given:
+        self.session.put.return_value = _response(201, {'bundle_uuid': 'bundle_uuid', 'version': 'v1'})
+        files = [{'uuid': 'file_uuid', 'version': 'v1', 'name': 'name', 'indexed': True}]
+
+        # when:
+        bundle = self.dss_api.put_bundle('bundle_uuid', files)
+
+        # then:
+        self.assertEqual('v1', bundle['version'])
+        args, kwargs = self.session.put.call_args
+        self.assertEqual(f'{mock_dss_url}/v1/bundles/bundle_uuid', args[0])
+        self.assertEqual('aws', kwargs['params']['replica'])
+        self.assertEqual({'files': files, 'creator_uid': 8008}, kwargs['json'])
+
+    def test_writes_are_authenticated(self):
+        # given:
+        credentials = MagicMock(valid=True, token='service_account_token')
+        self.dss_api.auth = ServiceAccountAuth(credentials=credentials)
+        self.session.put.return_value = _response(201, {'version': 'v1'})
+
+        # when:
+        self.dss_api.put_file('bundle_uuid', {'name': 'name', 'url': 'source_url', 'dss_uuid': 'file_uuid'})
+
+        # then:
+        auth = self.session.put.call_args[1]['auth']
+        request = auth(requests.Request('PUT', f'{mock_dss_url}/v1/files/file_uuid').prepare())
+        self.assertEqual('Bearer service_account_token', request.headers['Authorization'])
+
+    def test_expired_token_is_refreshed(self):
+        # given:
+        credentials = MagicMock(valid=False, token='new_token')
+        auth = ServiceAccountAuth(credentials=credentials)
+
+        # when:
+        with patch.dict('sys.modules', {'google.auth.transport.requests': MagicMock()}):
+            token = auth.token()
+
+        # then:
+        self.assertEqual('new_token', token)
+        credentials.refresh.assert_called_once()
+
+    def test_unauthorized_put_is_not_retried(self):
+        # given:
+        self.session.put.return_value = _response(401)
+
+        # expect:
+        with self.assertRaises(Error):
+            self.dss_api.put_file('bundle_uuid', {'name': 'name', 'url': 'source_url', 'dss_uuid': 'file_uuid'})
+        self.assertEqual(1, self.session.put.call_count)
+
+    def test_head_file_not_found(self):
+        # given:
+        self.session.head.return_value = _response(404)
+
+        # expect:
+        with self.assertRaises(DssFileNotFoundError):
+            self.dss_api.head_file('file_uuid', version='v1')
+        self.session.head.assert_called_once_with(f'{mock_dss_url}/v1/files/file_uuid',
+                                                  params={'replica': 'aws', 'version': 'v1'})
+
+    def test_head_file_retries_server_errors(self):
+        # given:
+        self.session.head.side_effect = [_response(503), requests.ConnectionError('reset'), _response(200)]
+
+        # when:
+        response = self.dss_api.head_file('file_uuid', version='v1')
+
+        # then:
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(3, self.session.head.call_count)
+
+    def test_is_transient_error(self):
+        # given:
+        self.session.head.return_value = _response(403)
+
+        # when:
+        with self.assertRaises(Error) as forbidden:
+            self.dss_api.head_file('file_uuid')
+
+        # then:
+        self.assertFalse(self.dss_api.is_transient_error(forbidden.exception))
+
+        # given:
+        self.session.head.return_value = _response(503)
+
+        # when:
+        with self.assertRaises(Error) as unavailable:
+            self.dss_api.head_file('file_uuid')
+
+        # then:
+        self.assertTrue(self.dss_api.is_transient_error(unavailable.exception))
+        self.assertTrue(self.dss_api.is_transient_error(CircuitOpenError('open')))
+
+    def test_head_files(self):
+        # given:
+        def head(url, params):
+            if url.endswith('missing'):
+                return _response(404)
+            return _response(200, headers={'X-DSS-VERSION': params.get('version', 'latest')})
+
+        self.session.head.side_effect = head
+
+        # when:
+        responses = self.dss_api.head_files([('file_1', 'v1'), ('missing', None), ('file_2', None)])
+
+        # then:
+        self.assertEqual('v1', responses[0].headers['X-DSS-VERSION'])
+        self.assertIsNone(responses[1])
+        self.assertEqual('latest', responses[2].headers['X-DSS-VERSION'])
+
+    def test_head_files_raises_errors_other_than_not_found(self):
+        # given:
+        self.session.head.return_value = _response(403)
+
+        # expect:
+        with self.assertRaises(Error):
+            self.dss_api.head_files([('file_1', 'v1')])
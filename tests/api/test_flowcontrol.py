@@ -0,0 +1,271 @@
+import threading
+from unittest import TestCase
+
+import requests
+from mock import MagicMock
+
+from ingest.api import flowcontrol
+from ingest.api.flowcontrol import AdaptiveConcurrencyLimiter, CircuitBreaker, FlowControl, CircuitOpenError, \
+    CLOSED, OPEN, HALF_OPEN
+from ingest.utils.metrics import Metrics, CONCURRENCY_LIMIT, CIRCUIT_OPEN, CIRCUIT_REJECTIONS
+
+
+def _response(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return response
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class AdaptiveConcurrencyLimiterTest(TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = AdaptiveConcurrencyLimiter(initial_limit=4, max_limit=5, clock=self.clock)
+
+    def _request(self, latency=1.0, overloaded=False, endpoint=None):
+        started_at = self.limiter.acquire()
+        self.clock.now += latency
+        self.limiter.release(started_at, overloaded=overloaded, endpoint=endpoint)
+
+    def test_success_increases_limit_additively(self):
+        # when:
+        for __ in range(4):
+            self._request()
+
+        # then:
+        self.assertTrue(4.9 < self.limiter.limit < 5.0)
+
+        # and:
+        for __ in range(10):
+            self._request()
+        self.assertEqual(5, self.limiter.limit)
+
+    def test_overload_decreases_limit_multiplicatively(self):
+        # when:
+        self._request(overloaded=True)
+
+        # then:
+        self.assertEqual(2, self.limiter.limit)
+
+        # and:
+        for __ in range(5):
+            self._request(overloaded=True)
+        self.assertEqual(1, self.limiter.limit)
+
+    def test_overloads_from_the_same_round_decrease_limit_once(self):
+        # given:
+        started_ats = [self.limiter.acquire() for __ in range(4)]
+        self.clock.now += 1.0
+
+        # when:
+        for started_at in started_ats:
+            self.limiter.release(started_at, overloaded=True)
+
+        # then:
+        self.assertEqual(2, self.limiter.limit)
+        self.assertEqual(0, self.limiter.in_flight)
+
+    def test_latency_spike_decreases_limit(self):
+        # given:
+        self._request(latency=1.0)
+        limit = self.limiter.limit
+
+        # when:
+        self._request(latency=10.0)
+
+        # then:
+        self.assertEqual(limit / 2, self.limiter.limit)
+
+    def test_latency_is_compared_per_endpoint(self):
+        # given:
+        self._request(latency=1.0, endpoint='getEntityByUuid')
+        self._request(latency=10.0, endpoint='put_file')
+        limit = self.limiter.limit
+
+        # when:
+        self._request(latency=12.0, endpoint='put_file')
+
+        # then:
+        self.assertLess(limit, self.limiter.limit)
+
+        # and:
+        self._request(latency=10.0, endpoint='getEntityByUuid')
+        self.assertLess(self.limiter.limit, limit)
+
+    def test_acquire_waits_for_free_slot(self):
+        # given:
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=1)
+        started_at = limiter.acquire()
+        acquired = threading.Event()
+
+        def acquire():
+            limiter.acquire()
+            acquired.set()
+
+        waiting_thread = threading.Thread(target=acquire)
+        waiting_thread.start()
+
+        # expect:
+        self.assertFalse(acquired.wait(0.05))
+        limiter.release(started_at)
+        self.assertTrue(acquired.wait(1))
+        waiting_thread.join()
+
+
+class CircuitBreakerTest(TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.circuit_breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10.0, clock=self.clock)
+
+    def test_opens_after_consecutive_failures(self):
+        # when:
+        self.circuit_breaker.record_failure()
+        self.circuit_breaker.record_success()
+        self.circuit_breaker.record_failure()
+
+        # then:
+        self.assertTrue(self.circuit_breaker.allow())
+
+        # when:
+        self.circuit_breaker.record_failure()
+
+        # then:
+        self.assertEqual(OPEN, self.circuit_breaker.state)
+        self.assertFalse(self.circuit_breaker.allow())
+
+    def test_half_open_lets_one_trial_through(self):
+        # given:
+        self.circuit_breaker.record_failure()
+        self.circuit_breaker.record_failure()
+        self.clock.now += 10.0
+
+        # expect:
+        self.assertTrue(self.circuit_breaker.allow())
+        self.assertEqual(HALF_OPEN, self.circuit_breaker.state)
+        self.assertFalse(self.circuit_breaker.allow())
+
+        # when:
+        self.circuit_breaker.record_success()
+
+        # then:
+        self.assertEqual(CLOSED, self.circuit_breaker.state)
+        self.assertTrue(self.circuit_breaker.allow())
+
+    def test_failed_trial_opens_circuit_again(self):
+        # given:
+        self.circuit_breaker.record_failure()
+        self.circuit_breaker.record_failure()
+        self.clock.now += 10.0
+        self.circuit_breaker.allow()
+
+        # when:
+        self.circuit_breaker.record_failure()
+
+        # then:
+        self.assertEqual(OPEN, self.circuit_breaker.state)
+        self.assertFalse(self.circuit_breaker.allow())
+
+
+class FlowControlTest(TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics()
+        self.flow_control = FlowControl('ingest', limiter=AdaptiveConcurrencyLimiter(initial_limit=4),
+                                        circuit_breaker=CircuitBreaker(failure_threshold=2),
+                                        metrics=self.metrics)
+
+    def _gauge(self, name):
+        __, gauges, __ = self.metrics.snapshot()
+        return gauges[(name, (('backend', 'ingest'),))]
+
+    def test_call_returns_response(self):
+        # given:
+        func = MagicMock(return_value=_response(200))
+
+        # when:
+        response = self.flow_control.call(func, 'url', endpoint='getFile', headers={})
+
+        # then:
+        self.assertEqual(200, response.status_code)
+        func.assert_called_once_with('url', headers={})
+        self.assertEqual(4, self._gauge(CONCURRENCY_LIMIT))
+        self.assertEqual(0, self._gauge(CIRCUIT_OPEN))
+
+    def test_overloaded_backend_opens_circuit(self):
+        # given:
+        func = MagicMock(side_effect=[_response(503), requests.ConnectionError(), _response(200)])
+
+        # when:
+        self.flow_control.call(func)
+        with self.assertRaises(requests.ConnectionError):
+            self.flow_control.call(func)
+
+        # then:
+        self.assertEqual(1, self._gauge(CONCURRENCY_LIMIT))
+        self.assertEqual(1, self._gauge(CIRCUIT_OPEN))
+
+        # and:
+        with self.assertRaises(CircuitOpenError):
+            self.flow_control.call(func)
+        self.assertEqual(2, func.call_count)
+        self.assertEqual(1, self.metrics.count(CIRCUIT_REJECTIONS))
+
+    def test_client_errors_are_not_overload(self):
+        # given:
+        error = requests.HTTPError(response=_response(404))
+        func = MagicMock(side_effect=[error, error, error])
+
+        # when:
+        for __ in range(3):
+            with self.assertRaises(requests.HTTPError):
+                self.flow_control.call(func)
+
+        # then:
+        self.assertEqual(CLOSED, self.flow_control.circuit_breaker.state)
+
+    def test_internal_server_errors_are_not_overload(self):
+        # given:
+        func = MagicMock(side_effect=[_response(500), _response(500), _response(500)])
+
+        # when:
+        for __ in range(3):
+            self.flow_control.call(func)
+
+        # then:
+        self.assertEqual(CLOSED, self.flow_control.circuit_breaker.state)
+        self.assertEqual(0, self.flow_control.circuit_breaker.failures)
+
+    def test_for_backend_is_shared(self):
+        # expect:
+        self.assertIs(flowcontrol.for_backend('test-backend', 'http://test'),
+                      flowcontrol.for_backend('test-backend', 'http://test'))
+
+    def test_for_backend_is_per_base_url(self):
+        # expect:
+        self.assertIsNot(flowcontrol.for_backend('test-backend', 'http://test'),
+                         flowcontrol.for_backend('test-backend', 'http://other-test'))
+
+    def test_for_backend_reports_to_every_client(self):
+        # given:
+        first_metrics = Metrics()
+        second_metrics = Metrics()
+        flow_control = flowcontrol.for_backend('reporting-backend', 'http://test', first_metrics)
+        flowcontrol.for_backend('reporting-backend', 'http://test', second_metrics)
+
+        # when:
+        flow_control.call(MagicMock(return_value=_response(200)))
+
+        # then:
+        for metrics in (flow_control.metrics, first_metrics, second_metrics):
+            __, gauges, __ = metrics.snapshot()
+            self.assertEqual(0, gauges[(CIRCUIT_OPEN, (('backend', 'reporting-backend'),))])
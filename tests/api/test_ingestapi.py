@@ -4,11 +4,13 @@ from unittest.mock import patch
 from mock import MagicMock
 
 from ingest.api.ingestapi import IngestApi
+from tests.api.ingest_server_stub import IngestServerStub
 
 import json
 
 mock_ingest_api_url = "http://mockingestapi.com"
 mock_submission_envelope_id = "mock-envelope-id"
+mock_submission_url = mock_ingest_api_url + "/" + mock_submission_envelope_id
 
 
 class IngestApiTest(TestCase):
@@ -34,7 +36,7 @@ class IngestApiTest(TestCase):
                 }
             }
 
-            with patch('ingest.api.ingestapi.requests.post') as mock_post:
+            with patch.object(ingestapi.session, 'post') as mock_post:
 
                 def mock_post_side_effect(*args, **kwargs):
                     mock_response = {}
@@ -68,7 +70,7 @@ class IngestApiTest(TestCase):
 
             mock_get_url_for_link.side_effect = mock_get_url_for_link_patch
 
-            with patch('ingest.api.ingestapi.requests.get') as mock_requests_get:
+            with patch.object(ingestapi.session, 'get') as mock_requests_get:
                 def mock_get_side_effect(*args, **kwargs):
                     mock_response = {}
                     mock_response_payload = {}
@@ -94,4 +96,90 @@ class IngestApiTest(TestCase):
 
                 mock_requests_get.side_effect = mock_get_side_effect
 
-                assert 'uuid' in ingestapi.getSubmissionByUuid(mock_submission_uuid)
\ No newline at end of file
+                assert 'uuid' in ingestapi.getSubmissionByUuid(mock_submission_uuid)
+
+    def test_create_entities_in_bulk(self):
+        # given:
+        server = IngestServerStub().start()
+        self.addCleanup(server.stop)
+        ingestapi = self._ingest_api_for(server)
+
+        # when:
+        documents = [{'name': f'biomaterial_{index}'} for index in range(5)]
+        created = ingestapi.createEntities(mock_submission_url, 'biomaterials', documents, chunk_size=2)
+
+        # then:
+        self.assertEqual(documents, [entity['content'] for entity in created])
+        self.assertEqual(['/submission/biomaterials/bulk'] * 3, server.post_paths)
+
+    def test_create_entities_without_bulk_endpoint(self):
+        # given:
+        server = IngestServerStub(bulk_create=False).start()
+        self.addCleanup(server.stop)
+        ingestapi = self._ingest_api_for(server)
+
+        # when:
+        documents = [{'name': f'biomaterial_{index}'} for index in range(5)]
+        created = ingestapi.createEntities(mock_submission_url, 'biomaterials', documents, chunk_size=2)
+
+        # then: the bulk endpoint is tried only once
+        self.assertEqual(documents, [entity['content'] for entity in created])
+        self.assertEqual(['/submission/biomaterials/bulk'] + ['/submission/biomaterials'] * 5, server.post_paths)
+
+    def test_requests_reuse_connection(self):
+        # given:
+        server = IngestServerStub().start()
+        self.addCleanup(server.stop)
+        ingestapi = self._ingest_api_for(server)
+
+        # when:
+        for index in range(3):
+            ingestapi.createEntity(mock_submission_url, {'name': f'biomaterial_{index}'}, 'biomaterials')
+
+        # then:
+        self.assertEqual(3, len(server.post_paths))
+        self.assertEqual(1, len(set(server.client_ports)))
+
+    def test_get_url_for_link_cached(self):
+        # given:
+        ingestapi = IngestApi(mock_ingest_api_url, ingest_api_root=dict())
+        response = MagicMock()
+        response.status_code = 200
+        response.text = json.dumps({'_links': {'findByUuid': {'href': 'search/findByUuid'}}})
+
+        # when:
+        with patch.object(ingestapi.session, 'get', return_value=response) as mock_get:
+            urls = [ingestapi._get_url_for_link('search', 'findByUuid') for __ in range(3)]
+
+        # then:
+        self.assertEqual(['search/findByUuid'] * 3, urls)
+        mock_get.assert_called_once()
+
+    @staticmethod
+    def _ingest_api_for(server):
+        ingestapi = IngestApi(server.url, ingest_api_root=dict())
+        ingestapi.submission_links[mock_submission_url] = {
+            'biomaterials': {
+                'href': server.url + '/submission/biomaterials'
+            }
+        }
+        return ingestapi
+
+    def test_get_entities_by_uuid(self):
+        # given:
+        ingestapi = IngestApi(mock_ingest_api_url, ingest_api_root=dict())
+
+        def get_entity_by_uuid(entity_type, uuid):
+            if uuid == 'missing':
+                raise ValueError('not found')
+            return {'uuid': {'uuid': uuid}}
+
+        ingestapi.getEntityByUuid = MagicMock(side_effect=get_entity_by_uuid)
+
+        # when:
+        entities = ingestapi.getEntitiesByUuid('biomaterials', ['donor', 'specimen', 'donor', 'missing'])
+
+        # then:
+        self.assertEqual({'donor', 'specimen'}, set(entities.keys()))
+        self.assertEqual({'uuid': {'uuid': 'donor'}}, entities['donor'])
+        self.assertEqual(3, ingestapi.getEntityByUuid.call_count)
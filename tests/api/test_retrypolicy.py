@@ -0,0 +1,153 @@
+import asyncio
+from unittest import TestCase
+
+import requests
+from mock import MagicMock
+
+from ingest.api.retrypolicy import RetryPolicy
+
+
+def _response(status_code, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers if headers else {})
+    return response
+
+
+def _http_error(status_code):
+    return requests.HTTPError(response=_response(status_code))
+
+
+class RetryPolicyTest(TestCase):
+
+    def setUp(self):
+        self.sleep = MagicMock()
+        self.policy = RetryPolicy(max_attempts=4, base_delay=1.0, max_delay=3.0, jitter=False, sleep=self.sleep)
+
+    def test_backoff(self):
+        # expect:
+        self.assertEqual([1.0, 2.0, 3.0, 3.0], [self.policy.backoff(attempt) for attempt in range(1, 5)])
+
+    def test_backoff_with_jitter(self):
+        # given:
+        policy = self.policy.copy(jitter=True)
+
+        # expect:
+        for attempt in range(1, 10):
+            self.assertTrue(0 <= policy.backoff(attempt) <= 3.0)
+
+    def test_call_retries_until_success(self):
+        # given:
+        func = MagicMock(side_effect=[requests.ConnectionError(), _http_error(503), 'result'])
+        on_retry = MagicMock()
+
+        # when:
+        result = self.policy.call(func, 'arg', on_retry=on_retry, key='value')
+
+        # then:
+        self.assertEqual('result', result)
+        self.assertEqual(3, func.call_count)
+        func.assert_called_with('arg', key='value')
+        self.assertEqual([1.0, 2.0], [call[0][0] for call in self.sleep.call_args_list])
+        self.assertEqual(2, on_retry.call_count)
+
+    def test_call_does_not_retry_client_error(self):
+        # given:
+        func = MagicMock(side_effect=_http_error(404))
+
+        # expect:
+        with self.assertRaises(requests.HTTPError):
+            self.policy.call(func)
+        self.assertEqual(1, func.call_count)
+        self.sleep.assert_not_called()
+
+    def test_call_raises_last_error_when_attempts_exhausted(self):
+        # given:
+        errors = [requests.Timeout(f'timeout {attempt}') for attempt in range(4)]
+        func = MagicMock(side_effect=errors)
+
+        # when:
+        with self.assertRaises(requests.Timeout) as context:
+            self.policy.call(func)
+
+        # then:
+        self.assertIs(errors[-1], context.exception)
+        self.assertEqual(4, func.call_count)
+        self.assertEqual(3, self.sleep.call_count)
+
+    def test_call_returns_last_response_when_attempts_exhausted(self):
+        # given:
+        func = MagicMock(return_value=_response(502))
+
+        # when:
+        response = self.policy.call(func)
+
+        # then:
+        self.assertEqual(502, response.status_code)
+        self.assertEqual(4, func.call_count)
+
+    def test_call_honours_retry_after(self):
+        # given:
+        func = MagicMock(side_effect=[_response(429, {'Retry-After': '7'}), _response(200)])
+
+        # when:
+        response = self.policy.call(func)
+
+        # then:
+        self.assertEqual(200, response.status_code)
+        self.sleep.assert_called_once_with(7.0)
+
+    def test_retry_after_as_date(self):
+        # given:
+        response = _response(503, {'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+
+        # expect:
+        self.assertEqual(0.0, RetryPolicy.retry_after(response))
+        self.assertIsNone(RetryPolicy.retry_after(_response(503)))
+
+    def test_call_stops_at_deadline(self):
+        # given:
+        clock = MagicMock(side_effect=[0.0, 0.5, 10.0])
+        policy = self.policy.copy(deadline=5.0, clock=clock)
+        func = MagicMock(side_effect=requests.ConnectionError())
+
+        # when:
+        with self.assertRaises(requests.ConnectionError):
+            policy.call(func)
+
+        # then:
+        self.assertEqual(2, func.call_count)
+        self.sleep.assert_called_once_with(1.0)
+
+    def test_error_with_status_code_attribute(self):
+        # given:
+        error = Exception('service unavailable')
+        error.code = 503
+
+        # expect:
+        self.assertTrue(self.policy.is_retryable_error(error))
+        error.code = 400
+        self.assertFalse(self.policy.is_retryable_error(error))
+
+    def test_call_async(self):
+        # given:
+        attempts = []
+
+        async def func():
+            attempts.append(True)
+            if len(attempts) < 3:
+                raise requests.ConnectionError()
+            return 'result'
+
+        policy = self.policy.copy(base_delay=0.0)
+
+        # when:
+        # asyncio.run is only available from Python 3.7
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        result = loop.run_until_complete(policy.call_async(func))
+
+        # then:
+        self.assertEqual('result', result)
+        self.assertEqual(3, len(attempts))
+        self.sleep.assert_not_called()
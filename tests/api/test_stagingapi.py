@@ -0,0 +1,102 @@
+import gzip
+import json
+from unittest import TestCase
+
+import requests
+from mock import MagicMock
+
+from ingest.api.flowcontrol import FlowControl
+from ingest.api.retrypolicy import RetryPolicy
+from ingest.api.stagingapi import StagingApi, StagingEncoding
+
+mock_staging_url = 'http://mockstaging.com'
+
+document = {'name': 'project', 'description': 'an ünicode description', 'values': [1, 2, 3]}
+
+
+def _staged_response():
+    response = requests.Response()
+    response.status_code = 201
+    response._content = json.dumps({'checksums': {}, 'name': 'project_1.json', 'size': 10,
+                                     'url': 's3://area/project_1.json'}).encode('utf-8')
+    return response
+
+
+class StagingEncodingTest(TestCase):
+
+    def test_default_is_indented_json(self):
+        # when:
+        body, headers = StagingEncoding().encode(document)
+
+        # then:
+        self.assertEqual(json.dumps(document, indent=4).encode('utf-8'), body)
+        self.assertEqual({}, headers)
+
+    def test_compact(self):
+        # when:
+        body, headers = StagingEncoding(compact=True).encode(document)
+
+        # then:
+        self.assertEqual(document, json.loads(body))
+        self.assertNotIn(b'\n', body)
+        self.assertNotIn(b', ', body)
+        self.assertEqual({}, headers)
+
+    def test_gzip(self):
+        # when:
+        body, headers = StagingEncoding(compact=True, gzip=True).encode(document)
+
+        # then:
+        self.assertEqual(document, json.loads(gzip.decompress(body)))
+        self.assertEqual({'Content-Encoding': 'gzip'}, headers)
+
+    def test_custom_encoder(self):
+        # given:
+        encoder = MagicMock(return_value='{}')
+
+        # when:
+        body, headers = StagingEncoding(encoder=encoder).encode(document)
+
+        # then:
+        encoder.assert_called_once_with(document)
+        self.assertEqual(b'{}', body)
+
+
+class StagingApiTest(TestCase):
+
+    def _staging_api(self, **kwargs):
+        staging_api = StagingApi(mock_staging_url, retry_policy=RetryPolicy(sleep=MagicMock()),
+                                 flow_control=FlowControl('staging'), **kwargs)
+        staging_api.session = MagicMock()
+        staging_api.session.put.return_value = _staged_response()
+        return staging_api
+
+    def test_stage_file_uses_api_encoding(self):
+        # given:
+        staging_api = self._staging_api(encoding=StagingEncoding(gzip=True))
+
+        # when:
+        file_description = staging_api.stageFile('area', 'project_1.json', document, 'metadata/project')
+
+        # then:
+        self.assertEqual('s3://area/project_1.json', file_description.url)
+        args, kwargs = staging_api.session.put.call_args
+        self.assertEqual(f'{mock_staging_url}/v1/area/area/project_1.json', args[0])
+        self.assertEqual(json.dumps(document, indent=4).encode('utf-8'), gzip.decompress(kwargs['data']))
+        self.assertEqual('gzip', kwargs['headers']['Content-Encoding'])
+        self.assertEqual('application/json; dcp-type=metadata/project', kwargs['headers']['Content-type'])
+
+    def test_stage_file_encoding_override(self):
+        # given:
+        staging_api = self._staging_api()
+
+        # when:
+        staging_api.stageFile('area', 'project_1.json', document, 'metadata/project',
+                              encoding=StagingEncoding(compact=True))
+
+        # then:
+        __, kwargs = staging_api.session.put.call_args
+        self.assertEqual(document, json.loads(kwargs['data']))
+        self.assertNotIn(b'\n', kwargs['data'])
+        self.assertNotIn('Content-Encoding', kwargs['headers'])
+        self.assertNotIn('Content-Encoding', staging_api.header)
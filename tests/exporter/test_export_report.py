@@ -0,0 +1,92 @@
+import json
+import os
+import pstats
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import MagicMock
+
+from ingest.exporter.export_report import ExportReport, profiled, Error, CPROFILE, GRAPH_WALK, STAGING
+from ingest.utils.metrics import StageMetrics
+from ingest.utils.metrics import Metrics
+
+
+class ExportReportTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_phases(self):
+        # given:
+        clock = MagicMock(side_effect=[0.0, 1.0, 3.0, 4.0, 4.5, 10.0])
+        report = ExportReport('submission_uuid', 'process_uuid', clock=clock)
+        stage_metrics = StageMetrics()
+        stage_metrics.record(0.25)
+        stage_metrics.record(0.75, error=True)
+
+        # when:
+        with report.phase(GRAPH_WALK):
+            pass
+        with report.phase(GRAPH_WALK):
+            pass
+        report.add_stage_metrics(STAGING, stage_metrics)
+        report.finish(bundle_uuid='bundle_uuid')
+
+        # then:
+        self.assertEqual({'seconds': 2.5}, report.phases[GRAPH_WALK])
+        self.assertEqual({'seconds': 1.0, 'count': 2, 'max_seconds': 0.75, 'errors': 1}, report.phases[STAGING])
+        self.assertEqual(10.0, report.total_seconds)
+        self.assertEqual('bundle_uuid', report.bundle_uuid)
+
+    def test_http_timings_are_counted_from_the_start(self):
+        # given:
+        metrics = Metrics()
+        metrics.observe('http_request_seconds', 1.0, endpoint='getEntityByUuid')
+        report = ExportReport('submission_uuid', 'process_uuid', http_metrics=[metrics])
+
+        # when:
+        metrics.observe('http_request_seconds', 0.5, endpoint='getEntityByUuid')
+        metrics.observe('http_request_seconds', 1.5, endpoint='getEntityByUuid')
+        metrics.observe('http_request_seconds', 2.0, endpoint='put_file')
+        metrics.increment('http_request_errors', endpoint='put_file')
+        report.finish()
+
+        # then:
+        self.assertEqual({'count': 2, 'errors': 0, 'seconds': 2.0, 'mean_seconds': 1.0},
+                         report.http['getEntityByUuid'])
+        self.assertEqual({'count': 1, 'errors': 1, 'seconds': 2.0, 'mean_seconds': 2.0}, report.http['put_file'])
+
+    def test_write(self):
+        # given:
+        report = ExportReport('submission_uuid', 'process_uuid')
+        report.finish(error=ValueError('failed'))
+
+        # when:
+        path = report.write(self.directory)
+
+        # then:
+        self.assertEqual(os.path.join(self.directory, 'submission_uuid_process_uuid.json'), path)
+        with open(path) as report_file:
+            written = json.load(report_file)
+        self.assertEqual('process_uuid', written['process_uuid'])
+        self.assertEqual('failed', written['error'])
+        self.assertEqual(report.total_seconds, written['total_seconds'])
+
+    def test_profiled_with_cprofile(self):
+        # given:
+        path = os.path.join(self.directory, 'export.prof')
+
+        # when:
+        with profiled(CPROFILE, path):
+            sorted(range(1000), reverse=True)
+
+        # then:
+        self.assertTrue(pstats.Stats(path).total_calls > 0)
+
+    def test_unknown_profiler(self):
+        # expect:
+        with self.assertRaises(Error):
+            with profiled('unknown', os.path.join(self.directory, 'export.prof')):
+                pass
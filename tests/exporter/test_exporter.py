@@ -15,6 +15,7 @@ from unittest import TestCase
 
 from ingest.exporter.ingestexportservice import IngestExporter
 import ingest.exporter.ingestexportservice as ingestexportservice
+import ingest.api.clients as clients
 import ingest.api.stagingapi as stagingapi
 
 BASE_PATH = os.path.dirname(__file__)
@@ -23,7 +24,7 @@ BASE_PATH = os.path.dirname(__file__)
 class TestExporter(TestCase):
     def setUp(self):
         self.longMessage = True
-        pass
+        clients.clear()
 
     @patch('ingest.api.dssapi.DssApi')
     def test_get_input_bundle(self, dss_api_constructor):
@@ -43,9 +44,8 @@ class TestExporter(TestCase):
         # then:
         self.assertEqual('bundle1', input_bundle)
 
-    @unittest.skip
     @patch('ingest.api.dssapi.DssApi')
-    def test_upload_metadata_files(self, dss_api_constructor):
+    def test_stage_metadata_file(self, dss_api_constructor):
         # given:
         dss_api_constructor.return_value = MagicMock('dss_api')
 
@@ -96,16 +96,16 @@ class TestExporter(TestCase):
         }
 
         # when:
-        metadata_files = exporter.upload_metadata_files('sub_uuid', metadata_files_info)
+        for metadata_file in metadata_files_info.values():
+            exporter.stage_metadata_file('sub_uuid', metadata_file)
 
         # then:
-        for metadata_list in metadata_files_info.values():
-            for metadata_file in metadata_list:
-                self.assertEqual(metadata_file['dss_uuid'], 'uuid')
-                self.assertEqual(metadata_file['upload_file_url'], 'file_url')
+        for metadata_file in metadata_files_info.values():
+            self.assertEqual(metadata_file['upload_file_url'], 'file_url')
+        exporter.upload_file.assert_called_with('sub_uuid', 'filename', {}, 'type')
 
     @patch('ingest.api.dssapi.DssApi')
-    def test_upload_metadata_files_error(self, dss_api_constructor):
+    def test_stage_metadata_file_error(self, dss_api_constructor):
         # given:
         dss_api_constructor.return_value = MagicMock('dss_api')
 
@@ -156,7 +156,7 @@ class TestExporter(TestCase):
 
         # when, then:
         with self.assertRaises(ingestexportservice.BundleFileUploadError) as e:
-            metadata_files = exporter.upload_metadata_files('sub_uuid', metadata_files_info)
+            exporter.stage_metadata_file('sub_uuid', metadata_files_info['project'])
 
     @patch('ingest.api.dssapi.DssApi')
     def test_put_bundle_in_dss_error(self, dss_api_constructor):
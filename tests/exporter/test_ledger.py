@@ -0,0 +1,142 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import requests
+from mock import MagicMock, patch
+
+from ingest.exporter.ingestexportservice import IngestExporter
+from ingest.exporter.ledger import ExportLedger, BUNDLE_STEP
+from ingest.importer.checkpoint import content_hash
+
+
+def _response(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return response
+
+
+class ExportLedgerTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_records_are_reloaded(self):
+        # given:
+        ledger = ExportLedger.for_bundle(self.directory, 'submission_uuid', 'process_uuid')
+        ledger.record_bundle('bundle_uuid', 'bundle_version', 'links_uuid')
+        ledger.record_file('file_uuid', 'v1', 'checksum')
+        ledger.record_step(BUNDLE_STEP)
+
+        # when:
+        reloaded = ExportLedger.for_bundle(self.directory, 'submission_uuid', 'process_uuid')
+
+        # then:
+        self.assertEqual('bundle_uuid', reloaded.get_bundle()['bundle_uuid'])
+        self.assertEqual('bundle_version', reloaded.get_bundle()['version'])
+        self.assertEqual('links_uuid', reloaded.get_bundle()['links_file_uuid'])
+        self.assertEqual('v1', reloaded.get_file_version('file_uuid', 'checksum'))
+        self.assertTrue(reloaded.is_done(BUNDLE_STEP))
+
+    def test_changed_checksum_has_no_version(self):
+        # given:
+        ledger = ExportLedger.for_bundle(self.directory, 'submission_uuid', 'process_uuid')
+        ledger.record_file('file_uuid', 'v1', 'checksum')
+
+        # expect:
+        self.assertIsNone(ledger.get_file_version('file_uuid', 'other_checksum'))
+        self.assertIsNone(ledger.get_file_version('other_file_uuid', 'checksum'))
+
+    def test_incomplete_record_is_ignored(self):
+        # given:
+        ledger = ExportLedger.for_bundle(self.directory, 'submission_uuid', 'process_uuid')
+        ledger.record_file('file_uuid', 'v1', 'checksum')
+        with open(ledger.path, 'a') as ledger_file:
+            ledger_file.write('{"record": "fi')
+
+        # when:
+        reloaded = ExportLedger(ledger.path)
+
+        # then:
+        self.assertEqual('v1', reloaded.get_file_version('file_uuid', 'checksum'))
+
+
+@patch('ingest.api.clients.get_dss_api')
+@patch('ingest.api.clients.get_staging_api')
+@patch('ingest.api.clients.get_ingest_api')
+class ExporterLedgerTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.ledger = ExportLedger(os.path.join(self.directory, 'ledger.jsonl'))
+        self.bundle_files = [self._bundle_file(file_uuid) for file_uuid in ['file_1', 'file_2']]
+
+    @staticmethod
+    def _bundle_file(file_uuid):
+        return {
+            'name': f'{file_uuid}.json',
+            'submittedName': f'{file_uuid}.json',
+            'url': f'upload/{file_uuid}.json',
+            'dss_uuid': file_uuid,
+            'indexed': True,
+            'content-type': 'metadata',
+            'update_date': None,
+            'checksum': content_hash({'name': file_uuid})
+        }
+
+    def test_put_files_records_versions(self, get_ingest_api, get_staging_api, get_dss_api):
+        # given:
+        exporter = IngestExporter()
+        exporter.dss_api.put_file = MagicMock(side_effect=lambda bundle_uuid, file, version: {'version': version})
+
+        # when:
+        created_files = [exporter.put_file_in_dss('bundle_uuid', bundle_file, {}, {}, ledger=self.ledger)
+                         for bundle_file in self.bundle_files]
+
+        # then:
+        self.assertEqual(2, exporter.dss_api.put_file.call_count)
+        for created_file, bundle_file in zip(created_files, self.bundle_files):
+            recorded_version = self.ledger.get_file_version(bundle_file['dss_uuid'], bundle_file['checksum'])
+            self.assertEqual(recorded_version, created_file['version'])
+
+    def test_registered_files_are_not_put_again(self, get_ingest_api, get_staging_api, get_dss_api):
+        # given:
+        exporter = IngestExporter()
+        self.ledger.record_file('file_1', 'v1', self.bundle_files[0]['checksum'])
+        self.ledger.record_file('file_2', 'v2', 'old checksum')
+        exporter.dss_api.head_files = MagicMock(side_effect=lambda files: [_response(200) for __ in files])
+        exporter.dss_api.put_file = MagicMock(side_effect=lambda bundle_uuid, file, version: {'version': version})
+
+        # when:
+        registered_versions = exporter.get_registered_versions(self.bundle_files, self.ledger)
+        created_files = [exporter.put_file_in_dss('bundle_uuid', bundle_file, {}, registered_versions,
+                                                  ledger=self.ledger) for bundle_file in self.bundle_files]
+
+        # then:
+        self.assertEqual({'file_1': 'v1'}, registered_versions)
+        exporter.dss_api.head_files.assert_called_once_with([('file_1', 'v1')])
+        self.assertEqual(['file_1', 'file_2'], [created_file['uuid'] for created_file in created_files])
+        self.assertEqual('v1', created_files[0]['version'])
+
+        # and: the changed file is put with a new version
+        exporter.dss_api.put_file.assert_called_once()
+        self.assertNotEqual('v2', created_files[1]['version'])
+
+    def test_interrupted_put_is_repeated_with_same_version(self, get_ingest_api, get_staging_api, get_dss_api):
+        # given:
+        exporter = IngestExporter()
+        self.ledger.record_file('file_1', 'v1', self.bundle_files[0]['checksum'])
+        exporter.dss_api.head_files = MagicMock(side_effect=lambda files: [_response(404) for __ in files])
+        exporter.dss_api.put_file = MagicMock(side_effect=lambda bundle_uuid, file, version: {'version': version})
+
+        # when:
+        registered_versions = exporter.get_registered_versions(self.bundle_files[:1], self.ledger)
+        created_files = [exporter.put_file_in_dss('bundle_uuid', self.bundle_files[0], {}, registered_versions,
+                                                  ledger=self.ledger)]
+
+        # then:
+        self.assertEqual({}, registered_versions)
+        self.assertEqual('v1', created_files[0]['version'])
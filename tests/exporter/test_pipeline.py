@@ -0,0 +1,238 @@
+import threading
+import time
+from unittest import TestCase
+
+import requests
+from mock import MagicMock, patch
+
+from ingest.exporter.export_report import ExportReport, DSS_LOOKUP, STAGING, DSS_PUT, VERIFY
+from ingest.api import dssapi
+from ingest.api.flowcontrol import CircuitOpenError, FlowControl
+from ingest.exporter.ingestexportservice import IngestExporter, BundleFileUploadError, FileDSSError
+from ingest.exporter.pipeline import Pipeline, Stage
+
+
+class PipelineTest(TestCase):
+
+    def test_results_are_in_item_order(self):
+        # given:
+        def slow_for_small_items(item):
+            time.sleep(0.01 * (10 - item))
+            return item * 2
+
+        pipeline = Pipeline([Stage('double', slow_for_small_items, workers=4), Stage('add', lambda item: item + 1)])
+
+        # when:
+        results = pipeline.run(range(10))
+
+        # then:
+        self.assertEqual([item * 2 + 1 for item in range(10)], results)
+        self.assertEqual(10, pipeline.metrics['double'].count)
+        self.assertEqual(10, pipeline.metrics['add'].count)
+
+    def test_stages_overlap(self):
+        # given:
+        first_item_done = threading.Event()
+
+        def first(item):
+            if item > 0:
+                # the later items wait until the first has passed the last stage
+                self.assertTrue(first_item_done.wait(timeout=5))
+            return item
+
+        def last(item):
+            if item == 0:
+                first_item_done.set()
+            return item
+
+        pipeline = Pipeline([Stage('first', first, workers=1), Stage('last', last, workers=1)])
+
+        # expect:
+        self.assertEqual([0, 1, 2], pipeline.run([0, 1, 2]))
+
+    def test_queues_are_bounded(self):
+        # given:
+        release = threading.Event()
+        fed = []
+
+        def feed(item):
+            fed.append(item)
+            return item
+
+        def blocked(item):
+            release.wait(timeout=5)
+            return item
+
+        pipeline = Pipeline([Stage('feed', feed, workers=1), Stage('blocked', blocked, workers=1)], queue_size=2)
+        runner = threading.Thread(target=pipeline.run, args=(range(100),))
+
+        # when:
+        runner.start()
+        time.sleep(0.2)
+        fed_while_blocked = len(fed)
+        release.set()
+        runner.join()
+
+        # then:
+        self.assertLess(fed_while_blocked, 10)
+        self.assertEqual(100, len(fed))
+
+    def test_first_error_is_raised(self):
+        # given:
+        processed = []
+
+        def fail_on_first(item):
+            if item == 0:
+                raise ValueError('failed')
+            time.sleep(0.01)
+            return item
+
+        def record(item):
+            processed.append(item)
+            return item
+
+        pipeline = Pipeline([Stage('fail', fail_on_first, workers=1), Stage('record', record)], queue_size=1)
+
+        # expect:
+        with self.assertRaisesRegex(ValueError, 'failed'):
+            pipeline.run(range(100))
+        self.assertEqual([], processed)
+        self.assertEqual(1, pipeline.metrics['fail'].errors)
+
+
+def _response(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return response
+
+
+def _dss_error(cause):
+    error = dssapi.Error(cause)
+    error.__cause__ = cause
+    return error
+
+
+def _metadata_doc(name, is_from_input_bundle=False):
+    return {
+        'content': {'name': name},
+        'content_type': '"metadata/project"',
+        'indexed': True,
+        'dss_filename': f'{name}.json',
+        'dss_uuid': f'{name}_uuid',
+        'upload_filename': f'{name}_upload.json',
+        'update_date': 'update_date',
+        'is_from_input_bundle': is_from_input_bundle
+    }
+
+
+@patch('ingest.api.clients.get_dss_api')
+@patch('ingest.api.clients.get_staging_api')
+@patch('ingest.api.clients.get_ingest_api')
+class ExportFilesTest(TestCase):
+
+    def setUp(self):
+        self.process_info = MagicMock(input_files={})
+        self.files_by_type = {entity_type: [] for entity_type in
+                              ['biomaterial', 'file', 'project', 'protocol', 'process', 'links']}
+        self.files_by_type['project'] = [_metadata_doc('project')]
+        self.files_by_type['protocol'] = [_metadata_doc('protocol', is_from_input_bundle=True)]
+        self.data_files = [{
+            'name': 'data.fastq',
+            'submittedName': 'data.fastq',
+            'url': 's3://data.fastq',
+            'dss_uuid': 'data_uuid',
+            'indexed': False,
+            'content-type': 'data',
+            'checksum': 'checksum'
+        }]
+
+    def _exporter(self):
+        exporter = IngestExporter(staged_content_cache=None)
+        exporter.dss_api = dssapi.DssApi('http://dss', flow_control=FlowControl('dss'), session=MagicMock())
+        exporter.upload_file = MagicMock(side_effect=lambda area, filename, content, content_type:
+                                         MagicMock(url=f'upload/{filename}'))
+        stored_response = _response(200)
+        stored_response.headers['X-DSS-VERSION'] = 'stored_version'
+        exporter.dss_api.head_files = MagicMock(return_value=[stored_response])
+        exporter.dss_api.head_file = MagicMock(return_value=_response(200))
+        exporter.dss_api.put_file = MagicMock(side_effect=lambda bundle_uuid, file: {'version': file['url']})
+        return exporter
+
+    def test_export_files(self, get_ingest_api, get_staging_api, get_dss_api):
+        # given:
+        exporter = self._exporter()
+
+        # when:
+        created_files = exporter.export_files('area', 'bundle_uuid', self.files_by_type, self.data_files,
+                                              self.process_info)
+
+        # then:
+        self.assertEqual(['project_uuid', 'protocol_uuid', 'data_uuid'],
+                         [created_file['uuid'] for created_file in created_files])
+        self.assertEqual(['upload/project_upload.json', 'stored_version', 's3://data.fastq'],
+                         [created_file['version'] for created_file in created_files])
+
+        # and: the file from the input bundle is neither staged nor put
+        exporter.upload_file.assert_called_once_with('area', 'project_upload.json', {'name': 'project'},
+                                                     '"metadata/project"')
+        self.assertEqual(2, exporter.dss_api.put_file.call_count)
+        self.assertEqual('upload/project_upload.json', self.files_by_type['project'][0]['upload_file_url'])
+
+        # and: every file is verified
+        self.assertEqual(3, exporter.dss_api.head_file.call_count)
+
+    def test_export_files_report(self, get_ingest_api, get_staging_api, get_dss_api):
+        # given:
+        exporter = self._exporter()
+        report = ExportReport('area', 'process_uuid')
+
+        # when:
+        exporter.export_files('area', 'bundle_uuid', self.files_by_type, self.data_files, self.process_info,
+                              report=report)
+
+        # then:
+        self.assertIn(DSS_LOOKUP, report.phases)
+        self.assertEqual(3, report.phases[STAGING]['count'])
+        self.assertEqual(3, report.phases[DSS_PUT]['count'])
+        self.assertEqual(3, report.phases[VERIFY]['count'])
+
+    def test_missing_stored_file(self, get_ingest_api, get_staging_api, get_dss_api):
+        # given:
+        exporter = self._exporter()
+        exporter.dss_api.head_files = MagicMock(return_value=[None])
+
+        # expect:
+        with self.assertRaises(FileDSSError):
+            exporter.export_files('area', 'bundle_uuid', self.files_by_type, self.data_files, self.process_info)
+
+    def test_verify_error_is_raised(self, get_ingest_api, get_staging_api, get_dss_api):
+        # given:
+        exporter = self._exporter()
+        exporter.dss_api.head_file = MagicMock(side_effect=dssapi.Error('forbidden'))
+
+        # expect:
+        with self.assertRaises(dssapi.Error):
+            exporter.verify_file({'uuid': 'file_uuid', 'version': 'v1', 'name': 'name'})
+        exporter.dss_api.head_file.assert_called_once_with('file_uuid', version='v1')
+
+    @patch('ingest.exporter.ingestexportservice.VERIFY_POLL_STEP', 0)
+    def test_verify_waits_out_transient_errors(self, get_ingest_api, get_staging_api, get_dss_api):
+        # given:
+        exporter = self._exporter()
+        exporter.dss_api.head_file = MagicMock(side_effect=[_dss_error(requests.HTTPError(response=_response(503))),
+                                                            _dss_error(CircuitOpenError('open')), _response(200)])
+
+        # when:
+        exporter.verify_file({'uuid': 'file_uuid', 'version': 'v1', 'name': 'name'})
+
+        # then:
+        self.assertEqual(3, exporter.dss_api.head_file.call_count)
+
+    def test_staging_error(self, get_ingest_api, get_staging_api, get_dss_api):
+        # given:
+        exporter = self._exporter()
+        exporter.upload_file = MagicMock(side_effect=Exception('staging failed'))
+
+        # expect:
+        with self.assertRaises(BundleFileUploadError):
+            exporter.export_files('area', 'bundle_uuid', self.files_by_type, self.data_files, self.process_info)
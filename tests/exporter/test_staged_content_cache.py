@@ -0,0 +1,91 @@
+from unittest import TestCase
+
+from mock import MagicMock, patch
+
+from ingest.api.stagingapi import FileDescription
+from ingest.exporter.ingestexportservice import IngestExporter
+from ingest.exporter.staged_content_cache import StagedContentCache
+
+
+def _file_description(name, size=10):
+    return FileDescription({'sha256': 'checksum'}, 'metadata/project', name, size, f'upload/{name}')
+
+
+class StagedContentCacheTest(TestCase):
+
+    def test_key_ignores_key_order(self):
+        # expect:
+        self.assertEqual(StagedContentCache.key('area', {'a': 1, 'b': 2}, 'type'),
+                         StagedContentCache.key('area', {'b': 2, 'a': 1}, 'type'))
+        self.assertNotEqual(StagedContentCache.key('area', {'a': 1}, 'type'),
+                            StagedContentCache.key('other_area', {'a': 1}, 'type'))
+        self.assertNotEqual(StagedContentCache.key('area', {'a': 1}, 'type'),
+                            StagedContentCache.key('area', {'a': 1}, 'other_type'))
+
+    def test_get_counts_hits_and_misses(self):
+        # given:
+        cache = StagedContentCache()
+        key = cache.key('area', {'a': 1}, 'type')
+
+        # when:
+        self.assertIsNone(cache.get(key))
+        cache.put(key, _file_description('project.json', size=42))
+        file_description = cache.get(key)
+
+        # then:
+        self.assertEqual('project.json', file_description.name)
+        self.assertEqual({'hits': 1, 'misses': 1, 'bytes_saved': 42}, cache.stats())
+
+    def test_least_recently_used_are_evicted(self):
+        # given:
+        cache = StagedContentCache(max_size=2)
+        keys = [cache.key('area', {'index': index}, 'type') for index in range(3)]
+        cache.put(keys[0], _file_description('0'))
+        cache.put(keys[1], _file_description('1'))
+        cache.get(keys[0])
+
+        # when:
+        cache.put(keys[2], _file_description('2'))
+
+        # then:
+        self.assertEqual(2, len(cache))
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertIsNotNone(cache.get(keys[0]))
+
+
+@patch('ingest.api.clients.get_dss_api')
+@patch('ingest.api.clients.get_staging_api')
+@patch('ingest.api.clients.get_ingest_api')
+class UploadFileTest(TestCase):
+
+    def test_identical_content_is_staged_once(self, get_ingest_api, get_staging_api, get_dss_api):
+        # given:
+        cache = StagedContentCache()
+        exporter = IngestExporter(staged_content_cache=cache)
+        exporter.staging_api.getFile = MagicMock(return_value=None)
+        exporter.staging_api.stageFile = MagicMock(
+            side_effect=lambda area, filename, content, content_type, encoding: _file_description(filename))
+
+        # when:
+        first = exporter.upload_file('area', 'project_1.json', {'name': 'project'}, 'metadata/project')
+        second = exporter.upload_file('area', 'project_1.json', {'name': 'project'}, 'metadata/project')
+        other = exporter.upload_file('area', 'protocol_1.json', {'name': 'protocol'}, 'metadata/protocol')
+
+        # then:
+        self.assertIs(first, second)
+        self.assertEqual('protocol_1.json', other.name)
+        self.assertEqual(2, exporter.staging_api.stageFile.call_count)
+        self.assertEqual(2, exporter.staging_api.getFile.call_count)
+        self.assertEqual({'hits': 1, 'misses': 2, 'bytes_saved': 10}, cache.stats())
+
+    def test_without_cache(self, get_ingest_api, get_staging_api, get_dss_api):
+        # given:
+        exporter = IngestExporter(staged_content_cache=None)
+        exporter.staging_api.getFile = MagicMock(return_value=_file_description('project_1.json'))
+
+        # when:
+        for __ in range(2):
+            exporter.upload_file('area', 'project_1.json', {'name': 'project'}, 'metadata/project')
+
+        # then:
+        self.assertEqual(2, exporter.staging_api.getFile.call_count)
@@ -0,0 +1,31 @@
+from unittest import TestCase
+
+from ingest.importer.conversion import field_path
+
+
+class ModuleTest(TestCase):
+
+    def test_parse(self):
+        # when:
+        path = field_path.parse('user.address.city')
+
+        # then:
+        self.assertEqual('user.address.city', path.field)
+        self.assertEqual('user.address', path.parent)
+        self.assertEqual('city', path.target)
+        self.assertEqual('user', path.root)
+        self.assertEqual('address.city', path.applied)
+
+    def test_parse_single_field(self):
+        # when:
+        path = field_path.parse('name')
+
+        # then:
+        self.assertEqual('', path.parent)
+        self.assertEqual('name', path.target)
+        self.assertEqual('name', path.root)
+        self.assertEqual('name', path.applied)
+
+    def test_parse_is_cached(self):
+        # expect:
+        self.assertIs(field_path.parse('product.item.id'), field_path.parse('product.item.id'))
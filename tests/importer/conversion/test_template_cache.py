@@ -0,0 +1,43 @@
+from unittest import TestCase
+
+from mock import MagicMock
+
+from ingest.importer.conversion.template_cache import RowTemplateCache
+
+
+class RowTemplateCacheTest(TestCase):
+
+    def test_get_or_compile(self):
+        # given:
+        row_template_cache = RowTemplateCache()
+        row_template = MagicMock('row_template')
+        compile_template = MagicMock(return_value=row_template)
+
+        # when:
+        first = row_template_cache.get_or_compile(('schemas', 'tab', ('header',)), compile_template)
+        second = row_template_cache.get_or_compile(('schemas', 'tab', ('header',)), compile_template)
+
+        # then:
+        self.assertIs(row_template, first)
+        self.assertIs(row_template, second)
+        compile_template.assert_called_once()
+        self.assertEqual(1, row_template_cache.hits)
+        self.assertEqual(1, row_template_cache.misses)
+
+    def test_evicts_least_recently_used(self):
+        # given:
+        row_template_cache = RowTemplateCache(max_size=2)
+        row_template_cache.put('first', 'first template')
+        row_template_cache.put('second', 'second template')
+
+        # and:
+        row_template_cache.get('first')
+
+        # when:
+        row_template_cache.put('third', 'third template')
+
+        # then:
+        self.assertEqual(2, len(row_template_cache))
+        self.assertIn('first', row_template_cache)
+        self.assertNotIn('second', row_template_cache)
+        self.assertIn('third', row_template_cache)
@@ -6,6 +6,7 @@ from openpyxl import Workbook
 from ingest.importer.conversion import conversion_strategy
 from ingest.importer.conversion.column_specification import ColumnSpecification
 from ingest.importer.conversion.conversion_strategy import CellConversion
+from ingest.importer.conversion.template_cache import RowTemplateCache
 from ingest.importer.conversion.template_manager import TemplateManager, RowTemplate
 from ingest.importer.data_node import DataNode
 
@@ -181,6 +182,40 @@ class TemplateManagerTest(TestCase):
         # then:
         self.assertEqual(0, len(row_template.cell_conversions))
 
+    @patch.object(ColumnSpecification, 'build_raw')
+    @patch.object(conversion_strategy, 'determine_strategy')
+    def test_create_row_template_uses_cache(self, determine_strategy, build_raw):
+        # given:
+        schema_template = MagicMock('schema_template')
+        schema_template.get_schema_urls = MagicMock(return_value=['https://schema.sample.com/profile'])
+        ingest_api = MagicMock(name='ingest_api')
+        self._mock_schema_lookup(schema_template, object_type='profile_type')
+        build_raw.return_value = MagicMock('column_spec')
+        determine_strategy.return_value = FakeConversion('')
+
+        # and:
+        worksheets = [Workbook().create_sheet('profile') for _ in range(2)]
+        for worksheet in worksheets:
+            worksheet['A4'] = 'profile.name'
+        other_worksheet = Workbook().create_sheet('profile')
+        other_worksheet['A4'] = 'profile.description'
+
+        # and:
+        row_template_cache = RowTemplateCache()
+
+        # when:
+        row_templates = [TemplateManager(schema_template, ingest_api, row_template_cache=row_template_cache)
+                         .create_row_template(worksheet) for worksheet in worksheets]
+        template_manager = TemplateManager(schema_template, ingest_api, row_template_cache=row_template_cache)
+        other_row_template = template_manager.create_row_template(other_worksheet)
+
+        # then:
+        self.assertIs(row_templates[0], row_templates[1])
+        self.assertIsNot(row_templates[0], other_row_template)
+        self.assertEqual(2, determine_strategy.call_count)
+        self.assertEqual(1, row_template_cache.hits)
+        self.assertEqual(2, row_template_cache.misses)
+
     @staticmethod
     def _mock_schema_lookup(schema_template, schema_url='', object_type='', main_category=None):
         tabs_config = MagicMock('tabs_config')
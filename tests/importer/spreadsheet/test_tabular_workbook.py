@@ -0,0 +1,107 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import MagicMock
+
+from ingest.importer.conversion.template_manager import TemplateManager
+from ingest.importer.importer import WorksheetImporter, XlsImporter
+from ingest.importer.spreadsheet import tabular_workbook
+from ingest.importer.spreadsheet.tabular_workbook import TabularWorksheet, InvalidJsonLinesRecord
+
+
+def _header_rows(keys):
+    return [
+        ['Friendly Name'] * len(keys),
+        ['description'] * len(keys),
+        ['example'] * len(keys),
+        keys,
+        ['']
+    ]
+
+
+class TabularWorkbookTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write_tab(self, file_name, rows, delimiter=','):
+        with open(os.path.join(self.directory, file_name), 'w') as tab_file:
+            for row in rows:
+                tab_file.write(delimiter.join(row) + '\n')
+
+    def test_load_csv_directory(self):
+        # given:
+        self._write_tab('Schemas.csv', [['schema'], ['https://schema.humancellatlas.org/type/project']])
+        self._write_tab('Donor organism.tsv', _header_rows(['donor_organism.biomaterial_id', 'donor_organism.age']) + [
+            ['donor_1', '42'],
+            ['donor_2', '']
+        ], delimiter='\t')
+        self._write_tab('notes.txt', [['not a tab']])
+
+        # when:
+        workbook = tabular_workbook.load_csv_directory(self.directory)
+
+        # then:
+        self.assertEqual(['Donor organism', 'Schemas'], workbook.get_sheet_names())
+
+        # and:
+        donor_worksheet = workbook['Donor organism']
+        header_row = TemplateManager.get_header_row(donor_worksheet)
+        self.assertEqual(['donor_organism.biomaterial_id', 'donor_organism.age'],
+                         [cell.value for cell in header_row])
+
+        # and:
+        data_rows = WorksheetImporter()._get_data_rows(donor_worksheet, TemplateManager)
+        self.assertEqual([['donor_1', '42'], ['donor_2', None]],
+                         [[cell.value for cell in row] for row in data_rows])
+
+    def test_load_json_lines(self):
+        # given:
+        records = [{'tab': 'Project', 'row': row} for row in _header_rows(['project.project_core.name'])]
+        records.append({'tab': 'Project', 'row': ['Tissue Stability']})
+        records.append({'tab': 'Schemas', 'row': ['schema']})
+        stream = io.StringIO('\n'.join([json.dumps(record) for record in records]) + '\n\n')
+
+        # when:
+        workbook = tabular_workbook.load_json_lines(stream)
+
+        # then:
+        self.assertEqual(['Project', 'Schemas'], workbook.get_sheet_names())
+        project_rows = WorksheetImporter()._get_data_rows(workbook['Project'], TemplateManager)
+        self.assertEqual([['Tissue Stability']], [[cell.value for cell in row] for row in project_rows])
+
+    def test_load_json_lines_invalid_record(self):
+        # given:
+        stream = io.StringIO(json.dumps({'tab': 'Project'}))
+
+        # expect:
+        with self.assertRaises(InvalidJsonLinesRecord) as context:
+            tabular_workbook.load_json_lines(stream)
+        self.assertEqual(1, context.exception.line_number)
+
+    def test_iter_rows_follows_openpyxl_offsets(self):
+        # given:
+        worksheet = TabularWorksheet('sample', rows=[[str(index)] for index in range(1, 9)])
+
+        # when:
+        rows = worksheet.iter_rows(row_offset=5, max_row=worksheet.max_row - 5)
+
+        # then:
+        self.assertEqual(['6', '7', '8'], [row[0].value for row in rows])
+
+    def test_create_ingest_workbook_from_directory(self):
+        # given:
+        self._write_tab('Schemas.csv', [['schema'], ['https://schema.humancellatlas.org/type/project']])
+
+        # when:
+        ingest_workbook = XlsImporter(MagicMock())._create_ingest_workbook(self.directory)
+
+        # then:
+        self.assertEqual(['https://schema.humancellatlas.org/type/project'], ingest_workbook.get_schemas())
@@ -0,0 +1,77 @@
+import shutil
+import tempfile
+from unittest import TestCase
+
+from ingest.importer.checkpoint import CheckpointJournal, MANIFEST_STEP
+from ingest.importer.submission import Entity
+
+
+class CheckpointJournalTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_resume(self):
+        # given:
+        submission_url = 'http://core.sample.com/submissionEnvelopes/8fd733'
+        journal = CheckpointJournal.for_submission(self.directory, submission_url)
+
+        # and:
+        biomaterial = Entity('biomaterial', 'biomaterial_1', {}, ingest_json={'_links': {'self': {'href': 'url'}}})
+        protocol = Entity('protocol', 'protocol_1', {})
+        journal.record_step(MANIFEST_STEP)
+        journal.record_entity(biomaterial)
+        journal.record_link(biomaterial, protocol, 'protocols')
+
+        # and: a record partially written before a crash
+        with open(journal.path, 'a') as journal_file:
+            journal_file.write('{"record": "entity", "ty')
+
+        # when:
+        resumed_journal = CheckpointJournal.for_submission(self.directory, submission_url)
+
+        # then:
+        self.assertTrue(resumed_journal.is_done(MANIFEST_STEP))
+        self.assertTrue(resumed_journal.is_linked(biomaterial, protocol, 'protocols'))
+        self.assertFalse(resumed_journal.is_linked(protocol, biomaterial, 'protocols'))
+
+        # and:
+        restored_biomaterial = Entity('biomaterial', 'biomaterial_1', {})
+        self.assertTrue(resumed_journal.restore_entity(restored_biomaterial))
+        self.assertEqual(biomaterial.ingest_json, restored_biomaterial.ingest_json)
+        self.assertFalse(resumed_journal.restore_entity(Entity('protocol', 'protocol_1', {})))
+
+    def test_changes_since_last_import(self):
+        # given:
+        journal = CheckpointJournal(self.directory + '/journal.jsonl')
+        donor = Entity('biomaterial', 'donor', {'name': 'donor', 'age': 30}, ingest_json={})
+        specimen = Entity('biomaterial', 'specimen', {'name': 'specimen'}, ingest_json={})
+        journal.record_entity(donor)
+        journal.record_entity(specimen)
+        journal.record_link(specimen, donor, 'derivedFrom')
+        journal.record_link(donor, specimen, 'inputTo')
+        journal.record_unlink(donor, specimen, 'inputTo')
+
+        # when:
+        reloaded_journal = CheckpointJournal(journal.path)
+
+        # then:
+        self.assertFalse(reloaded_journal.is_changed(Entity('biomaterial', 'donor', {'age': 30, 'name': 'donor'})))
+        self.assertTrue(reloaded_journal.is_changed(Entity('biomaterial', 'specimen', {'name': 'new name'})))
+        self.assertFalse(reloaded_journal.is_changed(Entity('biomaterial', 'new', {'name': 'new'})))
+        self.assertEqual({('biomaterial', 'specimen', 'derivedFrom', 'biomaterial', 'donor')},
+                         reloaded_journal.get_link_keys())
+
+    def test_journals_are_kept_per_submission(self):
+        # given:
+        journal = CheckpointJournal.for_submission(self.directory, 'http://core.sample.com/submission/1')
+        journal.record_step(MANIFEST_STEP)
+
+        # when:
+        other_journal = CheckpointJournal.for_submission(self.directory, 'http://core.sample.com/submission/2')
+
+        # then:
+        self.assertFalse(other_journal.is_done(MANIFEST_STEP))
@@ -72,6 +72,13 @@ class WorkbookImporterTest(TestCase):
         self.assertEqual(expected_json['project'], workbook_output['project'])
         self.assertEqual(expected_json['biomaterial'], workbook_output['biomaterial'])
 
+    def test_max_consecutive_empty_rows(self):
+        # when:
+        workbook_importer = WorkbookImporter(MagicMock(), max_consecutive_empty_rows=10)
+
+        # then:
+        self.assertEqual(10, workbook_importer.worksheet_importer.max_consecutive_empty_rows)
+
     def _mock_get_schemas(self, ingest_workbook):
         schema_base_url = 'https://schema.humancellatlas.org'
         schema_list = [
@@ -191,6 +198,29 @@ class WorksheetImporterTest(TestCase):
         # then:
         self.assertEqual(2, len(result.keys()))
 
+    def test_get_data_rows_stops_at_consecutive_empty_rows(self):
+        # given:
+        mock_template_manager = MagicMock('template_manager')
+        mock_template_manager.get_header_row = MagicMock(return_value=['header1', 'header2'])
+
+        # and:
+        workbook = Workbook()
+        worksheet = workbook.create_sheet('product')
+        worksheet['A6'] = 'paper'
+        worksheet['B6'] = 'white'
+        worksheet['C6'] = 'not in header'
+        worksheet['A8'] = 'pen'
+        worksheet['A12'] = 'pencil'
+
+        # when:
+        worksheet_importer = WorksheetImporter(max_consecutive_empty_rows=3)
+        with self.assertLogs('ingest.importer.importer', level='WARNING') as logs:
+            rows = list(worksheet_importer._get_data_rows(worksheet, mock_template_manager))
+
+        # then:
+        self.assertEqual([['paper', 'white'], ['pen', None]], [[cell.value for cell in row] for row in rows])
+        self.assertIn('Stopped reading sheet product at row 11', logs.output[0])
+
     def _assert_correct_profile(self, profile, profile_id, expected_content, expected_links,
                                 expected_external_links, expected_linking_details):
         actual_profile = profile.get(profile_id)
@@ -203,6 +233,19 @@ class WorksheetImporterTest(TestCase):
 
 class IngestImporterTest(TestCase):
 
+    @patch('ingest.importer.importer.WorkbookImporter')
+    @patch('ingest.importer.importer.template_manager.build')
+    def test_max_consecutive_empty_rows_is_passed_to_the_workbook_importer(self, build, workbook_importer_constructor):
+        # given:
+        importer = XlsImporter(MagicMock(), max_consecutive_empty_rows=10)
+        importer._create_ingest_workbook = MagicMock()
+
+        # when:
+        importer._generate_spreadsheet_json('spreadsheet.xlsx')
+
+        # then:
+        workbook_importer_constructor.assert_called_once_with(build.return_value, max_consecutive_empty_rows=10)
+
     # TODO why is this hitting servers?
     @unittest.skip
     def test_import_spreadsheet(self):
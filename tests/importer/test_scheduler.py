@@ -0,0 +1,132 @@
+import threading
+import time
+from unittest import TestCase
+
+from mock import MagicMock
+
+from ingest.importer.scheduler import SubmissionScheduler, CREATE_STAGE, LINK_STAGE
+from ingest.importer.submission import Entity
+
+
+class SubmissionSchedulerTest(TestCase):
+
+    def test_run_links_after_both_entities_are_created(self):
+        # given:
+        donor = Entity('biomaterial', 'donor', {})
+        specimen = Entity('biomaterial', 'specimen', {})
+        project = Entity('project', 'project', {}, is_reference=True)
+
+        # and:
+        events = []
+        lock = threading.Lock()
+
+        def create(batch):
+            with lock:
+                events.append(('create', batch[0].id))
+
+        def link(from_entity, to_entity, relationship):
+            with lock:
+                events.append(('link', relationship))
+
+        # when:
+        scheduler = SubmissionScheduler(create, link, max_workers=4)
+        scheduler.run([[donor], [specimen]], [
+            (specimen, donor, 'derivedFrom'),
+            (donor, project, 'projects')
+        ])
+
+        # then:
+        self.assertLess(events.index(('create', 'donor')), events.index(('link', 'derivedFrom')))
+        self.assertLess(events.index(('create', 'specimen')), events.index(('link', 'derivedFrom')))
+        self.assertLess(events.index(('create', 'donor')), events.index(('link', 'projects')))
+        self.assertEqual(2, scheduler.metrics[CREATE_STAGE].count)
+        self.assertEqual(2, scheduler.metrics[LINK_STAGE].count)
+
+    def test_run_overlaps_links_with_creates(self):
+        # given:
+        donor = Entity('biomaterial', 'donor', {})
+        specimen = Entity('biomaterial', 'specimen', {})
+        slow_file = Entity('file', 'slow_file', {})
+
+        # and:
+        slow_file_created = threading.Event()
+        linked_before_slow_file = []
+
+        def create(batch):
+            if batch[0] is slow_file:
+                time.sleep(0.2)
+                slow_file_created.set()
+
+        def link(from_entity, to_entity, relationship):
+            linked_before_slow_file.append(not slow_file_created.is_set())
+
+        # when:
+        scheduler = SubmissionScheduler(create, link, max_workers=2)
+        scheduler.run([[slow_file], [donor], [specimen]], [(specimen, donor, 'derivedFrom')])
+
+        # then:
+        self.assertEqual([True], linked_before_slow_file)
+
+    def test_run_bounds_pending_tasks(self):
+        # given:
+        entities = [Entity('biomaterial', f'biomaterial_{index}', {}) for index in range(20)]
+
+        # and:
+        running = []
+        max_running = []
+        lock = threading.Lock()
+
+        def create(batch):
+            with lock:
+                running.append(batch)
+                max_running.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.remove(batch)
+
+        # when:
+        scheduler = SubmissionScheduler(create, MagicMock(), max_workers=8, max_pending=3)
+        scheduler.run([[entity] for entity in entities], [])
+
+        # then:
+        self.assertLessEqual(max(max_running), 3)
+        self.assertEqual(20, scheduler.metrics[CREATE_STAGE].count)
+        self.assertEqual(17, scheduler.metrics[CREATE_STAGE].max_queued)
+
+    def test_run_raises_create_error(self):
+        # given:
+        donor = Entity('biomaterial', 'donor', {})
+        specimen = Entity('biomaterial', 'specimen', {})
+
+        def create(batch):
+            if batch[0] is donor:
+                raise ValueError('donor could not be created')
+
+        link = MagicMock()
+
+        # when:
+        scheduler = SubmissionScheduler(create, link, max_workers=1)
+        with self.assertRaises(ValueError):
+            scheduler.run([[donor], [specimen]], [(specimen, donor, 'derivedFrom')])
+
+        # then:
+        link.assert_not_called()
+        self.assertEqual(1, scheduler.metrics[CREATE_STAGE].errors)
+
+    def test_run_reports_link_errors(self):
+        # given:
+        donor = Entity('biomaterial', 'donor', {})
+        specimen = Entity('biomaterial', 'specimen', {})
+        link_error = ValueError('link failed')
+        link_error_handler = MagicMock()
+
+        def link(from_entity, to_entity, relationship):
+            raise link_error
+
+        # when:
+        scheduler = SubmissionScheduler(MagicMock(), link, max_workers=2, link_error_handler=link_error_handler)
+        scheduler.run([[donor], [specimen]], [(specimen, donor, 'derivedFrom')])
+
+        # then:
+        link_error_handler.assert_called_once_with(specimen, donor, 'derivedFrom', link_error)
+        self.assertEqual(1, scheduler.metrics[LINK_STAGE].errors)
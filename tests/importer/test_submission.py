@@ -1,13 +1,18 @@
 import json
+import os
+import shutil
+import tempfile
 from unittest import TestCase
 
 import copy
 from mock import MagicMock, patch, call
 
 from ingest.api.ingestapi import IngestApi
+from ingest.importer.checkpoint import CheckpointJournal
 from ingest.importer.data_node import DataNode
 from ingest.importer.submission import Submission, Entity, IngestSubmitter, EntityLinker, LinkedEntityNotFound, \
-    InvalidLinkInSpreadsheet, MultipleProcessesFound, EntityMap
+    InvalidLinkInSpreadsheet, MultipleProcessesFound, EntityMap, DirectLink, trim_ingest_json, InvalidSpreadsheetLinks, \
+    generated_process_id
 
 import ingest.api.ingestapi
 
@@ -60,7 +65,66 @@ class SubmissionTest(TestCase):
         entity = Entity(entity_id='id', entity_type='biomaterial', content={})
         entity = submission.add_entity(entity)
 
-        self.assertEqual(new_entity_mock_response, entity.ingest_json)
+        self.assertEqual({
+            'uuid': new_entity_mock_response['uuid'],
+            '_links': new_entity_mock_response['_links']
+        }, entity.ingest_json)
+
+    def test_add_entities(self):
+        # given:
+        ingest_api = MagicMock('ingest_api')
+        ingest_api.createEntities = MagicMock(side_effect=lambda url, link_name, documents: [
+            {'content': document, '_links': {'self': {'href': document['name']}}} for document in documents
+        ])
+        ingest_api.createProject = MagicMock(return_value={'content': 'project'})
+        submission = Submission(ingest_api, submission_url='url')
+
+        # and:
+        donor = Entity('biomaterial', 'donor', {'name': 'donor'})
+        specimen = Entity('biomaterial', 'specimen', {'name': 'specimen'})
+        protocol = Entity('protocol', 'protocol', {'name': 'protocol'})
+        project = Entity('project', 'project', {})
+
+        # when:
+        submission.add_entities([donor, project, specimen, protocol])
+
+        # then:
+        ingest_api.createEntities.assert_has_calls([
+            call('url', 'biomaterials', [{'name': 'donor'}, {'name': 'specimen'}]),
+            call('url', 'protocols', [{'name': 'protocol'}])
+        ], any_order=True)
+        ingest_api.createProject.assert_called_once()
+        self.assertEqual({'_links': {'self': {'href': 'specimen'}}}, specimen.ingest_json)
+        self.assertEqual(4, submission.metrics.count('entities_created'))
+        self.assertEqual(specimen, submission.get_entity('biomaterial', 'specimen'))
+
+    def test_resolve_references(self):
+        # given:
+        ingest_api = MagicMock('ingest_api')
+        ingest_api.getEntitiesByUuid = MagicMock(side_effect=lambda entity_type, uuids: {
+            uuid: {'uuid': uuid} for uuid in uuids if uuid != 'missing'
+        })
+        submission = Submission(ingest_api, submission_url='url')
+
+        # and:
+        donor = Entity('biomaterial', 'donor_uuid', None, is_reference=True)
+        missing = Entity('biomaterial', 'missing', None, is_reference=True)
+        protocol = Entity('protocol', 'protocol_uuid', None, is_reference=True)
+        resolved = Entity('protocol', 'resolved_uuid', None, ingest_json={'uuid': 'resolved'}, is_reference=True)
+        new_specimen = Entity('biomaterial', 'specimen', {})
+
+        # when:
+        submission.resolve_references([donor, missing, protocol, resolved, new_specimen, donor])
+
+        # then:
+        ingest_api.getEntitiesByUuid.assert_has_calls([
+            call('biomaterials', ['donor_uuid', 'missing', 'donor_uuid']),
+            call('protocols', ['protocol_uuid'])
+        ], any_order=True)
+        self.assertEqual({'uuid': 'donor_uuid'}, donor.ingest_json)
+        self.assertEqual({'uuid': 'protocol_uuid'}, protocol.ingest_json)
+        self.assertIsNone(missing.ingest_json)
+        self.assertIsNone(new_specimen.ingest_json)
 
     def test_define_manifest(self):
         # expect:
@@ -97,8 +161,7 @@ class SubmissionTest(TestCase):
         self.assertEqual(url, ingest_api_args[0])
 
         # and:
-        raw_json = ingest_api_args[1]
-        submitted_json = json.loads(raw_json)
+        submitted_json = ingest_api_args[1]
         self.assertEqual(total_count, submitted_json['totalCount'])
         self.assertEqual(count_per_entity['biomaterial'], submitted_json['expectedBiomaterials'])
         self.assertEqual(count_per_entity['process'], submitted_json['expectedProcesses'])
@@ -165,8 +228,57 @@ def _create_spreadsheet_json():
     return spreadsheet_json
 
 
+class EntityTest(TestCase):
+
+    def test_direct_links(self):
+        # given:
+        entity = Entity('biomaterial', 'specimen', {}, direct_links=[{
+            'entity': 'biomaterial',
+            'id': 'donor',
+            'relationship': 'derivedFrom'
+        }])
+
+        # when:
+        entity.add_direct_link('process', 'process_1', ''.join(['inputTo', 'Processes']))
+
+        # then:
+        self.assertEqual([
+            DirectLink('biomaterial', 'donor', 'derivedFrom'),
+            DirectLink('process', 'process_1', 'inputToProcesses')
+        ], entity.direct_links)
+        self.assertIs('inputToProcesses', entity.direct_links[1].relationship)
+
+    def test_slots(self):
+        entity = Entity('biomaterial', 'donor', {})
+
+        with self.assertRaises(AttributeError):
+            entity.unknown_attribute = 'value'
+
+    def test_trim_ingest_json(self):
+        # given:
+        ingest_json = {
+            'content': {'key': 'value'},
+            'uuid': {'uuid': 'a-uuid'},
+            'validationState': 'Draft',
+            '_links': {'self': {'href': 'http://ingest/biomaterials/1'}}
+        }
+
+        # expect:
+        self.assertEqual({
+            'uuid': {'uuid': 'a-uuid'},
+            '_links': {'self': {'href': 'http://ingest/biomaterials/1'}}
+        }, trim_ingest_json(ingest_json))
+        self.assertIsNone(trim_ingest_json(None))
+
+
 class IngestSubmitterTest(TestCase):
 
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
     @patch('ingest.importer.submission.Submission')
     def test_submit(self, submission_constructor):
         # given:
@@ -186,7 +298,7 @@ class IngestSubmitterTest(TestCase):
         submitter.submit(entity_map, submission_url='url')
 
         # then:
-        submission_constructor.assert_called_with(ingest_api, 'url')
+        submission_constructor.assert_called_with(ingest_api, 'url', metrics=submitter.metrics)
         submission.define_manifest.assert_called_with(entity_map)
         submission.add_entity.assert_has_calls([call(product), call(user)], any_order=True)
 
@@ -217,16 +329,152 @@ class IngestSubmitterTest(TestCase):
         submitter.submit(entity_map, submission_url='url')
 
         # then:
-        submission_constructor.assert_called_with(ingest_api, 'url')
+        submission_constructor.assert_called_with(ingest_api, 'url', metrics=submitter.metrics)
         submission.define_manifest.assert_called_with(entity_map)
         submission.add_entity.assert_has_calls([call(user), call(linked_product)], any_order=True)
         submission.link_entity.assert_called_with(linked_product, user, relationship='wish_list')
 
+    @patch('ingest.importer.submission.Submission')
+    def test_submit_resumes_from_journal(self, submission_constructor):
+        # given:
+        ingest_api = MagicMock('ingest_api')
+        ingest_api.getSubmissionEnvelope = MagicMock()
+        submission = self._mock_submission(submission_constructor)
+
+        # and:
+        user = Entity('user', 'user_1', {})
+        link_to_user = {
+            'entity': 'user',
+            'id': 'user_1',
+            'relationship': 'wish_list'
+        }
+        linked_product = Entity('product', 'product_1', {}, direct_links=[link_to_user])
+        project = Entity('project', 'id', {})
+        entity_map = EntityMap(user, linked_product, project)
+
+        # and: user was created and the project linked in an earlier attempt
+        journal = MagicMock('journal')
+        journal.is_done = MagicMock(return_value=True)
+        journal.restore_entity = lambda entity: entity is user
+        journal.is_linked = lambda from_entity, to_entity, relationship: from_entity is project
+        journal.record_entity = MagicMock()
+        journal.record_link = MagicMock()
+
+        # when:
+        submitter = IngestSubmitter(ingest_api, journal=journal)
+        submitter.submit(entity_map, submission_url='url')
+
+        # then:
+        submission.define_manifest.assert_not_called()
+        submission.add_entity.assert_has_calls([call(linked_product), call(project)])
+        self.assertEqual(2, submission.add_entity.call_count)
+        journal.record_entity.assert_has_calls([call(linked_product), call(project)])
+
+        # and:
+        ingest_api.getSubmissionEnvelope.assert_not_called()
+        submission.link_entity.assert_called_once_with(linked_product, user, relationship='wish_list')
+        journal.record_link.assert_called_once_with(linked_product, user, 'wish_list')
+
+    @patch('ingest.importer.submission.Submission')
+    def test_submit_in_batches(self, submission_constructor):
+        # given:
+        ingest_api = MagicMock('ingest_api')
+        ingest_api.getSubmissionEnvelope = MagicMock()
+        submission = self._mock_submission(submission_constructor)
+
+        # and:
+        products = [Entity('product', f'product_{index}', {}) for index in range(3)]
+        project = Entity('project', 'id', {})
+        entity_map = EntityMap(*products, project)
+
+        # when:
+        submitter = IngestSubmitter(ingest_api, batch_size=2)
+        submitter.submit(entity_map, submission_url='url')
+
+        # then:
+        submission.add_entity.assert_not_called()
+        self.assertEqual(2, submission.add_entities.call_count)
+        submitted = [entity for args, _ in submission.add_entities.call_args_list for entity in args[0]]
+        self.assertCountEqual(products + [project], submitted)
+
+    @patch('ingest.importer.submission.Submission')
+    def test_submit_with_workers(self, submission_constructor):
+        # given:
+        ingest_api = MagicMock('ingest_api')
+        ingest_api.getSubmissionEnvelope = MagicMock(return_value={'submission': 'envelope'})
+        submission = self._mock_submission(submission_constructor)
+
+        # and:
+        user = Entity('user', 'user_1', {})
+        link_to_user = {
+            'entity': 'user',
+            'id': 'user_1',
+            'relationship': 'wish_list'
+        }
+        linked_product = Entity('product', 'product_1', {}, direct_links=[link_to_user])
+        project = Entity('project', 'id', {})
+        entity_map = EntityMap(user, linked_product, project)
+
+        # when:
+        submitter = IngestSubmitter(ingest_api, max_workers=4)
+        submitter.submit(entity_map, submission_url='url')
+
+        # then:
+        submission.add_entity.assert_has_calls([call(user), call(linked_product), call(project)], any_order=True)
+        submission.link_entity.assert_any_call(linked_product, user, relationship='wish_list')
+        self.assertEqual(2, submission.link_entity.call_count)
+        self.assertEqual(3, submitter.stage_metrics['create'].count)
+        self.assertEqual(2, submitter.stage_metrics['link'].count)
+
+    @patch('ingest.importer.submission.Submission')
+    def test_submit_incrementally(self, submission_constructor):
+        # given:
+        ingest_api = MagicMock('ingest_api')
+        ingest_api.getSubmissionEnvelope = MagicMock()
+        submission = self._mock_submission(submission_constructor)
+
+        # and: the spreadsheet submitted before
+        user = Entity('user', 'user_1', {'name': 'user'}, ingest_json={'_links': {}})
+        other_user = Entity('user', 'user_2', {'name': 'other user'}, ingest_json={'_links': {}})
+        product = Entity('product', 'product_1', {'name': 'product'}, ingest_json={'_links': {}})
+        journal = CheckpointJournal(os.path.join(self.directory, 'journal.jsonl'))
+        for entity in [user, other_user, product]:
+            journal.record_entity(entity)
+        journal.record_link(product, user, 'wish_list')
+
+        # and: the product is now on the wish list of the other user and its name has changed
+        user = Entity('user', 'user_1', {'name': 'user'})
+        other_user = Entity('user', 'user_2', {'name': 'other user'})
+        link_to_other_user = {
+            'entity': 'user',
+            'id': 'user_2',
+            'relationship': 'wish_list'
+        }
+        product = Entity('product', 'product_1', {'name': 'new name'}, direct_links=[link_to_other_user])
+        project = Entity('project', 'id', {})
+        entity_map = EntityMap(user, other_user, product, project)
+
+        # when:
+        submitter = IngestSubmitter(ingest_api, journal=journal, incremental=True)
+        submitter.submit(entity_map, submission_url='url')
+
+        # then:
+        submission.update_entity.assert_called_once_with(product)
+        submission.add_entity.assert_called_once_with(project)
+        submission.unlink_entity.assert_called_once_with(product, user, relationship='wish_list')
+        submission.link_entity.assert_any_call(product, other_user, relationship='wish_list')
+        self.assertFalse(journal.is_changed(product))
+        self.assertFalse(journal.is_linked(product, user, 'wish_list'))
+
     @staticmethod
     def _mock_submission(submission_constructor):
         submission = MagicMock('submission')
         submission.define_manifest = MagicMock()
         submission.add_entity = MagicMock()
+        submission.add_entities = MagicMock()
+        submission.resolve_references = MagicMock()
+        submission.update_entity = MagicMock()
+        submission.unlink_entity = MagicMock()
         submission.link_entity = MagicMock()
         submission_constructor.return_value = submission
         return submission
@@ -288,6 +536,44 @@ class EntityMapTest(TestCase):
         self.assertEqual(1, one_map.count_total())
         self.assertEqual(3, three_map.count_total())
 
+    def test_count_entities_of_type(self):
+        # given:
+        entity_map = EntityMap()
+        entity_map.add_entity(Entity('biomaterial', 'biomaterial_1', {}))
+        entity_map.add_entity(Entity('biomaterial', 'biomaterial_2', {}))
+        entity_map.add_entity(Entity('biomaterial', 'biomaterial_uuid', None, is_reference=True))
+
+        # and: replacing an entity does not change the count
+        entity_map.add_entity(Entity('biomaterial', 'biomaterial_2', {'updated': True}))
+
+        # expect:
+        self.assertEqual(3, entity_map.count_total())
+        self.assertEqual(2, entity_map.count_entities_of_type('biomaterial'))
+        self.assertEqual(1, entity_map.count_reference_entities_of_type('biomaterial'))
+        self.assertEqual(0, entity_map.count_entities_of_type('file'))
+
+        # and:
+        self.assertEqual(2, len(entity_map.get_new_entities_of_type('biomaterial')))
+        self.assertEqual(3, len(entity_map.get_entities_of_type('biomaterial')))
+        self.assertEqual(['biomaterial_1', 'biomaterial_2'],
+                         [entity.id for entity in entity_map.get_new_entities()])
+        self.assertEqual({'updated': True}, entity_map.get_entity('biomaterial', 'biomaterial_2').content)
+
+    def test_get_project(self):
+        # given:
+        entity_map = EntityMap(Entity('biomaterial', 'biomaterial_1', {}))
+
+        # expect:
+        self.assertIsNone(entity_map.get_project())
+
+        # when:
+        project = Entity('project', 'project_1', {})
+        entity_map.add_entity(project)
+        entity_map.add_entity(Entity('project', 'project_2', {}))
+
+        # then:
+        self.assertIs(project, entity_map.get_project())
+
 
 class EntityLinkerTest(TestCase):
 
@@ -442,10 +728,11 @@ class EntityLinkerTest(TestCase):
                 self.assertTrue(entity)
 
                 for link in expected_links:
-                    self.assertTrue(link in entity.direct_links, f'{json.dumps(link)} is not in direct links')
+                    self.assertTrue(DirectLink.of(link) in entity.direct_links, f'{json.dumps(link)} is not in direct links')
 
     def test_generate_direct_links_biomaterial_to_biomaterial_no_process(self):
         # given
+        process_id = generated_process_id(Entity('biomaterial', 'biomaterial_id_2', {}))
         spreadsheet_json = {
             'project': {
                 'dummy-project-id': {
@@ -506,7 +793,7 @@ class EntityLinkerTest(TestCase):
                         },
                         {
                             'entity': 'process',
-                            'id': 'process_id_1',
+                            'id': process_id,
                             'relationship': 'inputToProcesses'
                         }
                     ]
@@ -526,14 +813,14 @@ class EntityLinkerTest(TestCase):
                         },
                         {
                             'entity': 'process',
-                            'id': 'process_id_1',
+                            'id': process_id,
                             'relationship': 'derivedByProcesses'
                         }
                     ]
                 }
             },
             'process': {
-                'process_id_1': {
+                process_id: {
                     'content': {
                         'key': 'process_1'
                     },
@@ -582,6 +869,7 @@ class EntityLinkerTest(TestCase):
 
     def test_generate_direct_links_file_to_file_no_process(self):
         # given
+        process_id = generated_process_id(Entity('file', 'file_id_2', {}))
         spreadsheet_json = {
             'project': {
                 'dummy-project-id': {
@@ -636,7 +924,7 @@ class EntityLinkerTest(TestCase):
                     'direct_links': [
                         {
                             'entity': 'process',
-                            'id': 'process_id_1',
+                            'id': process_id,
                             'relationship': 'inputToProcesses'
                         }
                     ]
@@ -651,14 +939,14 @@ class EntityLinkerTest(TestCase):
                     'direct_links': [
                         {
                             'entity': 'process',
-                            'id': 'process_id_1',
+                            'id': process_id,
                             'relationship': 'derivedByProcesses'
                         }
                     ]
                 }
             },
             'process': {
-                'process_id_1': {
+                process_id: {
                     'content': {
                         'key': 'process_1'
                     },
@@ -990,11 +1278,15 @@ class EntityLinkerTest(TestCase):
         entities_dictionaries = EntityMap.load(spreadsheet_json)
         entity_linker = EntityLinker(self.mocked_template_manager)
 
-        with self.assertRaises(LinkedEntityNotFound) as context:
+        with self.assertRaises(InvalidSpreadsheetLinks) as context:
             entity_linker.process_links_from_spreadsheet(entities_dictionaries)
 
-        self.assertEqual('biomaterial', context.exception.entity)
-        self.assertEqual('biomaterial_id_1', context.exception.id)
+        # all 3 missing entities are reported
+        errors = context.exception.errors
+        self.assertEqual(3, len(errors))
+        self.assertTrue(all(isinstance(error, LinkedEntityNotFound) for error in errors))
+        self.assertEqual([('biomaterial', 'biomaterial_id_1'), ('protocol', 'protocol_id_1'),
+                          ('protocol', 'protocol_id_2')], [(error.entity, error.id) for error in errors])
 
     def test_generate_direct_links_invalid_spreadsheet_link(self):
         # given
@@ -1028,14 +1320,17 @@ class EntityLinkerTest(TestCase):
         entities_dictionaries = EntityMap.load(spreadsheet_json)
         entity_linker = EntityLinker(self.mocked_template_manager)
 
-        with self.assertRaises(InvalidLinkInSpreadsheet) as context:
+        with self.assertRaises(InvalidSpreadsheetLinks) as context:
             entity_linker.process_links_from_spreadsheet(entities_dictionaries)
 
-        self.assertEqual('biomaterial', context.exception.from_entity.type)
-        self.assertEqual('file', context.exception.link_entity_type)
+        self.assertEqual(1, len(context.exception.errors))
+        error = context.exception.errors[0]
+        self.assertIsInstance(error, InvalidLinkInSpreadsheet)
+        self.assertEqual('biomaterial', error.from_entity.type)
+        self.assertEqual('file', error.link_entity_type)
 
-        self.assertEqual('biomaterial_id_1', context.exception.from_entity.id)
-        self.assertEqual('file_id_1', context.exception.link_entity_id)
+        self.assertEqual('biomaterial_id_1', error.from_entity.id)
+        self.assertEqual('file_id_1', error.link_entity_id)
 
     def test_generate_direct_links_multiple_process_links(self):
         # given
@@ -1074,8 +1369,91 @@ class EntityLinkerTest(TestCase):
         entities_dictionaries = EntityMap.load(spreadsheet_json)
         entity_linker = EntityLinker(self.mocked_template_manager)
 
-        with self.assertRaises(MultipleProcessesFound) as context:
+        with self.assertRaises(InvalidSpreadsheetLinks) as context:
             entity_linker.process_links_from_spreadsheet(entities_dictionaries)
 
-        self.assertEqual('biomaterial', context.exception.from_entity.type)
-        self.assertEqual(['process_id_1', 'process_id_2'], context.exception.process_ids)
+        self.assertEqual(1, len(context.exception.errors))
+        error = context.exception.errors[0]
+        self.assertIsInstance(error, MultipleProcessesFound)
+        self.assertEqual('biomaterial', error.from_entity.type)
+        self.assertEqual(['process_id_1', 'process_id_2'], error.process_ids)
+
+    def test_generated_process_ids_do_not_depend_on_row_order(self):
+        # given
+        def spreadsheet_json(biomaterial_ids):
+            biomaterials = {'biomaterial_id_0': {'content': {'key': 'biomaterial_0'}}}
+            for biomaterial_id in biomaterial_ids:
+                biomaterials[biomaterial_id] = {
+                    'content': {'key': biomaterial_id},
+                    'links_by_entity': {'biomaterial': ['biomaterial_id_0']}
+                }
+            return {
+                'project': {'dummy-project-id': {'content': {'key': 'project_1'}}},
+                'biomaterial': biomaterials
+            }
+
+        def process_ids(biomaterial_ids):
+            entity_map = EntityMap.load(spreadsheet_json(biomaterial_ids))
+            output = EntityLinker(self.mocked_template_manager).process_links_from_spreadsheet(entity_map)
+            return {biomaterial_id: output.get_entity('biomaterial', biomaterial_id).direct_links[-1].id
+                    for biomaterial_id in biomaterial_ids}
+
+        # when
+        original = process_ids(['biomaterial_id_1', 'biomaterial_id_2'])
+        reordered = process_ids(['biomaterial_id_3', 'biomaterial_id_2', 'biomaterial_id_1'])
+
+        # then
+        self.assertNotEqual(original['biomaterial_id_1'], original['biomaterial_id_2'])
+        self.assertEqual(original['biomaterial_id_1'], reordered['biomaterial_id_1'])
+        self.assertEqual(original['biomaterial_id_2'], reordered['biomaterial_id_2'])
+
+    def test_generated_process_ids_do_not_depend_on_inputs(self):
+        # given
+        def process_id(input_id):
+            entity_map = EntityMap.load({
+                'project': {'dummy-project-id': {'content': {'key': 'project_1'}}},
+                'biomaterial': {
+                    'biomaterial_id_0': {'content': {'key': 'biomaterial_0'}},
+                    'biomaterial_id_1': {'content': {'key': 'biomaterial_1'}},
+                    'biomaterial_id_2': {
+                        'content': {'key': 'biomaterial_2'},
+                        'links_by_entity': {'biomaterial': [input_id]}
+                    }
+                }
+            })
+            output = EntityLinker(self.mocked_template_manager).process_links_from_spreadsheet(entity_map)
+            return output.get_entity('biomaterial', 'biomaterial_id_2').direct_links[-1].id
+
+        # expect
+        self.assertEqual(process_id('biomaterial_id_0'), process_id('biomaterial_id_1'))
+
+    def test_generate_direct_links_empty_process_links(self):
+        # given
+        spreadsheet_json = {
+            'project': {
+                'dummy-project-id': {
+                    'content': {
+                        'key': 'project_1'
+                    }
+                }
+            },
+            'biomaterial': {
+                'biomaterial_id_1': {
+                    'content': {
+                        'key': 'biomaterial_1'
+                    },
+                    'links_by_entity': {
+                        'process': []
+                    }
+                }
+            }
+        }
+
+        entities_dictionaries = EntityMap.load(spreadsheet_json)
+        entity_linker = EntityLinker(self.mocked_template_manager)
+
+        # when
+        output = entity_linker.process_links_from_spreadsheet(entities_dictionaries)
+
+        # then
+        self.assertEqual(['biomaterial_id_1'], [entity.id for entity in output.get_entities_of_type('biomaterial')])
@@ -156,6 +156,27 @@ class TestSchemaTemplate(TestCase):
 
         self.assertEqual("biomaterial", template.lookup("project.foo_bar.schema.domain_entity"))
 
+    def test_lookup_matches_nested_properties(self):
+        data = '{"id" : "' + self.dummyProjectUri + '", "properties": { "foo_bar": {"type" : "object", "properties": {"bar": {"type" : "integer"}}} } }'
+        template = schema_mock.get_template_for_json(data=data)
+
+        index = template._parser.build_property_index()
+        self.assertIn("project.foo_bar.bar.value_type", index)
+        for key, value in index.items():
+            self.assertIs(template.get(template.get_template(), key), template.lookup(key))
+
+        with self.assertRaises(UnknownKeyException):
+            template.lookup(None)
+
+    def test_lookup_after_put(self):
+        data = '{"id" : "' + self.dummyProjectUri + '", "properties": {"foo": "bar"} }'
+        template = schema_mock.get_template_for_json(data=data)
+        with self.assertRaises(UnknownKeyException):
+            template.lookup('contact.name')
+
+        template.put('contact', {'name': {'value_type': 'string'}})
+        self.assertEqual('string', template.lookup('contact.name.value_type'))
+
     def test_get_domain_entity_from_url(self):
         schema_parser = SchemaParser(None)
         url = "https://schema.humancellatlas.org/type/project/5.1.0/project"
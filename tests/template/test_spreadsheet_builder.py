@@ -6,6 +6,9 @@ __author__ = "jupp"
 __license__ = "Apache 2.0"
 __date__ = "25/05/2018"
 
+import os
+import shutil
+import tempfile
 from unittest import TestCase
 from ingest.template.spreadsheet_builder import SpreadsheetBuilder
 import unittest
@@ -19,19 +22,20 @@ class TestSchemaTemplate(TestCase):
         self.longMessage = True
         self.dummyProjectUri = "https://schema.humancellatlas.org/type/project/5.1.0/project"
         self.dummyDonorUri = "https://schema.humancellatlas.org/type/biomaterial/5.1.0/donor_organism"
-        pass
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
 
 
     def test_no_schemas(self):
         data = '{"id" : "' + self.dummyDonorUri + '", "properties": {"foo_bar": {"user_friendly" : "Foo bar", "description" : "this is a foo bar", "example" : "e.g. foo"}} }'
 
-        file = "foo.xlsx"
+        file = os.path.join(self.directory, "foo.xlsx")
         spreadsheet_builder = SpreadsheetBuilder(file)
         template = schema_mock.get_template_for_json(data=data)
         spreadsheet_builder._build(template)
         spreadsheet_builder.save_workbook()
 
-        reader = Reader("foo.xlsx")
+        reader = Reader(file)
         sheet = reader["Donor organism"]
 
         self.assertEqual("this is a foo bar", sheet.cell(row=1, column=1).value)
@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+from unittest import TestCase, skipIf
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# dependencies that must only be imported when the feature that needs them is used
+LAZY_DEPENDENCIES = ['hca', 'openpyxl', 'yaml', 'jsonref', 'polling', 'asyncio', 'google.oauth2']
+
+# generous bound on the cumulative import time of a module, to catch a heavy import creeping back in
+IMPORT_TIME_BUDGET_SECONDS = float(os.environ.get('INGEST_IMPORT_TIME_BUDGET', '2.0'))
+
+
+def import_times(module):
+    """
+    Imports the module in a fresh interpreter with -X importtime and returns the cumulative import time
+    in microseconds of every module that was imported, by module name.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=BASE_DIR,
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        __, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@skipIf(sys.version_info < (3, 7), '-X importtime needs Python 3.7 or later')
+class ImportTimeTest(TestCase):
+
+    def _assert_imports_lazily(self, module):
+        times = import_times(module)
+        self.assertIn(module, times, f'no import times were reported for {module}, is -X importtime supported?')
+        eagerly_imported = [dependency for dependency in LAZY_DEPENDENCIES if dependency in times]
+        self.assertEqual([], eagerly_imported, f'{module} imports {eagerly_imported} eagerly')
+        self.assertLess(times[module] / 1e6, IMPORT_TIME_BUDGET_SECONDS)
+
+    def test_exporter(self):
+        self._assert_imports_lazily('ingest.exporter.ingestexportservice')
+
+    def test_importer(self):
+        self._assert_imports_lazily('ingest.importer.importer')
+
+    def test_schema_template(self):
+        self._assert_imports_lazily('ingest.template.schema_template')
+
+    def test_api_clients(self):
+        self._assert_imports_lazily('ingest.api.clients')
@@ -0,0 +1,115 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import MagicMock
+
+from ingest.utils.metrics import Metrics, CallbackSink, PrometheusTextFileSink, LoggingSink, PROGRESS_EVENT
+
+
+class MetricsTest(TestCase):
+
+    def test_count(self):
+        # given:
+        metrics = Metrics()
+
+        # when:
+        metrics.increment('entities_created', entity_type='biomaterial')
+        metrics.increment('entities_created', 2, entity_type='file')
+        metrics.increment('links_created')
+
+        # then:
+        self.assertEqual(3, metrics.count('entities_created'))
+        self.assertEqual(1, metrics.count('links_created'))
+        self.assertEqual(0, metrics.count('entities_updated'))
+
+    def test_time_request(self):
+        # given:
+        metrics = Metrics()
+
+        # when:
+        with metrics.time_request('createEntity'):
+            pass
+
+        with self.assertRaises(ValueError):
+            with metrics.time_request('createEntity'):
+                raise ValueError()
+
+        # then:
+        histogram = metrics.histograms[('http_request_seconds', (('endpoint', 'createEntity'),))]
+        self.assertEqual(2, histogram.count)
+        self.assertEqual(1, metrics.count('http_request_errors'))
+        self.assertEqual(0, metrics.gauges[('http_requests_in_flight', ())])
+
+    def test_report_progress(self):
+        # given:
+        events = []
+        metrics = Metrics(sinks=[CallbackSink(lambda event, fields: events.append((event, fields)))],
+                          progress_interval=3600)
+        metrics.expect('entities_created', 4)
+        metrics.expect('links_created', 4)
+
+        # when:
+        metrics.increment('entities_created', 4)
+        metrics.report_progress()
+        metrics.report_progress()
+
+        # then: the second report is within the interval of the first
+        self.assertEqual(1, len(events))
+        event, fields = events[0]
+        self.assertEqual(PROGRESS_EVENT, event)
+        self.assertEqual(4, fields['entities_created'])
+        self.assertEqual(0, fields['links_created'])
+        self.assertAlmostEqual(fields['elapsed_seconds'], fields['eta_seconds'], delta=0.01)
+
+        # when:
+        metrics.report_progress(force=True)
+
+        # then:
+        self.assertEqual(2, len(events))
+
+    def test_logging_sink(self):
+        # given:
+        logger = MagicMock()
+        metrics = Metrics(sinks=[LoggingSink(logger=logger)])
+        metrics.increment('links_created')
+
+        # when:
+        metrics.emit('started', submission='url')
+        metrics.flush()
+
+        # then:
+        self.assertEqual(2, logger.log.call_count)
+
+
+class PrometheusTextFileSinkTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_flush(self):
+        # given:
+        path = os.path.join(self.directory, 'ingest.prom')
+        metrics = Metrics(sinks=[PrometheusTextFileSink(path)])
+        metrics.increment('entities_created', 3, entity_type='biomaterial')
+        metrics.observe('http_request_seconds', 0.02, endpoint='createEntity')
+        metrics.observe('http_request_seconds', 0.3, endpoint='createEntity')
+
+        # when:
+        metrics.flush()
+
+        # then:
+        with open(path) as text_file:
+            lines = text_file.read().splitlines()
+
+        self.assertIn('# TYPE ingest_entities_created_total counter', lines)
+        self.assertIn('ingest_entities_created_total{entity_type="biomaterial"} 3', lines)
+        self.assertIn('# TYPE ingest_http_request_seconds histogram', lines)
+        self.assertIn('ingest_http_request_seconds_bucket{endpoint="createEntity",le="0.025"} 1', lines)
+        self.assertIn('ingest_http_request_seconds_bucket{endpoint="createEntity",le="0.5"} 2', lines)
+        self.assertIn('ingest_http_request_seconds_bucket{endpoint="createEntity",le="+Inf"} 2', lines)
+        self.assertIn('ingest_http_request_seconds_count{endpoint="createEntity"} 2', lines)
@@ -0,0 +1,46 @@
+import json
+from unittest import TestCase
+
+from ingest.utils import serialization
+
+
+class SerializationTest(TestCase):
+
+    def setUp(self):
+        self.default_backend = serialization.backend
+
+    def tearDown(self):
+        serialization.set_backend(self.default_backend)
+
+    def test_dumps(self):
+        # given:
+        document = {'name': 'Zoë', 'url': 'https://schema.humancellatlas.org/type', 'values': [1, 2.5, None, True]}
+
+        # expect:
+        for backend in [serialization.STDLIB_BACKEND, serialization.ORJSON_BACKEND, serialization.UJSON_BACKEND]:
+            try:
+                serialization.set_backend(backend)
+            except ValueError:
+                continue
+            self.assertEqual(document, json.loads(serialization.dumps(document)))
+
+    def test_dumps_falls_back_to_stdlib(self):
+        # given:
+        document = {'big_number': 2 ** 70}
+
+        # expect:
+        self.assertEqual(document, json.loads(serialization.dumps(document)))
+
+    def test_set_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            serialization.set_backend('pickle')
+
+    def test_to_payload(self):
+        self.assertEqual('{"a": 1}', serialization.to_payload('{"a": 1}'))
+        self.assertEqual({'a': 1}, json.loads(serialization.to_payload({'a': 1})))
+
+    def test_to_dict(self):
+        self.assertEqual({'a': 1}, serialization.to_dict('{"a": 1}'))
+
+        document = {'a': 1}
+        self.assertIs(document, serialization.to_dict(document))